@@ -2,11 +2,41 @@
 This module contains the main entry point
 """
 
+import argparse
+
 import src.overseer as overwatch
+import src.preferences_handler as ph
+import src.location_handler as lh
+import src.driver_backend as db
+from src.trace_capture import TraceSettings
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Recreation.gov reservation bot")
+    parser.add_argument("--trace", nargs="*", metavar="LOCATION",
+                        help="capture DevTools traces of the poll loop, for the locations containing "
+                             "any of the given text or every location if none is given")
+    parser.add_argument("--trace-dir", default="traces", help="where the traces and summaries are written")
+    parser.add_argument("--trace-every", type=int, default=10, help="trace one out of every N iterations")
+    parser.add_argument("--trace-max", type=int, default=20, help="traced iterations per location")
+    parser.add_argument("--tenant", action="append", metavar="PREFS",
+                        help="preferences file of another user, every user's identical locations are polled once")
+    return parser.parse_args()
 
 
 def main():
-    overseer = overwatch.Overseer()
+    arguments = parse_arguments()
+    trace = None
+    if arguments.trace is not None:
+        trace = TraceSettings(arguments.trace, arguments.trace_dir, arguments.trace_every, arguments.trace_max)
+
+    try:
+        overseer = overwatch.Overseer(trace=trace, tenants=arguments.tenant)
+    except (ph.NoTimeOrRefreshCountProvidedException, lh.NoLocationsFileException, lh.NoLocationsException,
+            db.NoDriverHubsException) as e:
+        # Stopped before anything was started
+        print("Preflight: " + str(e))
+        exit(1)
     overseer.start()
 
 if __name__ == '__main__':
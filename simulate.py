@@ -0,0 +1,33 @@
+"""
+This module contains the scale simulator entry point
+"""
+
+import argparse
+
+from src.scale_simulator import SimulationSettings, ScaleSimulator
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Runs the bot against synthetic locations on a local fixture site")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="numbers of locations to simulate, one run each")
+    parser.add_argument("--duration", type=int, default=120, help="measured seconds of polling per run")
+    parser.add_argument("--setup", type=int, default=60,
+                        help="most seconds to wait for every location to reach its availability grid")
+    parser.add_argument("--inject-every", type=int, default=10, help="seconds between injected openings")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="preferences.txt setting for the simulated runs, e.g. tabs_per_browser=4")
+    parser.add_argument("--label", default="default", help="name of this configuration in the results")
+    parser.add_argument("--dir", default="simulations", help="where the inputs and results are written")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    overrides = dict(setting.split("=", 1) for setting in arguments.set)
+    settings = SimulationSettings(arguments.sizes, arguments.duration, arguments.setup, arguments.inject_every,
+                                  overrides, arguments.label, arguments.dir)
+    ScaleSimulator(settings).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+This module provides the burst mode. burst_drivers puts several drivers on one high value
+location and offsets their polls, member m of K polls m/K of a cycle after the first, so
+together they sample the grid K times as often. The first member to reach the book button
+claims it, the others skip it and stand down once it books.
+
+    python3 -m src.burst --members 1 2 3
+
+measures the detection latency for each group size on the local fixture site.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+from collections import namedtuple
+from datetime import datetime
+from math import floor
+from os import makedirs, path
+from time import monotonic
+
+import src.preferences_handler as ph
+
+# One driver of a burst group, passed to its worker next to the location
+BurstMember = namedtuple("BurstMember", ["group", "index", "size"])
+
+# Slack on the measured cycle, a member whose iteration runs a little long still makes its next slot
+CYCLE_SLACK = 1.1
+# Weight of the newest iteration in the shared cycle estimate
+CYCLE_ALPHA = 0.2
+# Seconds a claim holds, a member that died while booking does not block the others for good
+CLAIM_SECONDS = 60
+
+# Columns of a group: first poll, cycle estimate, claiming member + 1, claimed at, booked, polls
+_FIRST, _CYCLE, _CLAIM, _CLAIMED, _BOOKED, _POLLS = range(6)
+_COLUMNS = 6
+
+# The burst groups of this process, installed by the pool initializer
+_groups = None
+
+
+class BurstGroups:
+    """ This class holds the phase and the booking claim of every burst group in shared memory. """
+
+    def __init__(self, groups):
+        """
+        __init__ - constructor, created in the overseer before the pool so the workers inherit the shared memory
+        :param groups: list of (formatted location string, members) of each group
+        """
+        self._groups = list(groups)
+        self._lock = mp.Lock()
+        # monotonic is system wide so the members agree on the phase
+        self._state = mp.RawArray('d', len(groups) * _COLUMNS)
+
+    def _row(self, member):
+        return member.group * _COLUMNS
+
+    def delay(self, member, last_poll):
+        """
+        delay - seconds until the member's next slot, its slots are a cycle apart and
+        offset by index / size of a cycle from the first member's
+        :param member: the BurstMember
+        :param last_poll: monotonic() at the start of the member's last iteration, None before the first
+        :return: float: 0 when the member is due, or before the group has measured its cycle
+        """
+        row = self._row(member)
+        with self._lock:
+            first = self._state[row + _FIRST]
+            cycle = self._state[row + _CYCLE]
+        if cycle <= 0 or last_poll is None:
+            return 0.0
+
+        period = cycle * CYCLE_SLACK
+        offset = first + period * member.index / member.size
+        now = monotonic()
+        if now < offset:
+            return offset - now
+        latest = offset + floor((now - offset) / period) * period
+        # A member that has not polled since its latest slot is late and goes straight away
+        if last_poll < latest:
+            return 0.0
+        return latest + period - now
+
+    def record(self, member, started, elapsed):
+        """
+        record - adds a poll iteration of a member to the group's cycle estimate
+        :param member: the BurstMember
+        :param started: monotonic() at the start of the iteration
+        :param elapsed: seconds the iteration took
+        :return: None
+        """
+        row = self._row(member)
+        with self._lock:
+            if self._state[row + _FIRST] == 0:
+                self._state[row + _FIRST] = started
+            if self._state[row + _CYCLE] == 0:
+                self._state[row + _CYCLE] = elapsed
+            else:
+                self._state[row + _CYCLE] += CYCLE_ALPHA * (elapsed - self._state[row + _CYCLE])
+            self._state[row + _POLLS] += 1
+
+    def claim(self, member):
+        """
+        claim - claims the booking for a member about to click the book button
+        :param member: the BurstMember
+        :return: bool: True if the member may book, False if another member is booking or booked
+        """
+        row = self._row(member)
+        with self._lock:
+            holder = int(self._state[row + _CLAIM]) - 1
+            if self._state[row + _BOOKED] > 0:
+                return holder == member.index
+            if holder not in (-1, member.index) and monotonic() - self._state[row + _CLAIMED] < CLAIM_SECONDS:
+                return False
+            self._state[row + _CLAIM] = member.index + 1
+            self._state[row + _CLAIMED] = monotonic()
+            return True
+
+    def release(self, member):
+        """
+        release - gives up the claim of a member that did not reach checkout, e.g. found while not logged in
+        :param member: the BurstMember
+        :return: None
+        """
+        row = self._row(member)
+        with self._lock:
+            if int(self._state[row + _CLAIM]) - 1 == member.index and self._state[row + _BOOKED] == 0:
+                self._state[row + _CLAIM] = 0
+
+    def booked(self, member):
+        """
+        booked - marks the group booked by a member, the others stand down
+        :param member: the BurstMember
+        :return: None
+        """
+        row = self._row(member)
+        with self._lock:
+            self._state[row + _CLAIM] = member.index + 1
+            self._state[row + _BOOKED] = 1
+
+    def winner(self, member):
+        """
+        winner - the other member that booked the group
+        :param member: the BurstMember
+        :return: int: its index, None if no other member booked
+        """
+        row = self._row(member)
+        with self._lock:
+            holder = int(self._state[row + _CLAIM]) - 1
+            if self._state[row + _BOOKED] > 0 and holder != member.index:
+                return holder
+        return None
+
+    def report(self):
+        """
+        report - polls and sampling interval of each group
+        :return: list: (location, members, polls, cycle seconds, seconds between the group's polls, booked by)
+        """
+        with self._lock:
+            reports = list()
+            for group, (location_str, size) in enumerate(self._groups):
+                row = group * _COLUMNS
+                cycle = self._state[row + _CYCLE] * CYCLE_SLACK
+                booked_by = int(self._state[row + _CLAIM]) - 1 if self._state[row + _BOOKED] > 0 else None
+                reports.append((location_str, size, int(self._state[row + _POLLS]), cycle, cycle / size, booked_by))
+            return reports
+
+
+def expand(work, burst_drivers, format_location):
+    """
+    expand - repeats every work item a burst group polls once per member
+    :param work: the planned work items, one per driver
+    :param burst_drivers: list of (name, drivers), a location containing name gets that many
+    :param format_location: formats the location of a work item for the name match
+    :return: (work items, BurstMember or None for each, BurstGroups or None without groups)
+    """
+    expanded = list()
+    members = list()
+    groups = list()
+    for item in work:
+        location_str = format_location(item[0])
+        size = ph.named_setting(location_str, burst_drivers, 1)
+        if size < 2:
+            expanded.append(item)
+            members.append(None)
+            continue
+        for index in range(size):
+            expanded.append(item)
+            members.append(BurstMember(len(groups), index, size))
+        groups.append((location_str, size))
+    return expanded, members, BurstGroups(groups) if len(groups) > 0 else None
+
+
+def member_label(location_str, member):
+    """
+    member_label - names one member of a burst group, in its messages and in the request budget
+    :param location_str: the formatted location string
+    :param member: the BurstMember, None outside a burst group
+    :return: str: the label
+    """
+    if member is None:
+        return location_str
+    return location_str + " [burst " + str(member.index + 1) + "/" + str(member.size) + "]"
+
+
+def install(groups):
+    """
+    install - sets the burst groups of this process, called by the pool initializer
+    :param groups: the BurstGroups, None without burst groups
+    :return: None
+    """
+    global _groups
+    _groups = groups
+
+
+def get_groups():
+    return _groups
+
+
+def measure(members, duration, setup, inject_every, directory):
+    """
+    measure - runs one simulated campground with each group size and compares the detection latency
+    :param members: list of group sizes, 1 is the single driver baseline
+    :param duration: measured seconds of polling per size
+    :param setup: most seconds to wait for the drivers to reach the grid
+    :param inject_every: seconds between injected openings
+    :param directory: where the inputs and results are written
+    :return: str: path to the summary file
+    """
+    # Imported here so the workers do not load the fixture site
+    from src.scale_simulator import SimulationSettings, ScaleSimulator
+
+    rows = list()
+    for size in members:
+        settings = SimulationSettings([1], duration, setup, inject_every, {"burst_drivers": "Sim Camp=" + str(size)},
+                                      "burst_" + str(size), directory)
+        with open(ScaleSimulator(settings).run()) as results_file:
+            result = json.load(results_file)["results"][0]
+        rows.append({"members": size, "polls_per_second": result["polls_per_second_per_location"],
+                     "openings": result["openings"], "detected": result["detected"],
+                     "detect_seconds_mean": result["detect_seconds_mean"],
+                     "detect_seconds_max": result["detect_seconds_max"]})
+
+    print("members  polls/s  detected  mean s  max s")
+    for row in rows:
+        print("%7d  %7.2f  %4d/%-4d  %6s  %5s" % (row["members"], row["polls_per_second"], row["detected"],
+                                                   row["openings"], row["detect_seconds_mean"],
+                                                   row["detect_seconds_max"]))
+    makedirs(directory, exist_ok=True)
+    summary_file = path.join(directory, "burst_" + datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    with open(summary_file, "w") as summary:
+        json.dump({"duration": duration, "inject_every": inject_every, "results": rows}, summary, indent=2)
+    print("Results written to " + summary_file)
+    return summary_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the detection latency of burst groups on the fixture site")
+    parser.add_argument("--members", type=int, nargs="+", default=[1, 2, 3], help="group sizes, one run each")
+    parser.add_argument("--duration", type=int, default=120, help="measured seconds of polling per size")
+    parser.add_argument("--setup", type=int, default=60, help="most seconds to wait for the drivers to reach the grid")
+    parser.add_argument("--inject-every", type=int, default=10, help="seconds between injected openings")
+    parser.add_argument("--dir", default="simulations", help="where the inputs and results are written")
+    arguments = parser.parse_args()
+    measure(arguments.members, arguments.duration, arguments.setup, arguments.inject_every, arguments.dir)
+
+if __name__ == '__main__':
+    main()
@@ -2,38 +2,42 @@
 This module provides the flow for campsite reservations.
 """
 
-from traceback import print_exc
-from time import sleep
+from time import monotonic
 from re import sub
-from datetime import datetime, date, time
+from traceback import format_exc
+from datetime import date
 from datetime import timedelta
 from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
 
-from src.recgov import RecGov
+from src.recgov import RecGov, EndOfTriesException
 from src.date_handler import DateHandler
-
-
-class EndOfTriesException(Exception):
-    pass
+from src.url_builder import UrlBuilder
+from src.flow_runner import WorkerStalledException
+from src.grid_sweep import GridSweep
+import src.wait_strategy as ws
+import src.locators as lc
 
 
 class CampRecGov(RecGov):
     """ This class provides the functionality for campsite reservations. """
 
-    def __init__(self, driver, preferences, camping_location):
+    def __init__(self, driver, preferences, camping_location, camping_details=None):
         """
         __init__ - constructor
         :param driver: the chrome driver for this object
         :param preferences: the preferences to be used during execution
         :param camping_location: string location for this browser
+        :param camping_details: the dates and filters, defaults to the camping locations file details
         """
         super(CampRecGov, self).__init__(driver, preferences, camping_location)
-        self._camping_details = preferences.camping_details
+        self._camping_details = camping_details if camping_details is not None else preferences.camping_details
+        self._campsite = None
+        self._result = 0
+        # Set when the location is the whole campground, site *, instead of one site
+        self._sweep = GridSweep(driver, self._waits, self.throttle) if camping_location.endswith(":*") else None
 
     def execute(self):
         """
@@ -41,69 +45,139 @@ class CampRecGov(RecGov):
         :return: bool: True if successfully in checkout, False otherwise
         """
         try:
-            super(CampRecGov, self).navigate_site()
-            super(CampRecGov, self).log_into_account()
-            self._navigate_camping_heading()
-            self._load_camping_link()
-            self._handle_campground_page()
-            self._scheduling_details()
-            self._poll()
+            super(CampRecGov, self).run_steps(super(CampRecGov, self).flow_steps())
             # unreachable unless successfully booking
             # detaches browser on successful selection of campsite
             return True
         except EndOfTriesException as e:
-            print(e)
+            self._events.info(None, str(e))
+        except WorkerStalledException:
+            # The overseer restarts the browser and runs the flow again
+            raise
         except Exception:
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location), "execute() failed")
 
         return False
 
-    def _poll(self):
+    def locate(self):
         """
-        _poll - polls the availability page
+        locate - opens the campground page, straight from the link found earlier when resuming
         :return: None
         """
-        retries = 0
-
-        start_datetime, end_datetime, start_date, end_date, campsite = self._select_campsite()
-        super(CampRecGov, self).wait()
-        result = 0
-
-        if self._time_end:
-            current_time = datetime.now().time()
-            while current_time < self._time_end:
-                self._refresh_availability_table()
-                if result == 2:
-                    start_datetime, end_datetime, start_date, end_date, campsite = \
-                        self._select_campsite()
-                result = self._handle_availability(start_datetime, end_datetime,
-                                                   start_date, end_date, campsite,
-                                                   retries + 1)
-                if result == 1:
-                    return True
-                retries += 1
-                current_time = datetime.now().time()
+        if not super(CampRecGov, self).resume_location(UrlBuilder.campground_query(self._camping_details)):
+            self._navigate_camping_heading()
+            self._load_camping_link()
+        self._handle_campground_page()
+
+    def configure(self):
+        """
+        configure - sets the dates and filters and selects the campsite
+        :return: None
+        """
+        self._scheduling_details()
+        self._campsite = self._select_campsite()
+        self._result = 0
+
+    def poll_once(self, iteration):
+        """
+        poll_once - refreshes and evaluates the availability grid once
+        :param iteration: the current refresh try
+        :return: int: 1 if in checkout, 2 if the campsite needs to be reselected, 0 otherwise
+        """
+        iteration_start = monotonic()
+        traced = super(CampRecGov, self).begin_trace(iteration)
+        engine = super(CampRecGov, self).cdp_engine()
+        if self._sweep is not None:
+            self._result = self._poll_sweep(iteration)
+        elif engine is not None and self._result != 2:
+            self._result = self._poll_fast(engine, iteration)
         else:
-            while retries < self._num_refreshes:
-                self._refresh_availability_table()
-                if result == 2:
-                    start_datetime, end_datetime, start_date, end_date, campsite = \
-                        self._select_campsite()
-                result = self._handle_availability(start_datetime, end_datetime,
-                                                   start_date, end_date, campsite,
-                                                   retries + 1)
-                if result == 1:
-                    return True
-                retries += 1
-
-        except_str = RecGov.format_location_string(self._location) \
-                     + ": driver stopping, tried " + \
-                     str(retries) + " times"
-        if self._time_end:
-            except_str += ", reached timeout " + str(self._time_end)
-
-        # Unable to successfully book permits
-        raise EndOfTriesException(except_str)
+            self._refresh_availability_table()
+            if self._result == 2:
+                self._campsite = self._select_campsite()
+            start_datetime, end_datetime, start_date, end_date, campsite = self._campsite
+            self._result = self._handle_availability(start_datetime, end_datetime,
+                                                     start_date, end_date, campsite,
+                                                     iteration)
+        super(CampRecGov, self).end_trace(iteration, traced)
+        self._events.poll(RecGov.format_location_string(self._location),
+                          "#" + str(iteration) + " result " + str(self._result))
+        super(CampRecGov, self).record_iteration(iteration, iteration_start)
+
+        return self._result
+
+    def _poll_fast(self, engine, iteration):
+        """
+        _poll_fast - refreshes and reads the grid over DevTools, Selenium only takes over
+        to select and book when the grid shows one of the dates
+        :param engine: the CdpEngine of this tab
+        :param iteration: the current refresh try
+        :return: int: 1 if in checkout, 2 if the campsite needs to be reselected, 0 otherwise
+        """
+        start_datetime, end_datetime, start_date, end_date, campsite = self._campsite
+        try:
+            super(CampRecGov, self).throttle()
+            engine.mark()
+            if not engine.click(self._lookup.locators.script("refresh_table", "button")):
+                raise ValueError("Refresh Table not found")
+            engine.wait_network_idle(self._wait_ceiling)
+            # Let the grid render the response before reading it
+            found = engine.evaluate(
+                "var dates = arguments;"
+                "return new Promise(function (resolve) { requestAnimationFrame(function () { setTimeout(function () {"
+                "  var labels = Array.prototype.map.call("
+                "    document.querySelectorAll('.available .rec-availability-date'),"
+                "    function (button) { return (button.getAttribute('aria-label') || '').toLowerCase(); });"
+                "  resolve(labels.some(function (label) {"
+                "    return label.indexOf(dates[0]) !== -1 || label.indexOf(dates[1]) !== -1; }));"
+                "}, 0); }); });", start_date, end_date, await_promise=True)
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._poll_fast() failed, polling through Selenium")
+            super(CampRecGov, self).set_cdp_enabled(False)
+            return 2
+
+        super(CampRecGov, self).decide("DevTools grid read: " + ("a date shows" if found else "neither date shows"))
+        if not found:
+            return 0
+        return self._handle_availability(start_datetime, end_datetime, start_date, end_date, campsite, iteration)
+
+    def _poll_sweep(self, iteration):
+        """
+        _poll_sweep - refreshes the grid and reads every site page and date window of the stay,
+        the sites open for the whole stay are then filtered to one at a time and booked
+        :param iteration: the current refresh try
+        :return: int: 1 if in checkout, 2 if the grid needs to be set up again, 0 otherwise
+        """
+        start_datetime, end_datetime, start_date, end_date, campsite = self._campsite
+        if self._result == 2:
+            self._campsite = self._select_campsite()
+        self._refresh_availability_table()
+        self._waits.until("CampRecGov._poll_sweep()", ws.network_settled())
+        try:
+            view = self._sweep.sweep(start_datetime, end_datetime)
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location), "CampRecGov._poll_sweep() failed")
+            return 2
+
+        open_sites = view.open_sites(start_datetime, end_datetime)
+        super(CampRecGov, self).decide("sweep of " + str(view.pages) + " page(s) found " + str(len(open_sites))
+                                       + " site(s) open for the stay: " + ", ".join(open_sites[:20]))
+        self._events.timing(RecGov.format_location_string(self._location),
+                            "grid sweep: " + str(len(view.sites)) + " site(s) on " + str(view.pages)
+                            + " page(s) in " + "%.2f" % view.seconds + "s, " + str(len(open_sites)) + " open")
+        for site in open_sites:
+            self._elements.act(By.ID, "campsite-filter-search",
+                               lambda site_search_element: self._interactions.set_value(
+                                   "campsite search", site_search_element, site))
+            self._sweep.focus(start_datetime)
+            if self._handle_availability(start_datetime, end_datetime, start_date, end_date, site, iteration) == 1:
+                return 1
+
+        if len(open_sites) > 0:
+            # Back to the whole grid for the next sweep
+            self._select_campsite()
+        return 0
 
     def _navigate_camping_heading(self):
         """
@@ -118,20 +192,18 @@ class CampRecGov(RecGov):
         :return: None
         """
         try:
-            search_bar = self._driver.find_element_by_xpath(
-                "//input[contains(@placeholder, 'Where to')]"
-            )
+            search_bar = self._lookup.must(lc.NAMED, "search_input", self._long_delay)
             search_bar.send_keys(self._location.split(":")[1])
             search_bar.send_keys(Keys.RETURN)
             super(CampRecGov, self).navigate_location_link(
                 self._location.split(":")[1],
-                "/camping/campgrounds/"
+                "/camping/campgrounds/",
+                query=UrlBuilder.campground_query(self._camping_details)
             )
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location)
-                  + ": CampRecGov._load_camping_link() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._load_camping_link() failed")
             raise e
 
     def _handle_campground_page(self):
@@ -141,22 +213,24 @@ class CampRecGov(RecGov):
         """
         try:
             # Close the dialog that appears if it appears
-            WebDriverWait(self._driver, self._wait_duration).until(ec.element_to_be_clickable(
-                (By.XPATH, "//button[@aria-label='Close modal']"))).click()
+            WebDriverWait(self._driver, self._wait_duration).until(self._lookup.clickable("close_modal")).click()
 
         except Exception:
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._handle_campground_page() no modal to close")
 
         try:
             # Scroll down to the table
-            table_section = self._driver.find_element_by_class_name("rec-slider-container")
+            table_section = self._lookup.must(By.CLASS_NAME, "rec-slider-container", self._long_delay)
             self._driver.execute_script("arguments[0].scrollIntoView();", table_section)
-            sleep(self._wait_duration)
+            # Wait for the availability grid to render
+            self._waits.until("CampRecGov._handle_campground_page()",
+                              ws.all_of(ws.element_present((By.CLASS_NAME, "rec-availability-date")),
+                                        ws.network_settled()))
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location)
-                  + ": CampRecGov._handle_campground_page() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._handle_campground_page() failed")
             raise e
 
     def _dropdown_menu_handler(self, element_type_id, parameters=""):
@@ -166,20 +240,34 @@ class CampRecGov(RecGov):
         :param parameters: the parameter string to use for selection
         :return: None
         """
-        type_elements = self._driver.find_elements_by_id(element_type_id)
+        type_elements = self._lookup.may(By.ID, element_type_id)
         if len(type_elements) > 0:
             type_elements[0].click()
 
             menu_element = type_elements[0].find_element_by_xpath("..")
-            for option in menu_element.find_elements_by_class_name("filter-menu-checkbox-item"):
+            for option in self._lookup.must_all(By.CLASS_NAME, "filter-menu-checkbox-item", root=menu_element):
                 if option.text.split()[0].lower().rstrip() in parameters.lower():
                     checkbox = option.find_element_by_tag_name("input")
-                    checkbox.click()
+                    # Already checked by a deep link, clicking would uncheck it
+                    if not checkbox.is_selected():
+                        checkbox.click()
 
-            apply_button = menu_element.find_element_by_xpath("//span[contains(text(), 'Apply')]")
+            apply_button = self._lookup.must(lc.NAMED, "filter_apply", root=menu_element)
             apply_button = RecGov.find_parent_with_tag(apply_button, "button")
             apply_button.click()
 
+    def _filter_applied(self, element_type_id):
+        """
+        _filter_applied - checks if the dropdown already has a checked option, e.g. from a deep link
+        :param element_type_id: the dropdown id to check
+        :return: bool: True if an option is checked
+        """
+        return self._driver.execute_script(
+            "var menu = document.getElementById(arguments[0]);"
+            "return menu !== null && menu.parentElement.querySelectorAll('input:checked').length > 0;",
+            element_type_id
+        )
+
     def _campsite_type(self):
         """
         _campsite_type - handles the dropdown campsite type menu
@@ -212,6 +300,13 @@ class CampRecGov(RecGov):
         """
 
         if self._camping_details['dates'] is not None:
+            # Skip typing the dates when the deep link already set them
+            if super(CampRecGov, self).date_applied(self._camping_details['dates'][0],
+                                                    "campground-start-date-calendar") and \
+                    super(CampRecGov, self).date_applied(self._camping_details['dates'][1],
+                                                         "campground-end-date-calendar"):
+                return
+
             super(CampRecGov, self).select_date(
                 self._camping_details['dates'][0],
                 "campground-start-date-calendar"
@@ -227,16 +322,18 @@ class CampRecGov(RecGov):
         :return: None
         """
         try:
-            if len(self._camping_details['site_type']) > 0:
+            # The UI is only the fallback for what the deep link could not set
+            if len(self._camping_details['site_type']) > 0 and \
+                    not self._filter_applied("filter-menu-site-types"):
                 self._campsite_type()
-            if len(self._camping_details['allowed_equipment']) > 0:
+            if len(self._camping_details['allowed_equipment']) > 0 and \
+                    not self._filter_applied("filter-menu-equipment"):
                 self._allowed_equipment()
             self._select_dates()
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location)
-                  + ": CampRecGov._scheduling_details() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._scheduling_details() failed")
             raise e
 
     def _refresh_availability_table(self):
@@ -245,16 +342,12 @@ class CampRecGov(RecGov):
         :return: None
         """
         try:
-            refresh_button = self._driver.find_element_by_xpath(
-                "//span[contains(text(), 'Refresh Table')]"
-            )
-            refresh_button = RecGov.find_parent_with_tag(refresh_button, "button")
-            refresh_button.click()
+            super(CampRecGov, self).throttle()
+            self._elements.act(lc.NAMED, "refresh_table", lambda refresh_button: refresh_button.click(), "button")
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location)
-                  + ": CampRecGov._refresh_availability_table() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._refresh_availability_table() failed")
             raise e
 
     def _book_now(self, campsite, book_dates, iteration):
@@ -266,20 +359,18 @@ class CampRecGov(RecGov):
         :return: True if successfully in checkout, else False
         """
         try:
-            output_str = "#" + str(iteration) + ": " \
-                         + RecGov.format_location_string(self._location) \
+            output_str = "#" + str(iteration) \
                          + ": Able to book: Site #" + str(campsite).zfill(3) \
                          + " for: " + book_dates \
                          + ", you must log in to proceed"
 
-            if super(CampRecGov, self).book_now("//span[contains(text(), 'Add to Cart')]"):
+            if super(CampRecGov, self).book_now("add_to_cart"):
                 return super(CampRecGov, self).finish_book_now(output_str,
                                                                RecGov.format_location_string(self._location))
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location)
-                  + ": CampRecGov._book_now() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._book_now() failed")
             raise e
 
         # Any issues, etc. continue polling the availability page
@@ -290,16 +381,14 @@ class CampRecGov(RecGov):
         _clear_selection - clears the selection on the table
         :return: None
         """
-        clear_selection_elements = self._driver.find_elements_by_xpath("//span[contains(text(), "
-                                                                       "'Clear selection')]")
-        if len(clear_selection_elements) > 0:
-            clear_selection = RecGov.find_parent_with_tag(clear_selection_elements[0], "button")
-            clear_selection.click()
+        self._elements.act(lc.NAMED, "clear_selection", lambda button: button.click(), "button", must=False)
 
     def _handle_availability(self, start_datetime, end_datetime, start_date, end_date, campsite, iteration):
         try:
             self._clear_selection()
-            available_date_elements = self._driver.find_elements_by_class_name("available")
+            available_date_elements = self._lookup.may(By.CLASS_NAME, "available")
+            super(CampRecGov, self).decide(str(len(available_date_elements)) + " available cell(s), looking for "
+                                           + start_date + " and " + end_date)
             if len(available_date_elements) > 0:
                 available_date_buttons = list()
                 for index in range(len(available_date_elements)):
@@ -319,24 +408,25 @@ class CampRecGov(RecGov):
                                 end_date_button = available_date_buttons[index]
                                 break
 
+                    super(CampRecGov, self).decide(
+                        "start and end cells " + ("found, selecting them" if start_date_button != end_date_button
+                                                  else "not both available"))
                     if start_date_button != end_date_button:
-                        ActionChains(self._driver).move_to_element(start_date_button).click(
-                            start_date_button).perform()
-                        ActionChains(self._driver).move_to_element(end_date_button).click(
-                            end_date_button).perform()
+                        self._interactions.click("date selection", [start_date_button, end_date_button],
+                                                 lambda: self._dates_selected(start_date, end_date))
 
                         # verify that the correct dates are selected
-                        start_date_verification = self._driver.find_elements_by_class_name("start")
-                        end_date_verification = self._driver.find_elements_by_class_name("end")
+                        start_date_verification = self._lookup.may(By.CLASS_NAME, "start")
+                        end_date_verification = self._lookup.may(By.CLASS_NAME, "end")
                         if len(start_date_verification) == 0 or len(end_date_verification) == 0:
                             return 1
 
                         start_date_verification = start_date_verification[0]
                         end_date_verification = end_date_verification[0]
-                        start_date_verification_button = start_date_verification.find_elements_by_class_name(
-                            "rec-availability-date")
-                        end_date_verification_button = end_date_verification.find_elements_by_class_name(
-                            "rec-availability-date")
+                        start_date_verification_button = self._lookup.may(
+                            By.CLASS_NAME, "rec-availability-date", root=start_date_verification)
+                        end_date_verification_button = self._lookup.may(
+                            By.CLASS_NAME, "rec-availability-date", root=end_date_verification)
                         if len(start_date_verification_button) == 0 or len(end_date_verification_button) == 0:
                             return 1
 
@@ -353,6 +443,8 @@ class CampRecGov(RecGov):
                                 end_date in end_date_verification_button.get_attribute("aria-label").lower():
                             end_valid = True
 
+                        super(CampRecGov, self).decide("selection verified: start " + str(start_valid)
+                                                       + ", end " + str(end_valid))
                         if start_valid and end_valid:
                             dates = DateHandler.datetime_to_normal_text(start_datetime) + "-" + \
                                     DateHandler.datetime_to_normal_text(end_datetime)
@@ -360,35 +452,56 @@ class CampRecGov(RecGov):
                             return 1 if self._book_now(campsite, dates, iteration) else 0
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": CampRecGov._handle_availability() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._handle_availability() failed")
+            super(CampRecGov, self).dump_flight("CampRecGov._handle_availability() failed", format_exc())
             return 2
 
+    def replace_driver(self, driver):
+        super(CampRecGov, self).replace_driver(driver)
+        if self._sweep is not None:
+            self._sweep.replace_driver(driver, self._waits)
+
+    def iteration_summary(self):
+        return super(CampRecGov, self).iteration_summary() \
+               + (self._sweep.summary() if self._sweep is not None else "")
+
+    def _dates_selected(self, start_date, end_date):
+        """
+        _dates_selected - checks the grid marks the start and end dates in one script call
+        :param start_date: the lower case short text of the start date
+        :param end_date: the lower case short text of the end date
+        :return: bool: True if both dates are selected
+        """
+        return self._driver.execute_script(
+            "function selected(marker, text) {"
+            "  var button = document.querySelector('.' + marker + ' .rec-availability-date');"
+            "  var label = button === null ? null : button.getAttribute('aria-label');"
+            "  return label !== null && label.toLowerCase().indexOf(text) !== -1;"
+            "}"
+            "return selected('start', arguments[0]) && selected('end', arguments[1]);", start_date, end_date)
+
     def _select_campsite(self):
         """
         _select_campsite - inputs the given site number into the search bar
         :return: None
         """
         try:
-            site_search_elements = self._driver.find_elements_by_id("campsite-filter-search")
-
-            if len(site_search_elements) > 0:
-                site_search_element = site_search_elements[0]
-
-                start_datetime = self._camping_details['dates'][0]
-                end_datetime = self._camping_details['dates'][1]
-                start_date = DateHandler.datetime_to_short_text(start_datetime).lower()
-                end_date = DateHandler.datetime_to_short_text(end_datetime).lower()
-                campsite = self._location.split(":")[2]
+            start_datetime = self._camping_details['dates'][0]
+            end_datetime = self._camping_details['dates'][1]
+            start_date = DateHandler.datetime_to_short_text(start_datetime).lower()
+            end_date = DateHandler.datetime_to_short_text(end_datetime).lower()
+            campsite = self._location.split(":")[2]
 
-                site_search_element.send_keys(Keys.CONTROL + 'a')
-                site_search_element.send_keys(campsite)
+            # Reselected whenever the grid lost the campsite, the search field itself stays,
+            # a sweep of the whole campground keeps it empty
+            self._elements.act(By.ID, "campsite-filter-search",
+                               lambda site_search_element: self._interactions.set_value(
+                                   "campsite search", site_search_element, "" if campsite == "*" else campsite))
 
-                return start_datetime, end_datetime, start_date, end_date, campsite
+            return start_datetime, end_datetime, start_date, end_date, campsite
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": CampRecGov._select_campsite() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._select_campsite() failed")
             raise e
-
-        return False
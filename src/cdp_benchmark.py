@@ -0,0 +1,117 @@
+"""
+This module compares the poll iteration latency of the Selenium path and the DevTools
+engine on the local fixture site. Each location is prepared once, then polled the same
+number of times on each path in the same browser.
+
+    python3 -m src.cdp_benchmark --iterations 50
+
+Needs chrome, chromedriver and the websocket-client package.
+"""
+
+import argparse
+import json
+from datetime import datetime
+from os import makedirs, path
+from time import monotonic
+
+from src.scale_simulator import SimulationSettings, ScaleSimulator
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(samples):
+    """
+    summarize - latency statistics of one path
+    :param samples: list of iteration seconds
+    :return: dict: the statistics in milliseconds
+    """
+    return {"iterations": len(samples),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 1),
+            "p50_ms": round(percentile(samples, 0.5) * 1000, 1),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 1)}
+
+
+def measure(rcgv, iterations, cdp):
+    """
+    measure - times poll iterations on one path
+    :param rcgv: the prepared CampRecGov or PermitRecGov
+    :param iterations: the number of iterations
+    :param cdp: True to poll over DevTools
+    :return: list: the iteration seconds
+    """
+    rcgv.set_cdp_enabled(cdp)
+    if cdp and rcgv.cdp_engine() is None:
+        raise RuntimeError("The DevTools engine could not connect, see the log")
+
+    samples = list()
+    for iteration in range(iterations):
+        started = monotonic()
+        rcgv.poll_once(iteration)
+        samples.append(monotonic() - started)
+    return samples
+
+
+def run(iterations, directory):
+    """
+    run - benchmarks one campground and one permit entry point
+    :param iterations: poll iterations per path
+    :param directory: where the inputs and results are written
+    :return: str: path to the results file
+    """
+    # Imported here so the fixture site can be used without selenium installed
+    import src.overseer as overwatch
+    import src.event_bus as eb
+
+    simulator = ScaleSimulator(SimulationSettings([2], overrides={"cdp_engine": "True"},
+                                                  label="cdp_benchmark", directory=directory))
+    site, keys, prefs = simulator.setup(2)
+    overseer = overwatch.Overseer(prefs)
+    events = eb.configure(overseer.preferences)
+    merged_list = overwatch.Overseer.merge_parameters(overseer.preferences.camping_locations.keys(), "Camping") \
+        + overwatch.Overseer.merge_parameters(overseer.preferences.permit_locations.keys(), "Permits")
+
+    results = list()
+    overseer.backend.start(overseer.lifecycle)
+    try:
+        for merged_location_type in merged_list:
+            driver = overseer.create_driver(merged_location_type[0])
+            if driver is None:
+                raise RuntimeError("Unable to create the driver, see the log")
+            try:
+                rcgv = overseer.create_rec_gov(driver, merged_location_type)
+                rcgv.prepare(login=False)
+                # Warms the page and the connection so neither path pays for the first load
+                measure(rcgv, 1, True)
+                selenium_samples = measure(rcgv, iterations, False)
+                cdp_samples = measure(rcgv, iterations, True)
+                result = {"location": merged_location_type[0], "type": merged_location_type[1],
+                          "selenium": summarize(selenium_samples), "cdp": summarize(cdp_samples)}
+                print(json.dumps(result))
+                results.append(result)
+            finally:
+                overseer.lifecycle.release(driver)
+    finally:
+        overseer.backend.stop(overseer.lifecycle)
+        site.stop()
+        events.flush()
+
+    makedirs(directory, exist_ok=True)
+    results_file = path.join(directory, "cdp_benchmark_" + datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    with open(results_file, "w") as results_output:
+        json.dump({"iterations": iterations, "results": results}, results_output, indent=2)
+    print("Results written to " + results_file)
+    return results_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares Selenium and DevTools poll latency on the fixture site")
+    parser.add_argument("--iterations", type=int, default=50, help="poll iterations per path and location")
+    parser.add_argument("--dir", default="simulations", help="where the inputs and results are written")
+    arguments = parser.parse_args()
+    run(arguments.iterations, arguments.dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+This module provides the DevTools protocol engine for the poll loop. It talks to the tab
+over the browser's DevTools websocket instead of going through chromedriver, so a
+refresh, wait and read of the grid skip the HTTP round trips. Selenium still does the
+navigation, login and booking. Needs the websocket-client package.
+"""
+
+import json
+from time import monotonic
+from urllib.request import urlopen
+
+try:
+    import websocket
+except ImportError:
+    # The engine is optional, the flows poll through Selenium without it
+    websocket = None
+
+
+class CdpUnavailableException(Exception):
+    pass
+
+
+class CdpCommandException(Exception):
+    pass
+
+
+class CdpEngine:
+    """ This class sends DevTools commands to one tab and tracks its network activity. """
+
+    def __init__(self, websocket_url, timeout=10):
+        """
+        __init__ - constructor, connects to the tab and turns on network events
+        :param websocket_url: the webSocketDebuggerUrl of the tab
+        :param timeout: seconds a command may take
+        """
+        self._timeout = timeout
+        self._socket = websocket.create_connection(websocket_url, timeout=timeout)
+        self._next_id = 0
+        self._inflight = set()
+        self._finished = 0
+        self.send("Network.enable")
+
+    @staticmethod
+    def attach(driver, timeout=10):
+        """
+        attach - connects to the tab the driver is currently on
+        :param driver: the chrome driver, started with --remote-allow-origins so the websocket is accepted
+        :param timeout: seconds a command may take
+        :return: CdpEngine: the engine
+        """
+        if websocket is None:
+            raise CdpUnavailableException("websocket-client is not installed")
+
+        address = driver.capabilities.get("goog:chromeOptions", {}).get("debuggerAddress")
+        if address is None:
+            raise CdpUnavailableException("The driver does not expose a DevTools address")
+
+        with urlopen("http://" + address + "/json/list", timeout=timeout) as response:
+            targets = [target for target in json.loads(response.read().decode("utf-8"))
+                       if target.get("type") == "page"]
+
+        # Window handles are the target id, older chromedrivers prefix it
+        target_id = driver.current_window_handle.replace("CDwindow-", "")
+        matches = [target for target in targets if target["id"].upper() == target_id.upper()]
+        if len(matches) == 0:
+            current_url = driver.current_url
+            matches = [target for target in targets if target.get("url") == current_url]
+        if len(matches) == 0:
+            raise CdpUnavailableException("No DevTools target for the current tab")
+
+        return CdpEngine(matches[0]["webSocketDebuggerUrl"], timeout)
+
+    def _receive(self, timeout):
+        """
+        _receive - reads the next message from the tab
+        :param timeout: seconds to wait
+        :return: dict: the message, None if nothing arrived in time
+        """
+        self._socket.settimeout(timeout)
+        try:
+            return json.loads(self._socket.recv())
+        except websocket.WebSocketTimeoutException:
+            return None
+
+    def _on_event(self, message):
+        method = message.get("method")
+        if method == "Network.requestWillBeSent":
+            self._inflight.add(message["params"]["requestId"])
+        elif method in ("Network.loadingFinished", "Network.loadingFailed"):
+            if message["params"]["requestId"] in self._inflight:
+                self._inflight.discard(message["params"]["requestId"])
+                self._finished += 1
+
+    def send(self, method, params=None):
+        """
+        send - runs a DevTools command, handling the events that arrive before its response
+        :param method: the command, e.g. Runtime.evaluate
+        :param params: the command parameters
+        :return: dict: the command result
+        """
+        self._next_id += 1
+        command_id = self._next_id
+        self._socket.send(json.dumps({"id": command_id, "method": method, "params": params or dict()}))
+
+        deadline = monotonic() + self._timeout
+        while monotonic() < deadline:
+            message = self._receive(max(deadline - monotonic(), 0.001))
+            if message is None:
+                break
+            if message.get("id") == command_id:
+                if "error" in message:
+                    raise CdpCommandException(method + ": " + message["error"].get("message", ""))
+                return message.get("result", dict())
+            self._on_event(message)
+
+        raise CdpCommandException(method + ": no response after " + str(self._timeout) + "s")
+
+    def evaluate(self, body, *arguments, await_promise=False):
+        """
+        evaluate - runs a function body in the page, like execute_script
+        :param body: the function body, the arguments are in arguments[]
+        :param arguments: json serialisable arguments
+        :param await_promise: wait for a returned promise to settle
+        :return: the returned value
+        """
+        expression = "(function () {" + body + "}).apply(null, " + json.dumps(list(arguments)) + ")"
+        result = self.send("Runtime.evaluate", {"expression": expression, "returnByValue": True,
+                                                "awaitPromise": await_promise})
+        if "exceptionDetails" in result:
+            raise CdpCommandException("Runtime.evaluate: " + result["exceptionDetails"].get("text", ""))
+        return result.get("result", dict()).get("value")
+
+    def click(self, element_body):
+        """
+        click - clicks an element with trusted mouse events at its center
+        :param element_body: function body returning the element
+        :return: bool: True if the element was found and clicked
+        """
+        center = self.evaluate("var element = (function () {" + element_body + "})();"
+                               "if (!element) { return null; }"
+                               "element.scrollIntoView({block: 'center'});"
+                               "var rect = element.getBoundingClientRect();"
+                               "return [rect.left + rect.width / 2, rect.top + rect.height / 2];")
+        if center is None:
+            return False
+
+        for event_type in ("mousePressed", "mouseReleased"):
+            self.send("Input.dispatchMouseEvent", {"type": event_type, "x": center[0], "y": center[1],
+                                                   "button": "left", "clickCount": 1})
+        return True
+
+    def mark(self):
+        """
+        mark - forgets the network activity so far, call before the action to wait on
+        :return: None
+        """
+        while True:
+            message = self._receive(0.001)
+            if message is None:
+                break
+            self._on_event(message)
+        self._inflight.clear()
+        self._finished = 0
+
+    def wait_network_idle(self, ceiling, start_grace=0.3, quiet=0.02):
+        """
+        wait_network_idle - waits for the requests started since mark to finish
+        :param ceiling: the most seconds to wait
+        :param start_grace: seconds to give up if no request was started at all
+        :param quiet: seconds without a network event that count as idle
+        :return: bool: True if the network went idle, False if the ceiling was hit
+        """
+        started = monotonic()
+        while monotonic() - started < ceiling:
+            message = self._receive(quiet)
+            if message is not None:
+                self._on_event(message)
+                continue
+            if len(self._inflight) == 0 and (self._finished > 0 or monotonic() - started > start_grace):
+                return True
+        return False
+
+    def close(self):
+        try:
+            self._socket.close()
+        except Exception:
+            pass
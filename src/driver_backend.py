@@ -0,0 +1,164 @@
+"""
+This module provides the driver backends. The local backend starts a chromedriver per
+browser as before, the shared backend runs one chromedriver service for every session of
+the run, and the remote backend creates the sessions on WebDriver hubs on other hosts.
+"""
+
+from os import path, getcwd
+from sys import platform
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+
+
+class NoDriverCapacityException(Exception):
+    pass
+
+
+class NoDriverHubsException(Exception):
+    pass
+
+
+def chromedriver_path():
+    """
+    chromedriver_path - the chromedriver in the working directory for this platform
+    :return: str: the path
+    """
+    # windows default
+    exec_path = path.join(getcwd(), 'chromedriver.exe')
+    if platform == "linux":
+        exec_path = path.join(getcwd(), 'chromedriver_linux')
+    return exec_path
+
+
+class LocalBackend:
+    """ This class starts a chromedriver and browser per session on this host. """
+
+    def __init__(self, capacity=0):
+        """
+        __init__ - constructor
+        :param capacity: most browsers at once, 0 for no limit
+        """
+        self.capacity = capacity
+
+    def concurrency(self, work):
+        """
+        concurrency - how many workers can run at once, the rest wait for a free slot
+        :param work: the number of workers wanted
+        :return: int: the pool size
+        """
+        return min(work, self.capacity) if self.capacity > 0 else work
+
+    def start(self, lifecycle):
+        pass
+
+    def stop(self, lifecycle):
+        pass
+
+    def create(self, options, capabilities, slot=0):
+        """
+        create - starts a session
+        :param options: the ChromeOptions
+        :param capabilities: the desired capabilities dict
+        :param slot: index of the worker, used by backends with several endpoints
+        :return: the driver
+        """
+        return webdriver.Chrome(executable_path=chromedriver_path(),
+                                chrome_options=options,
+                                desired_capabilities=capabilities)
+
+
+class SharedServiceBackend(LocalBackend):
+    """ This class runs one chromedriver service that every worker opens its session on. """
+
+    def __init__(self, capacity=0):
+        """
+        __init__ - constructor
+        :param capacity: most sessions on the service at once, 0 for no limit
+        """
+        super(SharedServiceBackend, self).__init__(capacity)
+        self._service = None
+        self.service_url = None
+
+    def __getstate__(self):
+        # Workers only need the url, the service process stays with the overseer
+        state = self.__dict__.copy()
+        state['_service'] = None
+        return state
+
+    def start(self, lifecycle):
+        """
+        start - starts the service in the overseer and records it with the driver lifecycle
+        :param lifecycle: the DriverLifecycle of the run
+        :return: None
+        """
+        self._service = Service(chromedriver_path())
+        self._service.start()
+        self.service_url = self._service.service_url
+        lifecycle.register_pid(self._service.process.pid, "shared chromedriver service")
+
+    def stop(self, lifecycle):
+        """
+        stop - ends the service, the sessions were quit by their workers or by DriverLifecycle.quit_sessions
+        except the ones left in checkout, whose browsers are kept open as with the local backend
+        :param lifecycle: the DriverLifecycle of the run
+        :return: None
+        """
+        if self._service is not None and self._service.process is not None:
+            lifecycle.keep_pid(self._service.process.pid)
+
+    def create(self, options, capabilities, slot=0):
+        return webdriver.Remote(command_executor=self.service_url,
+                                desired_capabilities=capabilities,
+                                options=options)
+
+
+class RemoteBackend(LocalBackend):
+    """ This class opens the sessions on WebDriver hubs, spread over the hubs by worker. """
+
+    def __init__(self, hubs, capacity=0):
+        """
+        __init__ - constructor
+        :param hubs: list of hub urls, e.g. http://node:4444/wd/hub
+        :param capacity: most sessions per hub at once, 0 for no limit
+        """
+        super(RemoteBackend, self).__init__(capacity)
+        self._hubs = hubs
+
+    def concurrency(self, work):
+        return min(work, self.capacity * len(self._hubs)) if self.capacity > 0 else work
+
+    def create(self, options, capabilities, slot=0):
+        """
+        create - opens a session on the hub for this slot, trying the other hubs if it is full or down
+        :param options: the ChromeOptions
+        :param capabilities: the desired capabilities dict
+        :param slot: index of the worker
+        :return: the driver
+        """
+        failures = list()
+        for offset in range(len(self._hubs)):
+            hub = self._hubs[(slot + offset) % len(self._hubs)]
+            try:
+                return webdriver.Remote(command_executor=hub,
+                                        desired_capabilities=capabilities,
+                                        options=options)
+            except Exception as e:
+                failures.append(hub + ": " + str(e).strip())
+
+        raise NoDriverCapacityException("No hub could start a session, " + "; ".join(failures))
+
+
+def create_backend(preferences):
+    """
+    create_backend - the backend selected in preferences
+    :param preferences: the preferences to be used during execution
+    :return: the backend
+    """
+    if preferences.driver_backend == "remote" and len(preferences.driver_hubs) == 0:
+        # A pool of no workers can not be started
+        raise NoDriverHubsException("The remote driver_backend needs driver_hubs")
+    if preferences.driver_backend == "shared":
+        return SharedServiceBackend(preferences.driver_capacity)
+    if preferences.driver_backend == "remote":
+        return RemoteBackend(preferences.driver_hubs, preferences.driver_capacity)
+    return LocalBackend(preferences.driver_capacity)
@@ -0,0 +1,339 @@
+"""
+This module provides the chromedriver lifecycle manager. Every driver the bot starts is
+recorded in a registry file, so drivers left behind by a crash or a detached checkout
+browser can be cleaned up on the next start or shutdown.
+"""
+
+import json
+import shutil
+from os import getpid, kill, path, replace
+from signal import SIGTERM
+from time import time
+
+from selenium.webdriver.remote.command import Command
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+import src.event_bus as eb
+import src.process_stats as ps
+
+try:
+    import fcntl
+except ImportError:
+    # No registry locking on windows
+    fcntl = None
+
+
+class DriverLifecycle:
+    """ This class records, keeps and reaps the process trees of the drivers the bot starts. """
+
+    def __init__(self, registry='.driver_registry.json', owner=None):
+        """
+        __init__ - constructor
+        :param registry: path to the registry file shared by every bot process
+        :param owner: process id of the overseer that owns the drivers of this run
+        """
+        self._registry = registry
+        self._owner = owner if owner is not None else getpid()
+
+    def _update(self, update):
+        """
+        _update - reads, updates and writes the registry while holding its lock
+        :param update: callable(entries) that modifies the registry dict in place
+        :return: None
+        """
+        with open(self._registry + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                entries = dict()
+                if path.exists(self._registry):
+                    try:
+                        with open(self._registry, "r") as registry_file:
+                            entries = json.load(registry_file)
+                    except ValueError:
+                        entries = dict()
+
+                update(entries)
+
+                with open(self._registry + ".tmp", "w") as registry_file:
+                    json.dump(entries, registry_file, indent=2)
+                replace(self._registry + ".tmp", self._registry)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _same_process(pid, start_time):
+        """
+        _same_process - checks the pid is alive and was not reused by another process
+        :param pid: the recorded process id
+        :param start_time: the recorded start time, None if it was unavailable
+        :return: bool: True if the recorded process is still running
+        """
+        if not ps.pid_alive(pid):
+            return False
+        return start_time is None or ps.process_start_time(pid) == start_time
+
+    @staticmethod
+    def _terminate(pids):
+        """
+        _terminate - sends SIGTERM to the processes, children first
+        :param pids: the process ids to end
+        :return: None
+        """
+        for pid in reversed(pids):
+            try:
+                kill(pid, SIGTERM)
+            except OSError:
+                pass
+
+    def _reap_entry(self, driver_pid, entry, keep_browser):
+        """
+        _reap_entry - ends the still running processes of a registry entry
+        :param driver_pid: the chromedriver process id
+        :param entry: the registry entry
+        :param keep_browser: only end the chromedriver, the browser is left for the user
+        :return: bool: True if nothing of the entry is left running
+        """
+        if entry.get("session") is not None:
+            # The browser runs under the shared service or a hub, a checkout session is kept along with it
+            return not keep_browser
+        alive = [pid for pid, start_time in entry["pids"]
+                 if self._same_process(pid, start_time)]
+        if keep_browser:
+            if int(driver_pid) in alive:
+                DriverLifecycle._terminate([int(driver_pid)])
+            return len([pid for pid in alive if pid != int(driver_pid)]) == 0
+
+        # Pick up renderers started after the driver was registered
+        tree = list()
+        for pid in alive:
+            tree.extend(tree_pid for tree_pid in ps.process_tree_pids(pid) if tree_pid not in tree)
+        DriverLifecycle._terminate(tree)
+        return True
+
+    @staticmethod
+    def _forget(entries, driver_pid):
+        """
+        _forget - removes a registry entry whose processes are gone, with the profile copy it ran on
+        :param entries: the registry dict
+        :param driver_pid: the chromedriver process id
+        :return: dict: the removed entry, None if there was none
+        """
+        entry = entries.pop(str(driver_pid), None)
+        if entry is not None and entry.get("profile"):
+            shutil.rmtree(entry["profile"], ignore_errors=True)
+        return entry
+
+    def register(self, driver, location_str, profile=None):
+        """
+        register - records the process tree of a newly started driver
+        :param driver: the chrome driver
+        :param location_str: formatted location(s) the driver is for
+        :param profile: the profile copy the browser runs on, removed once the browser is gone
+        :return: None
+        """
+        driver_pid = ps.driver_pid(driver)
+        if driver_pid is None:
+            self.register_session(driver, location_str, profile)
+            return
+        self.register_pid(driver_pid, location_str, profile)
+
+    def register_pid(self, driver_pid, location_str, profile=None):
+        """
+        register_pid - records the process tree of a chromedriver, e.g. the shared service
+        :param driver_pid: the chromedriver process id
+        :param location_str: formatted location(s) or a description of the process
+        :param profile: the profile copy the browser runs on, removed once the browser is gone
+        :return: None
+        """
+        pids = [[pid, ps.process_start_time(pid)] for pid in ps.process_tree_pids(driver_pid)]
+
+        def update(entries):
+            entries[str(driver_pid)] = {"owner": self._owner, "worker": getpid(), "location": location_str,
+                                        "pids": pids, "keep": False, "started": time(), "profile": profile}
+
+        self._update(update)
+
+    @staticmethod
+    def _session_key(driver):
+        return "session " + str(driver.session_id)
+
+    def register_session(self, driver, location_str, profile=None):
+        """
+        register_session - records a session on the shared service or a hub, it has no chromedriver
+        of its own, so the run quits it by its id when the workers were stopped before they could
+        :param driver: the remote driver
+        :param location_str: formatted location(s) the driver is for
+        :param profile: the profile copy the browser runs on, removed once the session is gone
+        :return: None
+        """
+        try:
+            url = driver.command_executor._url
+        except AttributeError:
+            url = None
+
+        def update(entries):
+            entries[DriverLifecycle._session_key(driver)] = {
+                "owner": self._owner, "worker": getpid(), "location": location_str, "pids": [], "keep": False,
+                "started": time(), "profile": profile, "session": driver.session_id, "url": url}
+
+        self._update(update)
+
+    def profiles(self):
+        """
+        profiles - the profile copies of every recorded browser
+        :return: set: the profile directories
+        """
+        profiles = set()
+
+        def update(entries):
+            profiles.update(entry["profile"] for entry in entries.values() if entry.get("profile"))
+
+        self._update(update)
+        return profiles
+
+    def release(self, driver):
+        """
+        release - quits the driver and removes it from the registry
+        :param driver: the chrome driver
+        :return: None
+        """
+        driver_pid = ps.driver_pid(driver)
+        try:
+            driver.quit()
+        except Exception:
+            eb.get_event_bus().error(None, "DriverLifecycle.release() quit failed")
+
+        if driver_pid is None:
+            self._update(lambda entries: DriverLifecycle._forget(entries, DriverLifecycle._session_key(driver)))
+            return
+
+        def update(entries):
+            entry = entries.get(str(driver_pid))
+            if entry is not None:
+                self._reap_entry(str(driver_pid), entry, False)
+                DriverLifecycle._forget(entries, driver_pid)
+
+        self._update(update)
+
+    def kill(self, driver):
+        """
+        kill - ends the process tree of a hung driver without talking to it, any call
+        blocked on the driver fails instead of waiting forever
+        :param driver: the chrome driver
+        :return: None
+        """
+        driver_pid = ps.driver_pid(driver)
+        if driver_pid is None:
+            # A session on a shared service or hub, ending the session fails the blocked call
+            try:
+                driver.quit()
+            except Exception:
+                eb.get_event_bus().error(None, "DriverLifecycle.kill() quit failed")
+            self._update(lambda entries: DriverLifecycle._forget(entries, DriverLifecycle._session_key(driver)))
+            return
+
+        def update(entries):
+            entry = entries.get(str(driver_pid), {"pids": [[driver_pid, None]]})
+            self._reap_entry(str(driver_pid), entry, False)
+            DriverLifecycle._forget(entries, driver_pid)
+
+        self._update(update)
+
+    def keep(self, driver):
+        """
+        keep - leaves the checkout browser open for the user but ends its idle chromedriver,
+        the browser is started detached so it survives its driver
+        :param driver: the chrome driver
+        :return: None
+        """
+        driver_pid = ps.driver_pid(driver)
+        if driver_pid is None:
+            # The session is left open, quit_sessions and reap_run pass over it
+            def update(entries):
+                entry = entries.get(DriverLifecycle._session_key(driver))
+                if entry is not None:
+                    entry["keep"] = True
+
+            self._update(update)
+            return
+        self.keep_pid(driver_pid)
+
+    def keep_pid(self, driver_pid):
+        """
+        keep_pid - ends a chromedriver and keeps the browsers it leaves behind in the registry
+        :param driver_pid: the chromedriver process id
+        :return: None
+        """
+        def update(entries):
+            entry = entries.get(str(driver_pid))
+            if entry is None:
+                return
+            # Record the renderers the checkout opened so a later reap sees the whole browser
+            entry["pids"] = [[pid, ps.process_start_time(pid)] for pid in ps.process_tree_pids(driver_pid)]
+            entry["keep"] = True
+            if self._reap_entry(str(driver_pid), entry, True):
+                DriverLifecycle._forget(entries, driver_pid)
+
+        self._update(update)
+
+    def reap_orphans(self):
+        """
+        reap_orphans - ends the drivers of runs whose overseer is no longer running,
+        kept checkout browsers are left alone until the user closes them
+        :return: int: the number of entries reaped
+        """
+        reaped = list()
+
+        def update(entries):
+            for driver_pid, entry in list(entries.items()):
+                if entry["owner"] == self._owner or ps.pid_alive(entry["owner"]):
+                    continue
+                if self._reap_entry(driver_pid, entry, entry["keep"]):
+                    DriverLifecycle._forget(entries, driver_pid)
+                    reaped.append(driver_pid)
+            # A kept session goes once the shared service it ran on has no browser left
+            owners = set(entry["owner"] for entry in entries.values() if entry.get("session") is None)
+            for driver_pid, entry in list(entries.items()):
+                if entry.get("session") is not None and entry["owner"] != self._owner \
+                        and not ps.pid_alive(entry["owner"]) and entry["owner"] not in owners:
+                    DriverLifecycle._forget(entries, driver_pid)
+
+        self._update(update)
+        if len(reaped) > 0:
+            eb.get_event_bus().info(None, "Reaped " + str(len(reaped)) + " orphaned driver(s)")
+        return len(reaped)
+
+    def quit_sessions(self):
+        """
+        quit_sessions - quits the sessions of this run on the shared service or a hub that were
+        not kept for checkout, e.g. those of workers stopped by ctrl-c
+        :return: None
+        """
+        def update(entries):
+            for key, entry in list(entries.items()):
+                if entry["owner"] != self._owner or entry.get("session") is None or entry["keep"]:
+                    continue
+                try:
+                    RemoteConnection(entry["url"]).execute(Command.QUIT, {"sessionId": entry["session"]})
+                except Exception:
+                    eb.get_event_bus().error(None, "DriverLifecycle.quit_sessions() failed for " + entry["location"])
+                DriverLifecycle._forget(entries, key)
+
+        self._update(update)
+
+    def reap_run(self):
+        """
+        reap_run - ends every driver of this run that was not kept for checkout,
+        used on shutdown and when the run is interrupted
+        :return: None
+        """
+        def update(entries):
+            for driver_pid, entry in list(entries.items()):
+                if entry["owner"] != self._owner:
+                    continue
+                if self._reap_entry(driver_pid, entry, entry["keep"]):
+                    DriverLifecycle._forget(entries, driver_pid)
+
+        self._update(update)
@@ -0,0 +1,104 @@
+"""
+This module provides the element cache for the controls the poll loop uses every iteration.
+A cached element is used until the page replaces it, then it is looked up again.
+"""
+
+from selenium.common.exceptions import StaleElementReferenceException
+
+
+class ElementCache:
+    """ This class caches WebElements by locator for one browser tab. """
+
+    def __init__(self, lookup):
+        """
+        __init__ - constructor
+        :param lookup: the Lookup used to resolve a locator on a miss
+        """
+        self._lookup = lookup
+        self._elements = dict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _resolve(self, by, value, tag, must, timeout):
+        """
+        _resolve - looks the element up and climbs to its enclosing tag
+        :return: WebElement: the element, None if a may lookup found nothing
+        """
+        if must:
+            element = self._lookup.must(by, value, timeout)
+        else:
+            element = self._lookup.first(by, value)
+            if element is None:
+                return None
+
+        if tag is not None and element.tag_name.strip() != tag:
+            # One round trip instead of one per level
+            element = element.find_element_by_xpath("ancestor::" + tag + "[1]")
+        return element
+
+    def get(self, by, value, tag=None, must=True, timeout=None):
+        """
+        get - the cached element for a locator, looked up on a miss
+        :param by: the By strategy
+        :param value: the locator value
+        :param tag: tag of the ancestor to cache instead, e.g. the button around a span
+        :param must: wait for the element, False to check instantly and not cache an absence
+        :param timeout: seconds a must lookup waits, defaults to the lookup timeout
+        :return: WebElement: the element, None if a may lookup found nothing
+        """
+        key = (by, value, tag)
+        if key in self._elements:
+            self.hits += 1
+            return self._elements[key]
+
+        self.misses += 1
+        element = self._resolve(by, value, tag, must, timeout)
+        if element is not None:
+            self._elements[key] = element
+        return element
+
+    def act(self, by, value, action, tag=None, must=True, timeout=None):
+        """
+        act - runs an action on the cached element, looking it up again once if the page replaced it
+        :param by: the By strategy
+        :param value: the locator value
+        :param action: callable(element), e.g. a click
+        :param tag: tag of the ancestor to act on
+        :param must: wait for the element, False to skip the action if it is absent
+        :param timeout: seconds a must lookup waits, defaults to the lookup timeout
+        :return: WebElement: the element acted on, None if a may lookup found nothing
+        """
+        element = self.get(by, value, tag, must, timeout)
+        if element is None:
+            return None
+
+        try:
+            action(element)
+            return element
+        except StaleElementReferenceException:
+            self.stale += 1
+            self._elements.pop((by, value, tag), None)
+
+        element = self.get(by, value, tag, must, timeout)
+        if element is not None:
+            action(element)
+        return element
+
+    def clear(self):
+        """
+        clear - forgets every element, called whenever the tab loads a new page
+        :return: None
+        """
+        self._elements.clear()
+
+    def summary(self):
+        """
+        summary - hit and miss counts for the stopping message, every hit is a lookup
+        and parent traversal that did not go to the browser
+        :return: str: the summary
+        """
+        if self.hits + self.misses == 0:
+            return ""
+        return ", element cache " + str(self.hits) + " hits, " + str(self.misses) + " misses, " \
+               + str(self.stale) + " stale"
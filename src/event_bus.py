@@ -0,0 +1,320 @@
+"""
+This module provides the event bus that keeps logging off of the polling loop.
+Events are queued per process and written out by a background thread.
+"""
+
+import json
+import queue
+import threading
+import logging
+import logging.handlers
+from os import getpid, makedirs, path
+from sys import stdout
+from time import time, strftime, localtime
+from traceback import format_exc
+from urllib import request
+
+
+POLL = "poll"
+FOUND = "found"
+BOOKED = "booked"
+ERROR = "error"
+INFO = "info"
+TIMING = "timing"
+
+
+class Event:
+    """ This class provides a single structured event. """
+
+    def __init__(self, kind, location, message, details=None):
+        """
+        __init__ - constructor
+        :param kind: the type of event, poll/found/booked/error/info/timing
+        :param location: the formatted location string the event belongs to
+        :param message: the human readable message
+        :param details: optional extra text, a traceback for errors
+        """
+        self.kind = kind
+        self.location = location
+        self.message = message
+        self.details = details
+        self.timestamp = time()
+        self.pid = getpid()
+
+    def format(self):
+        """
+        format - formats the event for text based sinks
+        :return: str: the formatted event
+        """
+        output_str = strftime("%H:%M:%S", localtime(self.timestamp)) + " [" + self.kind + "] "
+        if self.location:
+            output_str += self.location + ": "
+        output_str += self.message
+        if self.details:
+            output_str += "\n" + self.details.rstrip()
+
+        return output_str
+
+    def to_dict(self):
+        """
+        to_dict - converts the event to a dict for structured sinks
+        :return: dict: the event fields
+        """
+        return {"kind": self.kind, "location": self.location, "message": self.message,
+                "details": self.details, "timestamp": self.timestamp, "pid": self.pid}
+
+
+class ConsoleSink:
+    """ This class writes events to the terminal. """
+
+    def __init__(self, kinds=(FOUND, BOOKED, ERROR, INFO)):
+        """
+        __init__ - constructor
+        :param kinds: the event kinds to write, poll and timing events are skipped by default
+        """
+        self._kinds = kinds
+
+    def write(self, events):
+        """
+        write - writes a batch of events in a single terminal write
+        :param events: list of events to write
+        :return: None
+        """
+        lines = [event.format() for event in events if event.kind in self._kinds]
+        if len(lines) > 0:
+            stdout.write("\n".join(lines) + "\n")
+            stdout.flush()
+
+    def close(self):
+        pass
+
+
+class RotatingFileSink:
+    """ This class writes events to a rotating log file, one file per process. """
+
+    def __init__(self, log_file, max_bytes=1048576, backup_count=3):
+        """
+        __init__ - constructor
+        :param log_file: base path of the log file, the process id is appended
+        :param max_bytes: the size at which the file is rotated
+        :param backup_count: the number of rotated files to keep
+        """
+        root, ext = path.splitext(log_file)
+        log_path = root + "_" + str(getpid()) + (ext if ext else ".log")
+        if path.dirname(log_path):
+            makedirs(path.dirname(log_path), exist_ok=True)
+
+        self._handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes,
+                                                             backupCount=backup_count)
+
+    def write(self, events):
+        """
+        write - appends a batch of events to the log file
+        :param events: list of events to write
+        :return: None
+        """
+        for event in events:
+            record = logging.LogRecord("recgov", logging.INFO, "", 0, event.format(), None, None)
+            self._handler.emit(record)
+        self._handler.flush()
+
+    def close(self):
+        self._handler.close()
+
+
+class NotifierSink:
+    """ This class posts found/booked events to a webhook so the user is notified. """
+
+    def __init__(self, url, kinds=(FOUND, BOOKED), timeout=5):
+        """
+        __init__ - constructor
+        :param url: the webhook url to post the events to
+        :param kinds: the event kinds to post
+        :param timeout: timeout for each post in seconds
+        """
+        self._url = url
+        self._kinds = kinds
+        self._timeout = timeout
+
+    def write(self, events):
+        """
+        write - posts each matching event as json, failures are ignored
+        :param events: list of events to write
+        :return: None
+        """
+        for event in events:
+            if event.kind not in self._kinds:
+                continue
+            try:
+                data = json.dumps(event.to_dict()).encode("utf-8")
+                post = request.Request(self._url, data=data, headers={"Content-Type": "application/json"})
+                request.urlopen(post, timeout=self._timeout).close()
+            except Exception:
+                # A failing notifier must never take down the writer
+                pass
+
+    def close(self):
+        pass
+
+
+class EventBus:
+    """ This class provides a queue backed event bus drained by a background writer. """
+
+    def __init__(self, sinks=None, traceback_interval=60, max_queued=10000):
+        """
+        __init__ - constructor
+        :param sinks: list of sinks the writer sends events to
+        :param traceback_interval: seconds an identical traceback is suppressed for
+        :param max_queued: events past this are dropped instead of blocking the caller
+        """
+        self._sinks = sinks if sinks is not None else [ConsoleSink()]
+        self._traceback_interval = traceback_interval
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._tracebacks = dict()
+        self._dropped = 0
+        self._stopped = False
+        self._writer = threading.Thread(target=self._drain, name="event-bus-writer", daemon=True)
+        self._writer.start()
+
+    def publish(self, kind, location, message, details=None):
+        """
+        publish - queues an event without blocking
+        :param kind: the type of event
+        :param location: the formatted location string the event belongs to
+        :param message: the human readable message
+        :param details: optional extra text
+        :return: None
+        """
+        try:
+            self._queue.put_nowait(Event(kind, location, message, details))
+        except queue.Full:
+            self._dropped += 1
+
+    def poll(self, location, message):
+        self.publish(POLL, location, message)
+
+    def found(self, location, message):
+        self.publish(FOUND, location, message)
+
+    def booked(self, location, message):
+        self.publish(BOOKED, location, message)
+
+    def info(self, location, message):
+        self.publish(INFO, location, message)
+
+    def timing(self, location, message):
+        self.publish(TIMING, location, message)
+
+    def error(self, location, message, exc_info=True):
+        """
+        error - queues an error, identical tracebacks are rate limited
+        :param location: the formatted location string the error belongs to
+        :param message: the human readable message
+        :param exc_info: attach the traceback of the exception currently being handled
+        :return: None
+        """
+        details = format_exc() if exc_info else None
+        if details is not None:
+            key = (location, message, details)
+            now = time()
+            last_time, suppressed = self._tracebacks.get(key, (0, 0))
+            if now - last_time < self._traceback_interval:
+                self._tracebacks[key] = (last_time, suppressed + 1)
+                return
+            self._tracebacks[key] = (now, 0)
+            if suppressed > 0:
+                message += " (" + str(suppressed) + " identical tracebacks suppressed)"
+
+        self.publish(ERROR, location, message, details)
+
+    def _drain(self):
+        """
+        _drain - writer thread, batches whatever is queued and hands it to the sinks
+        :return: None
+        """
+        while True:
+            events = [self._queue.get()]
+            while True:
+                try:
+                    events.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch = [event for event in events if event is not None]
+            if self._dropped > 0:
+                batch.append(Event(INFO, None, str(self._dropped) + " events dropped, queue full"))
+                self._dropped = 0
+
+            for sink in self._sinks:
+                try:
+                    sink.write(batch)
+                except Exception:
+                    pass
+
+            for _ in events:
+                self._queue.task_done()
+
+            if None in events:
+                return
+
+    def flush(self):
+        """
+        flush - blocks until every queued event has been written
+        :return: None
+        """
+        if not self._stopped:
+            self._queue.join()
+
+    def close(self):
+        """
+        close - flushes the queue and stops the writer thread
+        :return: None
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._writer.join()
+        for sink in self._sinks:
+            sink.close()
+
+
+_bus = None
+_bus_pid = None
+
+
+def configure(preferences=None):
+    """
+    configure - creates the event bus for this process from the preferences
+    :param preferences: the preferences to read the sink settings from
+    :return: EventBus: the bus for this process
+    """
+    global _bus, _bus_pid
+
+    if _bus is not None and _bus_pid == getpid():
+        return _bus
+
+    sinks = [ConsoleSink()]
+    traceback_interval = 60
+    if preferences is not None:
+        traceback_interval = preferences.traceback_interval
+        if preferences.log_file is not None:
+            sinks.append(RotatingFileSink(preferences.log_file, preferences.log_max_bytes,
+                                          preferences.log_backup_count))
+        if preferences.notify_url is not None:
+            sinks.append(NotifierSink(preferences.notify_url))
+
+    # A bus inherited from the parent process has no writer thread, replace it
+    _bus = EventBus(sinks=sinks, traceback_interval=traceback_interval)
+    _bus_pid = getpid()
+    return _bus
+
+
+def get_event_bus():
+    """
+    get_event_bus - returns the event bus for this process, creating a console only bus if needed
+    :return: EventBus: the bus for this process
+    """
+    if _bus is None or _bus_pid != getpid():
+        return configure()
+    return _bus
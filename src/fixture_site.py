@@ -0,0 +1,645 @@
+"""
+This module provides a local stand-in for the parts of Recreation.gov the bot uses: the main
+page, campground search, campground availability grid, permit detailed availability and
+the permit quota json endpoints. Openings are injected through a control endpoint and the time until the bot books them is recorded.
+"""
+
+import json
+import threading
+from datetime import date, timedelta
+from html import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import time
+from urllib.parse import urlsplit, parse_qs
+
+
+class FixtureState:
+    """ This class holds the availability of the fixture site and the injected openings. """
+
+    def __init__(self):
+        """
+        __init__ - constructor, the site starts without any facilities or availability
+        """
+        self.lock = threading.Lock()
+        # campground id -> {"park", "name", "page_size", "sites": {site: set of available dates}}
+        self.campgrounds = dict()
+        # permit id -> {"name", "total", "inyo", "entry_points": {entry point: {date: [remaining, total]}}}
+        self.permits = dict()
+        # location key -> number of availability reads
+        self.polls = dict()
+        self.openings = list()
+        self.started = time()
+
+    def add_campground(self, campground_id, park, name, sites, page_size=0):
+        """
+        add_campground - adds a campground whose sites are all booked
+        :param campground_id: the numeric id used in the campground url
+        :param park: the park name
+        :param name: the campground name
+        :param sites: list of site names, e.g. "001"
+        :param page_size: sites per grid page, 0 shows every site on one page
+        :return: None
+        """
+        with self.lock:
+            self.campgrounds[str(campground_id)] = {"park": park, "name": name, "page_size": page_size,
+                                                    "sites": {site: set() for site in sites}}
+
+    def add_permit(self, permit_id, name, entry_points, total=10, inyo=False):
+        """
+        add_permit - adds a permit facility whose entry points have no quota left
+        :param permit_id: the numeric id used in the permit url
+        :param name: the facility name
+        :param entry_points: list of entry point names
+        :param total: the daily quota of every entry point
+        :param inyo: serve the quota on the Inyo endpoint instead of the month endpoint
+        :return: None
+        """
+        with self.lock:
+            self.permits[str(permit_id)] = {"name": name, "total": total, "inyo": inyo,
+                                            "entry_points": {entry_point: dict() for entry_point in entry_points}}
+
+    def count_poll(self, key):
+        with self.lock:
+            self.polls[key] = self.polls.get(key, 0) + 1
+
+    def open_campsite(self, campground_id, site, start, end):
+        """
+        open_campsite - makes a stay available, start through end inclusive so the checkout day is clickable
+        :param campground_id: the campground id
+        :param site: the site name
+        :param start: first night
+        :param end: checkout day
+        :return: None
+        """
+        with self.lock:
+            day = start
+            while day <= end:
+                self.campgrounds[str(campground_id)]["sites"][site].add(day.isoformat())
+                day += timedelta(days=1)
+            self.openings.append({"key": "camp:" + str(campground_id) + ":" + site, "opened": time(),
+                                  "detected": None})
+
+    def open_permit(self, permit_id, entry_point, day, remaining):
+        """
+        open_permit - releases quota for an entry point on a day
+        :param permit_id: the permit facility id
+        :param entry_point: the entry point name
+        :param day: the date
+        :param remaining: the quota released
+        :return: None
+        """
+        with self.lock:
+            permit = self.permits[str(permit_id)]
+            permit["entry_points"][entry_point][day.isoformat()] = [remaining, permit["total"]]
+            self.openings.append({"key": "permit:" + str(permit_id) + ":" + entry_point, "opened": time(),
+                                  "detected": None})
+
+    def book(self, key, booking):
+        """
+        book - records a booking attempt, detecting the oldest opening of the location and closing it
+        :param key: the location key
+        :param booking: the booking details sent by the page
+        :return: None
+        """
+        with self.lock:
+            for opening in self.openings:
+                if opening["key"] == key and opening["detected"] is None:
+                    opening["detected"] = time()
+                    break
+
+            kind, facility_id, item = key.split(":", 2)
+            if kind == "camp":
+                self.campgrounds[facility_id]["sites"][item].clear()
+            else:
+                self.permits[facility_id]["entry_points"][item].clear()
+
+    def stats(self):
+        """
+        stats - the poll counts and openings so far
+        :return: dict: the stats
+        """
+        with self.lock:
+            return {"elapsed": time() - self.started, "polls": dict(self.polls),
+                    "openings": [dict(opening) for opening in self.openings]}
+
+
+def short_date(day):
+    return day.strftime("%b") + " " + str(day.day) + ", " + str(day.year)
+
+
+def input_date(day):
+    return day.strftime("%m/%d/%Y")
+
+
+def parse_param_date(value):
+    try:
+        year, month, day = value.split("-")
+        return date(int(year), int(month), int(day))
+    except (ValueError, AttributeError):
+        return None
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>.rec-grid-row, .row {{ display: flex; }} .cell {{ width: 90px; }} .menu {{ display: none; }}</style>
+</head><body>
+{body}
+</body></html>"""
+
+MAIN_BODY = """
+<button type="button" id="camping-heading"><h3 data-component="Heading" class="h3">Camping &amp; Lodging</h3></button>
+<button type="button" id="permits-heading"><h3 data-component="Heading" class="h3">Permits</h3></button>
+<input id="search" placeholder="Where to?">
+<div id="permit-links">{permit_links}</div>
+<script>
+document.getElementById('search').addEventListener('keydown', function (event) {{
+    if (event.key === 'Enter') {{ window.location = '/search?q=' + encodeURIComponent(this.value); }}
+}});
+</script>"""
+
+SEARCH_BODY = """
+<input id="search" placeholder="Where to?" value="{query}">
+<div id="results">{results}</div>
+<script>
+document.getElementById('search').addEventListener('keydown', function (event) {{
+    if (event.key === 'Enter') {{ window.location = '/search?q=' + encodeURIComponent(this.value); }}
+}});
+</script>"""
+
+CAMPGROUND_BODY = """
+<div id="modal"><button type="button" aria-label="Close modal" onclick="this.parentElement.remove()">x</button></div>
+<h1>{name}</h1>
+<div class="rec-slider-container">
+<div class="filter"><button type="button" id="filter-menu-site-types">Site Type</button>
+<div class="menu">{site_type_options}</div></div>
+<div class="filter"><button type="button" id="filter-menu-equipment">Equipment</button>
+<div class="menu">{equipment_options}</div></div>
+<input id="campground-start-date-calendar" value="{start}">
+<input id="campground-end-date-calendar" value="{end}">
+<input id="campsite-filter-search">
+<button type="button" id="refresh"><span>Refresh Table</span></button>
+<div id="selection-controls"></div>
+<div id="pagination">
+<button type="button" id="dates-previous" aria-label="Previous 14 days">&lt;</button>
+<button type="button" id="dates-next" aria-label="Next 14 days">&gt;</button>
+<button type="button" id="sites-previous" aria-label="Previous page">&lt;</button>
+<button type="button" id="sites-next" aria-label="Next page">&gt;</button>
+</div>
+<div id="grid"></div>
+<div id="prompt"></div>
+</div>
+<script>
+var campgroundId = '{campground_id}';
+var availability = {availability};
+var pageSize = {page_size};
+var sitePage = 0;
+var dayOffset = 0;
+var months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'];
+var selection = {{start: null, end: null}};
+
+function parseInput(id) {{
+    var parts = document.getElementById(id).value.split('/');
+    if (parts.length !== 3) {{ return null; }}
+    var parsed = new Date(parseInt(parts[2]), parseInt(parts[0]) - 1, parseInt(parts[1]));
+    return isNaN(parsed.getTime()) ? null : parsed;
+}}
+function iso(day) {{
+    return day.getFullYear() + '-' + ('0' + (day.getMonth() + 1)).slice(-2) + '-' + ('0' + day.getDate()).slice(-2);
+}}
+function label(day) {{ return months[day.getMonth()] + ' ' + day.getDate() + ', ' + day.getFullYear(); }}
+
+function render() {{
+    var start = parseInput('campground-start-date-calendar') || new Date();
+    var filter = document.getElementById('campsite-filter-search').value.trim();
+    var sites = Object.keys(availability).sort().filter(function (site) {{
+        return !filter || site.indexOf(filter) !== -1;
+    }});
+    var pages = pageSize > 0 ? Math.max(Math.ceil(sites.length / pageSize), 1) : 1;
+    sitePage = Math.min(sitePage, pages - 1);
+    if (pageSize > 0) {{ sites = sites.slice(sitePage * pageSize, (sitePage + 1) * pageSize); }}
+    document.getElementById('sites-previous').disabled = sitePage === 0;
+    document.getElementById('sites-next').disabled = sitePage >= pages - 1;
+    document.getElementById('dates-previous').disabled = dayOffset === 0;
+    var rows = [];
+    sites.forEach(function (site) {{
+        var cells = ['<div class="cell site">Site ' + site + '</div>'];
+        for (var offset = 0; offset < 14; offset++) {{
+            var day = new Date(start.getFullYear(), start.getMonth(), start.getDate() + dayOffset + offset);
+            var open = availability[site].indexOf(iso(day)) !== -1;
+            cells.push('<div class="cell' + (open ? ' available' : '') + '" data-site="' + site + '" data-date="'
+                + iso(day) + '"><button type="button" class="rec-availability-date" aria-label="' + label(day)
+                + ' - Site ' + site + ' is ' + (open ? 'available' : 'unavailable') + '">'
+                + (open ? 'A' : 'R') + '</button></div>');
+        }}
+        rows.push('<div class="row">' + cells.join('') + '</div>');
+    }});
+    document.getElementById('grid').innerHTML = rows.join('');
+    clearSelection();
+}}
+
+function clearSelection() {{
+    selection = {{start: null, end: null}};
+    document.querySelectorAll('#grid .start, #grid .end').forEach(function (cell) {{
+        cell.classList.remove('start'); cell.classList.remove('end');
+    }});
+    document.getElementById('selection-controls').innerHTML = '';
+}}
+
+function showSelectionControls() {{
+    document.getElementById('selection-controls').innerHTML =
+        '<button type="button" id="clear"><span>Clear selection</span></button>'
+        + '<button type="button" id="add-to-cart"><span>Add to Cart</span></button>';
+    document.getElementById('clear').onclick = clearSelection;
+    document.getElementById('add-to-cart').onclick = function () {{
+        fetch('/api/book', {{method: 'POST', body: JSON.stringify({{key: 'camp:' + campgroundId + ':'
+            + selection.start.dataset.site, start: selection.start.dataset.date, end: selection.end.dataset.date}})}});
+        document.getElementById('prompt').innerHTML = '<button type="button" id="close-login"><span>Close Log In</span></button>';
+        document.getElementById('close-login').onclick = function () {{
+            document.getElementById('prompt').innerHTML = '';
+        }};
+    }};
+}}
+
+document.getElementById('grid').addEventListener('click', function (event) {{
+    var cell = event.target.closest('.available');
+    if (!cell) {{ return; }}
+    if (selection.start === null || selection.end !== null || cell.dataset.date <= selection.start.dataset.date) {{
+        clearSelection();
+        selection.start = cell;
+        cell.classList.add('start');
+    }} else {{
+        selection.end = cell;
+        cell.classList.add('end');
+        showSelectionControls();
+    }}
+}});
+
+document.getElementById('refresh').onclick = function () {{
+    fetch('/api/camp/' + campgroundId + '/availability').then(function (response) {{ return response.json(); }})
+        .then(function (data) {{ availability = data; render(); }});
+}};
+document.getElementById('campsite-filter-search').addEventListener('input', function () {{
+    sitePage = 0; dayOffset = 0; render();
+}});
+['campground-start-date-calendar', 'campground-end-date-calendar'].forEach(function (id) {{
+    document.getElementById(id).addEventListener('change', function () {{ dayOffset = 0; render(); }});
+}});
+document.getElementById('sites-previous').onclick = function () {{ sitePage--; render(); }};
+document.getElementById('sites-next').onclick = function () {{ sitePage++; render(); }};
+document.getElementById('dates-previous').onclick = function () {{ dayOffset = Math.max(dayOffset - 14, 0); render(); }};
+document.getElementById('dates-next').onclick = function () {{ dayOffset += 14; render(); }};
+document.querySelectorAll('.filter > button').forEach(function (button) {{
+    button.onclick = function () {{
+        var menu = button.parentElement.querySelector('.menu');
+        menu.style.display = 'block';
+        var apply = document.createElement('button');
+        apply.type = 'button';
+        apply.innerHTML = '<span>Apply</span>';
+        apply.onclick = function () {{ menu.style.display = 'none'; apply.remove(); render(); }};
+        menu.appendChild(apply);
+    }};
+}});
+render();
+</script>"""
+
+PERMIT_BODY = """
+<h1>{name}</h1>
+<select id="permit-type">{permit_type_options}</select>
+<div><input type="radio" name="commercial" id="prompt-answer-yes1"><label>Yes</label>
+<input type="radio" name="commercial" id="prompt-answer-no1"><label>No</label></div>
+<div class="group"><button type="button" aria-label="Add group members">+</button>
+<input id="group-size" value="{group_size}" readonly></div>
+<input id="SingleDatePicker1" value="{selected_date}">
+<button type="button" id="next-available"><span>Next Available</span></button>
+<button type="button" id="filters"><span>Filters</span></button>
+<div id="filter-panel"></div>
+<div id="selection-controls"></div>
+<div id="grid"></div>
+<div id="prompt"></div>
+<script>
+var permitId = '{permit_id}';
+var availability = {availability};
+var total = {total};
+var months = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+              'November', 'December'];
+var filter = '';
+
+function parseInput() {{
+    var parts = document.getElementById('SingleDatePicker1').value.split('/');
+    if (parts.length !== 3) {{ return null; }}
+    var parsed = new Date(parseInt(parts[2]), parseInt(parts[0]) - 1, parseInt(parts[1]));
+    return isNaN(parsed.getTime()) ? null : parsed;
+}}
+function iso(day) {{
+    return day.getFullYear() + '-' + ('0' + (day.getMonth() + 1)).slice(-2) + '-' + ('0' + day.getDate()).slice(-2);
+}}
+
+function render() {{
+    var start = parseInput() || new Date();
+    var rows = [];
+    Object.keys(availability).sort().forEach(function (entryPoint) {{
+        if (filter && entryPoint.toLowerCase().indexOf(filter.toLowerCase()) === -1) {{ return; }}
+        var cells = ['<div class="cell rec-grid-row-label">' + entryPoint + '</div>'];
+        for (var offset = 0; offset < 7; offset++) {{
+            var day = new Date(start.getFullYear(), start.getMonth(), start.getDate() + offset);
+            var quota = availability[entryPoint][iso(day)] || [0, total];
+            cells.push('<div class="cell rec-grid-grid-cell' + (quota[0] > 0 ? ' available' : '')
+                + '" data-entry-point="' + entryPoint + '"><button type="button" aria-label="' + months[day.getMonth()]
+                + ' ' + day.getDate() + '\\n' + quota[0] + ' out of ' + quota[1] + '">' + quota[0] + '</button></div>');
+        }}
+        rows.push('<div class="rec-grid-row">' + cells.join('') + '</div>');
+    }});
+    document.getElementById('grid').innerHTML = rows.join('');
+    document.getElementById('selection-controls').innerHTML = '';
+}}
+
+document.getElementById('grid').addEventListener('click', function (event) {{
+    var cell = event.target.closest('.available');
+    if (!cell) {{ return; }}
+    cell.classList.add('selected');
+    document.getElementById('selection-controls').innerHTML =
+        '<button type="button" id="clear"><span>Clear Dates</span></button>'
+        + '<button type="button" id="book-now"><span>Book Now</span></button>';
+    document.getElementById('clear').onclick = render;
+    document.getElementById('book-now').onclick = function () {{
+        fetch('/api/book', {{method: 'POST', body: JSON.stringify({{key: 'permit:' + permitId + ':'
+            + cell.dataset.entryPoint}})}});
+        document.getElementById('prompt').innerHTML = '<button type="button" id="close-login"><span>Close Log In</span></button>';
+        document.getElementById('close-login').onclick = function () {{
+            document.getElementById('prompt').innerHTML = '';
+        }};
+    }};
+}});
+
+document.querySelector('.group button').onclick = function () {{
+    var field = document.getElementById('group-size');
+    field.value = String(parseInt(field.value || '0') + 1);
+}};
+document.getElementById('SingleDatePicker1').addEventListener('change', render);
+document.getElementById('next-available').onclick = function () {{
+    var dates = [];
+    Object.keys(availability).forEach(function (entryPoint) {{
+        Object.keys(availability[entryPoint]).forEach(function (day) {{
+            if (availability[entryPoint][day][0] > 0) {{ dates.push(day); }}
+        }});
+    }});
+    dates.sort();
+    var next = dates.length > 0 ? dates[0].split('-') : [String(new Date().getFullYear()),
+        ('0' + (new Date().getMonth() + 1)).slice(-2), ('0' + new Date().getDate()).slice(-2)];
+    document.getElementById('SingleDatePicker1').value = next[1] + '/' + next[2] + '/' + next[0];
+    render();
+}};
+document.getElementById('filters').onclick = function () {{
+    document.getElementById('filter-panel').innerHTML = '<input id="division-search-input">';
+    document.getElementById('division-search-input').addEventListener('keydown', function (event) {{
+        if (event.key === 'Enter') {{ filter = this.value.trim(); render(); }}
+    }});
+}};
+render();
+</script>"""
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """ This class serves the fixture pages and the control endpoints. """
+
+    # Keeps connections open between requests like the site does, every response has a Content-Length
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type="text/html", status=200):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type + "; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _page(self, title, body):
+        self._send(PAGE.format(title=escape(title), body=body))
+
+    def do_GET(self):
+        state = self.server.state
+        url = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+
+        if len(parts) == 0:
+            links = "".join('<a href="/permits/' + permit_id + '" title="' + escape(permit["name"]) + '">'
+                            + escape(permit["name"]) + '</a>' for permit_id, permit in state.permits.items())
+            self._page("Recreation.gov fixture", MAIN_BODY.format(permit_links=links))
+        elif parts == ["search"]:
+            self._search(query)
+        elif parts == ["api", "search"]:
+            self._search_api(query)
+        elif len(parts) == 3 and parts[:2] == ["camping", "campgrounds"] and parts[2] in state.campgrounds:
+            self._campground(parts[2], query)
+        elif len(parts) > 2 and parts[0] == "api" and parts[1] in ("permits", "permitinyo", "permitcontent"):
+            self._permit_api(parts, query)
+        elif len(parts) == 4 and parts[0] == "api":
+            self._availability(parts)
+        elif len(parts) == 2 and parts[0] == "permits" and parts[1] in state.permits:
+            self._page(state.permits[parts[1]]["name"], '<a href="/permits/' + parts[1]
+                       + '/registration/detailed-availability">Check availability</a>')
+        elif len(parts) == 4 and parts[0] == "permits" and parts[1] in state.permits \
+                and parts[2:] == ["registration", "detailed-availability"]:
+            self._permit(parts[1], query)
+        elif parts == ["__control", "stats"]:
+            self._send(json.dumps(state.stats()), "application/json")
+        else:
+            self._send("Not found", status=404)
+
+    def _search(self, query):
+        """
+        _search - the matching campgrounds, with an availability label on each when dates are given
+        """
+        state = self.server.state
+        search = query.get("q", "").lower()
+        start = parse_param_date(query.get("start_date"))
+        end = parse_param_date(query.get("end_date"))
+        results = list()
+        with state.lock:
+            for campground_id, campground in state.campgrounds.items():
+                if search not in campground["name"].lower() and search not in campground["park"].lower():
+                    continue
+                label = ""
+                if start is not None and end is not None:
+                    state.polls["region:" + campground_id] = state.polls.get("region:" + campground_id, 0) + 1
+                    available = any(start.isoformat() in dates and end.isoformat() in dates
+                                    for dates in campground["sites"].values())
+                    label = '<span class="availability">' + ("Available" if available else "Not Available") \
+                            + '</span>'
+                results.append('<div class="search-result-card"><a href="/camping/campgrounds/' + campground_id
+                               + '" title="' + escape(campground["name"]) + '">' + escape(campground["name"])
+                               + '</a>' + label + '</div>')
+        self._page("Search", SEARCH_BODY.format(query=escape(query.get("q", "")), results="".join(results)))
+
+    def _search_api(self, query):
+        """
+        _search_api - the campgrounds and permits whose name or park contains the query, as json
+        """
+        state = self.server.state
+        search = query.get("q", "").lower()
+        entity_type = query.get("entity_type")
+        results = list()
+        with state.lock:
+            for campground_id, campground in state.campgrounds.items():
+                if search in campground["name"].lower() or search in campground["park"].lower():
+                    results.append({"entity_id": campground_id, "entity_type": "campground",
+                                    "name": campground["name"], "parent_name": campground["park"]})
+            for permit_id, permit in state.permits.items():
+                if search in permit["name"].lower():
+                    results.append({"entity_id": permit_id, "entity_type": "permit", "name": permit["name"],
+                                    "parent_name": ""})
+        results = [result for result in results if entity_type is None or result["entity_type"] == entity_type]
+        self._send(json.dumps({"results": results, "total": len(results)}), "application/json")
+
+    def _campground(self, campground_id, query):
+        state = self.server.state
+        campground = state.campgrounds[campground_id]
+        start = parse_param_date(query.get("startDate"))
+        end = parse_param_date(query.get("endDate"))
+        site_types = query.get("siteTypes", "").split(",")
+        equipment = query.get("equipment", "").split(",")
+
+        def options(names, checked):
+            return "".join('<label class="filter-menu-checkbox-item"><input type="checkbox"'
+                           + (' checked' if name.split()[0].lower() in checked else '') + '> ' + name + '</label>'
+                           for name in names)
+
+        with state.lock:
+            availability = {site: sorted(dates) for site, dates in campground["sites"].items()}
+        self._page(campground["name"], CAMPGROUND_BODY.format(
+            name=escape(campground["name"]), campground_id=campground_id,
+            start=input_date(start) if start else "", end=input_date(end) if end else "",
+            site_type_options=options(["Standard Nonelectric", "Group Standard", "Tent Only"], site_types),
+            equipment_options=options(["Tent", "RV", "Trailer"], equipment),
+            availability=json.dumps(availability), page_size=campground["page_size"]))
+
+    def _availability(self, parts):
+        state = self.server.state
+        # /api/camp/<id>/availability
+        if parts[1] == "camp" and parts[2] in state.campgrounds:
+            campground = state.campgrounds[parts[2]]
+            for site in campground["sites"]:
+                state.count_poll("camp:" + parts[2] + ":" + site)
+            with state.lock:
+                availability = {site: sorted(dates) for site, dates in campground["sites"].items()}
+            self._send(json.dumps(availability), "application/json")
+        else:
+            self._send("Not found", status=404)
+
+    def _permit_api(self, parts, query):
+        """
+        _permit_api - the permit content and quota payloads, the divisions are numbered in entry point order
+        """
+        state = self.server.state
+        permit_id = parts[2]
+        if permit_id not in state.permits:
+            self._send("Not found", status=404)
+            return
+        permit = state.permits[permit_id]
+        with state.lock:
+            divisions = {str(index + 1): (entry_point, dict(days))
+                         for index, (entry_point, days) in enumerate(permit["entry_points"].items())}
+
+        if parts[1] == "permitcontent" and len(parts) == 3:
+            payload = {"id": permit_id, "name": permit["name"],
+                       "divisions": {division_id: {"id": division_id, "name": entry_point, "code": division_id,
+                                                   "type": "Entry Point"}
+                                     for division_id, (entry_point, days) in divisions.items()}}
+        elif parts[1] == "permits" and parts[3:] == ["availability", "month"] and not permit["inyo"]:
+            month = query.get("start_date", "")[:7]
+            payload = {"permit_id": permit_id, "availability": {
+                division_id: {"division_id": division_id, "date_availability": {
+                    day + "T00:00:00Z": {"total": quota[1], "remaining": quota[0], "show_walkup": False,
+                                         "is_secret_quota": False}
+                    for day, quota in days.items() if day.startswith(month)}}
+                for division_id, (entry_point, days) in divisions.items()}}
+        elif parts[1] == "permitinyo" and parts[3:] == ["availabilityv2"] and permit["inyo"]:
+            start = query.get("start_date", "")
+            end = query.get("end_date", "9999")
+            payload = dict()
+            for division_id, (entry_point, days) in divisions.items():
+                for day, quota in days.items():
+                    if start <= day <= end:
+                        payload.setdefault(day, dict())[division_id] = {"total": quota[1], "remaining": quota[0],
+                                                                        "is_walkup": False}
+        else:
+            self._send("Not found", status=404)
+            return
+
+        if parts[1] != "permitcontent":
+            for entry_point, days in divisions.values():
+                state.count_poll("permit:" + permit_id + ":" + entry_point)
+        self._send(json.dumps({"payload": payload}), "application/json")
+
+    def _permit(self, permit_id, query):
+        state = self.server.state
+        permit = state.permits[permit_id]
+        for entry_point in permit["entry_points"]:
+            state.count_poll("permit:" + permit_id + ":" + entry_point)
+
+        selected = parse_param_date(query.get("date"))
+        permit_type = query.get("type", "").lower()
+        permit_type_options = "".join('<option' + (' selected' if name.lower() == permit_type else '') + '>'
+                                      + name + '</option>' for name in ["Overnight", "Day Use"])
+        with state.lock:
+            availability = {entry_point: dict(days) for entry_point, days in permit["entry_points"].items()}
+        self._page(permit["name"], PERMIT_BODY.format(
+            name=escape(permit["name"]), permit_id=permit_id, permit_type_options=permit_type_options,
+            group_size=escape(query.get("groupSize", "0")),
+            selected_date=input_date(selected) if selected else "",
+            availability=json.dumps(availability), total=permit["total"]))
+
+    def do_POST(self):
+        state = self.server.state
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        url = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        if url.path == "/api/book":
+            state.book(body["key"], body)
+            self._send("{}", "application/json")
+        elif url.path == "/__control/open":
+            if query["kind"] == "camp":
+                state.open_campsite(query["id"], query["item"], parse_param_date(query["start"]),
+                                    parse_param_date(query["end"]))
+            else:
+                state.open_permit(query["id"], query["item"], parse_param_date(query["start"]),
+                                  int(query.get("remaining", 4)))
+            self._send("{}", "application/json")
+        else:
+            self._send("Not found", status=404)
+
+
+class FixtureSite:
+    """ This class runs the fixture site on a background thread. """
+
+    def __init__(self, state=None, host="127.0.0.1", port=0):
+        """
+        __init__ - constructor
+        :param state: the FixtureState to serve, a new empty one if None
+        :param host: the address to bind
+        :param port: the port to bind, 0 picks a free port
+        """
+        self.state = state if state is not None else FixtureState()
+        self._server = ThreadingHTTPServer((host, port), FixtureHandler)
+        self._server.daemon_threads = True
+        self._server.state = self.state
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://" + self._server.server_address[0] + ":" + str(self._server.server_address[1]) + "/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fixture-site", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
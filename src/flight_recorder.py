@@ -0,0 +1,212 @@
+"""
+This module provides the flight recorder. The last few poll iterations of each location are
+kept in memory: a compact snapshot of the grid, the timing of every WebDriver command and the
+decisions the flow made. Nothing is written while polling goes well, the iterations are only
+written out when an iteration fails or books.
+
+    python3 -m src.flight_recorder flights
+
+prints the iteration timeline of the newest recording, or of the recording file given.
+"""
+
+import argparse
+import json
+from collections import deque
+from os import getpid, listdir, makedirs, path
+from re import sub
+from time import monotonic, time, strftime, localtime
+
+# Commands and decisions kept per iteration, a stuck loop can not grow a frame past these
+MAX_COMMANDS = 500
+MAX_DECISIONS = 100
+# Recordings written per location, a failure that repeats every iteration does not fill the disk
+MAX_DUMPS = 20
+
+# One line per grid row, one letter per cell: A available, R reserved, S selected
+SNAPSHOT_SCRIPT = """
+var limit = arguments[0];
+var rows = [];
+var current = null;
+document.querySelectorAll('.rec-availability-date, .rec-grid-grid-cell').forEach(function (cell) {
+    if (cell.classList.contains('rec-grid-grid-cell') && cell.querySelector('.rec-availability-date')) { return; }
+    var row = cell.closest('.rec-grid-row, .row, tr') || cell.parentElement;
+    if (current === null || current.row !== row) {
+        var label = (row.firstElementChild ? row.firstElementChild.innerText : '') || '';
+        current = {row: row, text: label.trim().split('\\n')[0].slice(0, 40) + ': '};
+        rows.push(current);
+    }
+    var state = cell.closest('.start, .end') ? 'S' : (cell.closest('.available') ? 'A' : 'R');
+    current.text += state;
+});
+var snapshot = location.href + '\\n' + rows.map(function (row) { return row.text; }).join('\\n');
+return snapshot.length > limit ? snapshot.slice(0, limit) + '...' : snapshot;
+"""
+
+# The recorder of the location polling in this process, commands are timed into it
+_active = None
+
+
+def activate(recorder):
+    """
+    activate - directs the command timings of this process to a recorder, set at the start of each iteration
+    :param recorder: the FlightRecorder, None to stop recording commands
+    :return: None
+    """
+    global _active
+    _active = recorder
+
+
+def instrument(driver):
+    """
+    instrument - times every command the driver sends, elements send theirs through the driver as well
+    :param driver: the chrome driver
+    :return: None
+    """
+    if getattr(driver, "_flight_instrumented", False):
+        return
+    execute = driver.execute
+
+    def timed_execute(driver_command, params=None):
+        started = monotonic()
+        try:
+            return execute(driver_command, params)
+        finally:
+            if _active is not None:
+                _active.command(driver_command, started, monotonic() - started)
+
+    driver.execute = timed_execute
+    driver._flight_instrumented = True
+
+
+class FlightRecorder:
+    """ This class keeps the last iterations of one location in a bounded ring buffer. """
+
+    def __init__(self, location_str, capacity=10, max_kb=512, directory="flights"):
+        """
+        __init__ - constructor
+        :param location_str: the formatted location string
+        :param capacity: iterations kept
+        :param max_kb: memory the grid snapshots may use in total, split evenly over the iterations, 0 for none
+        :param directory: where the recordings are written
+        """
+        self._location_str = location_str
+        self._frames = deque(maxlen=capacity)
+        self._snapshot_chars = max(max_kb * 1024 // max(capacity, 1), 256) if max_kb > 0 else 0
+        self._directory = directory
+        self._frame = None
+        self._dumps = 0
+
+    def begin(self, iteration):
+        """
+        begin - starts the frame of an iteration, the oldest frame drops out once the buffer is full
+        :param iteration: the current refresh try
+        :return: None
+        """
+        self._frame = {"iteration": iteration, "started": time(), "start": monotonic(), "seconds": None,
+                       "commands": list(), "dropped_commands": 0, "decisions": list(), "snapshot": None}
+        self._frames.append(self._frame)
+        activate(self)
+
+    def command(self, name, started, seconds):
+        frame = self._frame
+        if frame is None:
+            return
+        if len(frame["commands"]) >= MAX_COMMANDS:
+            frame["dropped_commands"] += 1
+            return
+        frame["commands"].append((started - frame["start"], name, seconds))
+
+    def decision(self, text):
+        frame = self._frame
+        if frame is not None and len(frame["decisions"]) < MAX_DECISIONS:
+            frame["decisions"].append((monotonic() - frame["start"], text))
+
+    def end(self, driver):
+        """
+        end - snapshots the grid into the frame and closes it
+        :param driver: the chrome driver, read with one script call
+        :return: None
+        """
+        frame = self._frame
+        if frame is None:
+            return
+        if self._snapshot_chars > 0:
+            try:
+                frame["snapshot"] = driver.execute_script(SNAPSHOT_SCRIPT, self._snapshot_chars)
+            except Exception:
+                frame["snapshot"] = None
+        frame["seconds"] = monotonic() - frame["start"]
+
+    def dump(self, reason, details=None):
+        """
+        dump - writes the buffered iterations out and starts over with an empty buffer
+        :param reason: why, e.g. booked or the failing method
+        :param details: the traceback, if any
+        :return: str: the recording path, None if nothing was written
+        """
+        if len(self._frames) == 0 or self._dumps >= MAX_DUMPS:
+            return None
+        self._dumps += 1
+        makedirs(self._directory, exist_ok=True)
+        name = sub("[^A-Za-z0-9]+", "_", self._location_str).strip("_")[:60]
+        recording = path.join(self._directory, name + "_" + str(getpid()) + "_"
+                              + strftime("%Y%m%d_%H%M%S", localtime()) + "_" + str(self._dumps) + ".json")
+        frames = [{key: value for key, value in frame.items() if key != "start"} for frame in self._frames]
+        with open(recording, "w") as recording_file:
+            json.dump({"location": self._location_str, "pid": getpid(), "reason": reason, "details": details,
+                       "dumped": time(), "frames": frames}, recording_file)
+        self._frames.clear()
+        self._frame = None
+        return recording
+
+
+def timeline(recording, commands=True):
+    """
+    timeline - rebuilds the iteration timeline of a recording
+    :param recording: the decoded recording
+    :param commands: include every WebDriver command, False for only the decisions and the slow commands
+    :return: list: the lines
+    """
+    lines = [recording["location"] + " (pid " + str(recording["pid"]) + "), written "
+             + strftime("%Y-%m-%d %H:%M:%S", localtime(recording["dumped"])) + " because " + recording["reason"]]
+    for frame in recording["frames"]:
+        seconds = frame["seconds"]
+        lines.append("")
+        lines.append("#" + str(frame["iteration"]) + " at " + strftime("%H:%M:%S", localtime(frame["started"]))
+                     + ", " + ("%.3fs" % seconds if seconds is not None else "did not finish") + ", "
+                     + str(len(frame["commands"]) + frame["dropped_commands"]) + " command(s)")
+        entries = [(offset, "  decision " + text) for offset, text in frame["decisions"]]
+        entries += [(offset, "  " + name + " " + "%.3fs" % took) for offset, name, took in frame["commands"]
+                    if commands or took >= 0.5]
+        for offset, text in sorted(entries, key=lambda entry: entry[0]):
+            lines.append("  +" + "%.3f" % offset + "s" + text)
+        if frame["dropped_commands"] > 0:
+            lines.append("  ... " + str(frame["dropped_commands"]) + " more command(s) not kept")
+        if frame["snapshot"]:
+            lines.extend("    | " + line for line in frame["snapshot"].split("\n"))
+    if recording.get("details"):
+        lines.append("")
+        lines.append(recording["details"].rstrip())
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prints the iteration timeline of a flight recording")
+    parser.add_argument("recording", nargs="?", default="flights",
+                        help="a recording file, or a directory to print the newest recording of")
+    parser.add_argument("--decisions-only", action="store_true",
+                        help="leave out the WebDriver commands faster than 0.5s")
+    arguments = parser.parse_args()
+
+    recording = arguments.recording
+    if path.isdir(recording):
+        recordings = [path.join(recording, name) for name in listdir(recording) if name.endswith(".json")]
+        if len(recordings) == 0:
+            print("No recordings in " + recording)
+            return
+        recording = max(recordings, key=path.getmtime)
+    with open(recording, "r") as recording_file:
+        print("\n".join(timeline(json.load(recording_file), not arguments.decisions_only)))
+
+if __name__ == '__main__':
+    main()
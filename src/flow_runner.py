@@ -0,0 +1,171 @@
+"""
+This module provides the step machine the camp and permit flows run on. Each step is
+retried in the same browser, a step that keeps failing goes back to the last good
+checkpoint, and a watchdog ends a browser whose step or poll iteration stalls.
+"""
+
+import threading
+from time import monotonic
+
+
+class WorkerStalledException(Exception):
+    pass
+
+
+class FlowStep:
+    """ This class describes one step of a flow. """
+
+    def __init__(self, name, action, timeout=None, retries=2, resume=None):
+        """
+        __init__ - constructor
+        :param name: the step name, e.g. navigate, login, locate, configure, poll
+        :param action: callable running the step, the return value of the last step is the flow result
+        :param timeout: seconds the watchdog allows the step, None leaves the step to arm the watchdog itself
+        :param retries: times the step is run again in place before going back to the resume step
+        :param resume: name of the checkpoint to go back to when the retries are used up, None to give up
+        """
+        self.name = name
+        self.action = action
+        self.timeout = timeout
+        self.retries = retries
+        self.resume = resume
+
+
+class Watchdog:
+    """ This class ends a stalled browser so its blocked driver call fails and the worker can be restarted. """
+
+    def __init__(self, on_stall, events, location_str, interval=1.0):
+        """
+        __init__ - constructor, the watchdog starts disarmed
+        :param on_stall: callable run once from the watchdog thread when the armed timeout passes
+        :param events: the event bus
+        :param location_str: formatted location(s) of the worker
+        :param interval: seconds between checks
+        """
+        self._on_stall = on_stall
+        self._events = events
+        self._location_str = location_str
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._name = None
+        self._timeout = None
+        self._last_beat = monotonic()
+        self._stopped = threading.Event()
+        self.stalled = False
+        self._thread = threading.Thread(target=self._watch, name="watchdog", daemon=True)
+        self._thread.start()
+
+    def arm(self, name, timeout):
+        """
+        arm - starts timing a step, a timeout of None disarms the watchdog
+        :param name: the step name, used in the stall message
+        :param timeout: seconds without a beat before the worker is considered stalled
+        :return: None
+        """
+        with self._lock:
+            self._name = name
+            self._timeout = timeout
+            self._last_beat = monotonic()
+
+    def beat(self):
+        """
+        beat - records progress, e.g. a finished poll iteration
+        :return: None
+        """
+        with self._lock:
+            self._last_beat = monotonic()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _watch(self):
+        while not self._stopped.wait(self._interval):
+            with self._lock:
+                if self._timeout is None or monotonic() - self._last_beat < self._timeout:
+                    continue
+                name, timeout = self._name, self._timeout
+                self._timeout = None
+                self.stalled = True
+
+            self._events.info(self._location_str, "Watchdog: " + name + " made no progress for "
+                              + str(timeout) + "s, restarting the browser")
+            try:
+                self._on_stall()
+            except Exception:
+                self._events.error(self._location_str, "Watchdog._watch() failed to end the browser")
+
+
+class FlowRunner:
+    """ This class runs flow steps in order, retrying and resuming from checkpoints. """
+
+    def __init__(self, steps, location_str, events, watchdog=None, terminal=(), max_recoveries=10):
+        """
+        __init__ - constructor
+        :param steps: list of FlowStep in order
+        :param location_str: formatted location of the flow
+        :param events: the event bus
+        :param watchdog: the Watchdog of the worker, None to run without one
+        :param terminal: exception types that end the flow without a retry
+        :param max_recoveries: most retries and resumes over the whole run
+        """
+        self._steps = steps
+        self._location_str = location_str
+        self._events = events
+        self._watchdog = watchdog
+        self._terminal = terminal
+        self._max_recoveries = max_recoveries
+        self.checkpoint = None
+
+    def _index(self, name):
+        for index, step in enumerate(self._steps):
+            if step.name == name:
+                return index
+        return None
+
+    def run(self):
+        """
+        run - runs the steps until the last one returns
+        :return: the return value of the last step
+        """
+        index = 0
+        attempts = 0
+        recoveries = 0
+        while True:
+            step = self._steps[index]
+            if self._watchdog is not None:
+                self._watchdog.arm(step.name, step.timeout)
+            try:
+                result = step.action()
+            except self._terminal:
+                raise
+            except Exception as e:
+                if self._watchdog is not None and self._watchdog.stalled:
+                    raise WorkerStalledException(self._location_str + ": " + step.name + " stalled")
+                if recoveries >= self._max_recoveries:
+                    raise e
+
+                recoveries += 1
+                if attempts < step.retries:
+                    attempts += 1
+                    self._events.error(self._location_str, "Step " + step.name + " failed, retry "
+                                       + str(attempts) + " of " + str(step.retries))
+                    continue
+                # The checkpoint may not be part of this run, e.g. navigate when only recovering the grid
+                resume = self._index(step.resume) if step.resume is not None else None
+                if resume is None:
+                    raise e
+
+                self._events.error(self._location_str, "Step " + step.name + " failed "
+                                   + str(attempts + 1) + " times, resuming from " + step.resume)
+                index = resume
+                attempts = 0
+                continue
+            finally:
+                if self._watchdog is not None:
+                    self._watchdog.arm(step.name, None)
+
+            self.checkpoint = step.name
+            attempts = 0
+            if index == len(self._steps) - 1:
+                return result
+            index += 1
@@ -0,0 +1,226 @@
+"""
+This module provides the availability grid sweep. Large campgrounds split the grid into
+site pages and date windows, the sweep turns through every site page and every date window
+of the stay, reads each page with one script call and merges the pages into one view of the
+whole campground.
+"""
+
+from datetime import timedelta
+from time import monotonic
+
+# Every cell of the page and the state of its pagination controls, in one call
+PAGE_SCRIPT = """
+var controls = arguments[0];
+function enabled(selector) {
+    var button = document.querySelector(selector);
+    return button !== null && !button.disabled && button.getAttribute('aria-disabled') !== 'true';
+}
+function iso(day) {
+    return day.getFullYear() + '-' + ('0' + (day.getMonth() + 1)).slice(-2) + '-' + ('0' + day.getDate()).slice(-2);
+}
+var cells = [];
+var labels = [];
+document.querySelectorAll('.rec-availability-date').forEach(function (button) {
+    var label = button.getAttribute('aria-label') || '';
+    var site = /site\\s+([^\\s]+)/i.exec(label);
+    var day = new Date(label.split(' - ')[0]);
+    if (site === null || isNaN(day.getTime())) { return; }
+    labels.push(label);
+    var cell = button.closest('.available');
+    cells.push([site[1], iso(day), cell !== null]);
+});
+return {signature: labels.length + '|' + (labels[0] || '') + '|' + (labels[labels.length - 1] || ''),
+        cells: cells,
+        sites: {previous: enabled(controls.site_previous), next: enabled(controls.site_next)},
+        dates: {previous: enabled(controls.date_previous), next: enabled(controls.date_next)}};
+"""
+
+SIGNATURE_SCRIPT = """
+var labels = Array.prototype.map.call(document.querySelectorAll('.rec-availability-date'),
+    function (button) { return button.getAttribute('aria-label') || ''; });
+return labels.length + '|' + (labels[0] || '') + '|' + (labels[labels.length - 1] || '');
+"""
+
+CLICK_SCRIPT = "var button = document.querySelector(arguments[0]); if (button !== null) { button.click(); }"
+
+# The pagination controls of the grid
+CONTROLS = {
+    "site_previous": "button[aria-label*='previous page' i]",
+    "site_next": "button[aria-label*='next page' i]",
+    "date_previous": "button[aria-label*='previous' i][aria-label*='days' i]",
+    "date_next": "button[aria-label*='next' i][aria-label*='days' i]",
+}
+
+
+class GridView:
+    """ This class is the merged availability of every page read in one sweep. """
+
+    def __init__(self):
+        # site -> {iso date: available}
+        self.sites = dict()
+        self.pages = 0
+        self.seconds = 0.0
+
+    def merge(self, cells):
+        """
+        merge - adds the cells of one page
+        :param cells: list of [site, iso date, available]
+        :return: set: the dates the page showed
+        """
+        self.pages += 1
+        dates = set()
+        for site, day, available in cells:
+            self.sites.setdefault(site, dict())[day] = available
+            dates.add(day)
+        return dates
+
+    def open_sites(self, start, end):
+        """
+        open_sites - the sites available on every day from start through end, so both dates can be selected
+        :param start: the first night
+        :param end: the checkout day
+        :return: list: the site names in grid order
+        """
+        days = GridView.days(start, end)
+        return [site for site, availability in self.sites.items()
+                if all(availability.get(day, False) for day in days)]
+
+    @staticmethod
+    def days(start, end):
+        return [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
+
+
+class GridSweep:
+    """ This class turns through the pages of the availability grid. """
+
+    def __init__(self, driver, waits, throttle=None):
+        """
+        __init__ - constructor
+        :param driver: the chrome driver
+        :param waits: the WaitStrategy of the tab
+        :param throttle: callable run before each page turn, e.g. RecGov.throttle
+        """
+        self._driver = driver
+        self._waits = waits
+        self._throttle = throttle
+        self.sweeps = 0
+        self.total_seconds = 0.0
+        self.total_pages = 0
+
+    def replace_driver(self, driver, waits):
+        """
+        replace_driver - continues in the browser the watchdog restarted, the sweep totals are kept
+        :param driver: the new chrome driver
+        :param waits: the WaitStrategy of the new driver
+        :return: None
+        """
+        self._driver = driver
+        self._waits = waits
+
+    def _read(self):
+        return self._driver.execute_script(PAGE_SCRIPT, CONTROLS)
+
+    def _turn(self, control, page):
+        """
+        _turn - clicks a pagination control and waits for the grid to show another page
+        :param control: the CONTROLS key
+        :param page: the page read before the click
+        :return: dict: the new page, the same page if the grid did not change before the wait ceiling
+        """
+        if self._throttle is not None:
+            self._throttle()
+        self._driver.execute_script(CLICK_SCRIPT, CONTROLS[control])
+        if not self._waits.until("GridSweep._turn()",
+                                 lambda driver: driver.execute_script(SIGNATURE_SCRIPT) != page["signature"]):
+            # The control only looked enabled, the callers stop turning on an unchanged page
+            return page
+        return self._read()
+
+    def _cover_dates(self, page, view, days):
+        """
+        _cover_dates - reads the date windows of the current site page until every day of the stay was shown,
+        moving from wherever the window is so the sweep does not rewind between site pages
+        :return: dict: the last page read
+        """
+        seen = view.merge(page["cells"])
+        while True:
+            missing = [day for day in days if day not in seen]
+            if len(missing) == 0 or len(seen) == 0:
+                return page
+            if missing[0] > max(seen) and page["dates"]["next"]:
+                page = self._turn("date_next", page)
+            elif missing[0] < min(seen) and page["dates"]["previous"]:
+                page = self._turn("date_previous", page)
+            else:
+                return page
+            shown = view.merge(page["cells"])
+            if shown <= seen:
+                # The window did not move on, e.g. the control only looked enabled
+                return page
+            seen |= shown
+
+    def sweep(self, start, end):
+        """
+        sweep - reads every site page over every date window of the stay, turning the site pages
+        forward or back from wherever the grid is
+        :param start: the first night
+        :param end: the checkout day
+        :return: GridView: the merged availability, timed
+        """
+        started = monotonic()
+        view = GridView()
+        days = GridView.days(start, end)
+        page = self._read()
+        if page["sites"]["previous"] and page["sites"]["next"]:
+            # Left in the middle, e.g. by a booking attempt, start over from the first page
+            while page["sites"]["previous"]:
+                turned = self._turn("site_previous", page)
+                if turned["signature"] == page["signature"]:
+                    break
+                page = turned
+        direction = "next" if not page["sites"]["previous"] else "previous"
+
+        page = self._cover_dates(page, view, days)
+        while page["sites"][direction]:
+            turned = self._turn("site_" + direction, page)
+            if turned["signature"] == page["signature"]:
+                # The control looked enabled but the grid stayed on the page
+                break
+            page = self._cover_dates(turned, view, days)
+
+        view.seconds = monotonic() - started
+        self.sweeps += 1
+        self.total_seconds += view.seconds
+        self.total_pages += view.pages
+        return view
+
+    def focus(self, day):
+        """
+        focus - turns the date window until it shows a day, before a site is booked from the grid
+        :param day: the date
+        :return: None
+        """
+        target = day.isoformat()
+        page = self._read()
+        for turn in range(366):
+            shown = [cell[1] for cell in page["cells"]]
+            if len(shown) == 0 or min(shown) <= target <= max(shown):
+                return
+            control = "date_next" if target > max(shown) else "date_previous"
+            if not page["dates"][control.split("_")[1]]:
+                return
+            turned = self._turn(control, page)
+            if turned["signature"] == page["signature"]:
+                return
+            page = turned
+
+    def summary(self):
+        """
+        summary - the sweep cost for the stopping message
+        :return: str: the summary
+        """
+        if self.sweeps == 0:
+            return ""
+        return ", " + str(self.sweeps) + " grid sweep(s) averaging " \
+               + "%.2f" % (self.total_seconds / self.sweeps) + "s over " \
+               + "%.1f" % (self.total_pages / float(self.sweeps)) + " page(s)"
@@ -0,0 +1,213 @@
+"""
+This module provides a local stand-in for a WebDriver hub, used to try the remote backend
+without a grid. It starts chromedriver nodes on this host, or uses the given node urls,
+and routes each session to the node it was created on.
+
+    python3 -m src.hub_standin --nodes 2 --capacity 4 --port 4444
+
+then set `driver_backend, remote` and `driver_hubs, http://127.0.0.1:4444/wd/hub`.
+"""
+
+import argparse
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError, URLError
+
+HUB_PATH = "/wd/hub"
+
+
+class HubHandler(BaseHTTPRequestHandler):
+    """ This class forwards the WebDriver commands to the node of their session. """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, error, message):
+        self._send(status, json.dumps({"value": {"error": error, "message": message}}).encode("utf-8"))
+
+    def _forward(self, node, command_path, body):
+        """
+        _forward - sends the command to the node
+        :return: (status, response body)
+        """
+        request = Request(node + command_path, data=body, method=self.command,
+                          headers={"Content-Type": "application/json; charset=utf-8"})
+        try:
+            with urlopen(request) as response:
+                return response.status, response.read()
+        except HTTPError as e:
+            return e.code, e.read()
+
+    def _handle(self):
+        hub = self.server.hub
+        if not self.path.startswith(HUB_PATH):
+            self._error(404, "unknown command", "Not a hub url: " + self.path)
+            return
+
+        command_path = self.path[len(HUB_PATH):]
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length > 0 else None
+        parts = [part for part in command_path.split("/") if part]
+
+        if parts == ["status"]:
+            self._send(200, json.dumps({"value": {"ready": hub.free() > 0, "message": str(hub.free())
+                                                  + " free session slot(s)"}}).encode("utf-8"))
+            return
+
+        if parts == ["session"] and self.command == "POST":
+            node = hub.reserve()
+            if node is None:
+                self._error(500, "session not created", "All nodes are at capacity")
+                return
+            try:
+                status, response = self._forward(node, command_path, body)
+            except URLError as e:
+                hub.release_node(node)
+                self._error(500, "session not created", "Node " + node + " is down: " + str(e))
+                return
+            if status != 200:
+                hub.release_node(node)
+                self._send(status, response)
+                return
+
+            value = json.loads(response.decode("utf-8"))
+            # W3C responses nest the id in value, the older protocol has it at the top
+            session_id = value.get("sessionId") or value.get("value", {}).get("sessionId")
+            hub.bind(session_id, node)
+            self._send(status, response)
+            return
+
+        if len(parts) < 2 or parts[0] != "session" or hub.node_of(parts[1]) is None:
+            self._error(404, "invalid session id", "Unknown session: " + command_path)
+            return
+
+        session_id = parts[1]
+        try:
+            status, response = self._forward(hub.node_of(session_id), command_path, body)
+        except URLError as e:
+            hub.unbind(session_id)
+            self._error(500, "unknown error", "Node is down: " + str(e))
+            return
+        if len(parts) == 2 and self.command == "DELETE":
+            hub.unbind(session_id)
+        self._send(status, response)
+
+    do_GET = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+
+
+class HubStandIn:
+    """ This class tracks the sessions per node and serves the hub on a background thread. """
+
+    def __init__(self, nodes, capacity=1, host="127.0.0.1", port=4444):
+        """
+        __init__ - constructor
+        :param nodes: list of node urls, e.g. the service_url of a chromedriver Service
+        :param capacity: sessions per node at once
+        :param host: the address to bind
+        :param port: the port to bind, 0 picks a free port
+        """
+        self._nodes = nodes
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        # node url -> open sessions
+        self._load = {node: 0 for node in nodes}
+        self._sessions = dict()
+        self._next = 0
+        self._server = ThreadingHTTPServer((host, port), HubHandler)
+        self._server.daemon_threads = True
+        self._server.hub = self
+
+    @property
+    def url(self):
+        return "http://" + self._server.server_address[0] + ":" + str(self._server.server_address[1]) + HUB_PATH
+
+    def free(self):
+        with self._lock:
+            return sum(self._capacity - load for load in self._load.values())
+
+    def reserve(self):
+        """
+        reserve - takes a slot on the next node with room, round robin
+        :return: str: the node url, None if every node is full
+        """
+        with self._lock:
+            for offset in range(len(self._nodes)):
+                node = self._nodes[(self._next + offset) % len(self._nodes)]
+                if self._load[node] < self._capacity:
+                    self._load[node] += 1
+                    self._next = (self._next + offset + 1) % len(self._nodes)
+                    return node
+        return None
+
+    def release_node(self, node):
+        with self._lock:
+            self._load[node] = max(self._load[node] - 1, 0)
+
+    def bind(self, session_id, node):
+        with self._lock:
+            self._sessions[session_id] = node
+
+    def unbind(self, session_id):
+        with self._lock:
+            node = self._sessions.pop(session_id, None)
+        if node is not None:
+            self.release_node(node)
+
+    def node_of(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def serve(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local WebDriver hub stand-in for the remote backend")
+    parser.add_argument("--nodes", type=int, default=1, help="chromedriver nodes to start on this host")
+    parser.add_argument("--node-url", action="append", default=[],
+                        help="url of an already running node, used instead of starting nodes")
+    parser.add_argument("--capacity", type=int, default=4, help="sessions per node at once")
+    parser.add_argument("--port", type=int, default=4444)
+    arguments = parser.parse_args()
+
+    services = list()
+    nodes = arguments.node_url
+    if len(nodes) == 0:
+        # Imported here so the hub can route to existing nodes without selenium installed
+        from selenium.webdriver.chrome.service import Service
+        from src.driver_backend import chromedriver_path
+        for index in range(arguments.nodes):
+            service = Service(chromedriver_path())
+            service.start()
+            services.append(service)
+            nodes.append(service.service_url)
+
+    hub = HubStandIn(nodes, arguments.capacity, port=arguments.port)
+    print("Hub stand-in at " + hub.url + " with " + str(len(nodes)) + " node(s), "
+          + str(arguments.capacity) + " session(s) each")
+    try:
+        hub.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hub.stop()
+        for service in services:
+            service.stop()
+
+if __name__ == '__main__':
+    main()
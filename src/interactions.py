@@ -0,0 +1,148 @@
+"""
+This module provides the fast interaction layer. Clicks and input values are dispatched
+from a single script call instead of one driver round trip per event. Every fast
+interaction is checked against the page and redone with native events when it did not take.
+"""
+
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.common.action_chains import ActionChains
+
+# Pointer and mouse events before the click, for widgets that select on mousedown
+CLICK_SCRIPT = """
+var elements = arguments[0];
+for (var i = 0; i < elements.length; i++) {
+    var element = elements[i];
+    element.scrollIntoView({block: 'center'});
+    ['pointerdown', 'mousedown', 'pointerup', 'mouseup'].forEach(function (type) {
+        var options = {bubbles: true, cancelable: true, view: window};
+        var event = type.indexOf('pointer') === 0 && window.PointerEvent
+            ? new PointerEvent(type, options) : new MouseEvent(type, options);
+        element.dispatchEvent(event);
+    });
+    element.click();
+}
+return elements.length;
+"""
+
+# React tracks the last value it saw on the element, the prototype setter updates the DOM
+# value without updating that tracker so the input event is not swallowed as a no-op
+SET_VALUE_SCRIPT = """
+var input = arguments[0];
+var prototype = input instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+Object.getOwnPropertyDescriptor(prototype, 'value').set.call(input, arguments[1]);
+input.dispatchEvent(new Event('input', {bubbles: true}));
+input.dispatchEvent(new Event('change', {bubbles: true}));
+if (arguments[2]) {
+    input.dispatchEvent(new FocusEvent('blur'));
+    input.dispatchEvent(new FocusEvent('focusout', {bubbles: true}));
+}
+return input.value;
+"""
+
+
+class Interactions:
+    """ This class clicks and fills in elements through scripts, falling back to native events. """
+
+    # Fast attempts of one kind that may fall back in a row before that kind only uses native events
+    MAX_FAST_FAILURES = 3
+
+    def __init__(self, driver, events, location_str, enabled=True):
+        """
+        __init__ - constructor
+        :param driver: the chrome driver
+        :param events: the event bus
+        :param location_str: formatted location of the tab
+        :param enabled: use the fast path, False to always use native events
+        """
+        self._driver = driver
+        self._events = events
+        self._location_str = location_str
+        self._enabled = enabled
+        # interaction name -> fast attempts that fell back in a row
+        self._failures = dict()
+        self.fast = 0
+        self.fallbacks = 0
+
+    def _use_fast(self, name):
+        return self._enabled and self._failures.get(name, 0) < Interactions.MAX_FAST_FAILURES
+
+    def _record(self, name, worked):
+        """
+        _record - counts a fast attempt, turning the fast path off for the interaction after repeated failures
+        :param name: the interaction name
+        :param worked: the page reached the expected state
+        :return: None
+        """
+        if worked:
+            self.fast += 1
+            self._failures[name] = 0
+            return
+
+        self.fallbacks += 1
+        self._failures[name] = self._failures.get(name, 0) + 1
+        if self._failures[name] == Interactions.MAX_FAST_FAILURES:
+            self._events.info(self._location_str, name + ": script events did not take "
+                              + str(Interactions.MAX_FAST_FAILURES) + " times, using native events from now on")
+
+    def click(self, name, elements, verify, fallback=None):
+        """
+        click - clicks the elements in order in one script call
+        :param name: the interaction name, used to track failures of the fast path
+        :param elements: list of WebElements to click, the same element may repeat
+        :param verify: callable returning True once the page reached the expected state
+        :param fallback: callable redoing the clicks with native events, defaults to clicking every element
+        :return: bool: the result of verify after the last attempt
+        """
+        if self._use_fast(name):
+            self._driver.execute_script(CLICK_SCRIPT, elements)
+            worked = verify()
+            self._record(name, worked)
+            if worked:
+                return True
+
+        if fallback is not None:
+            fallback()
+        else:
+            for element in elements:
+                ActionChains(self._driver).move_to_element(element).click(element).perform()
+        return verify()
+
+    def set_value(self, name, element, value, blur=False, verify=None, fallback=None):
+        """
+        set_value - sets an input value the way a user typing it would
+        :param name: the interaction name, used to track failures of the fast path
+        :param element: the input WebElement
+        :param value: the value to set
+        :param blur: also move the focus away, for fields that only apply a value on blur
+        :param verify: callable returning True once the page accepted the value, defaults to checking the input
+        :param fallback: callable typing the value with native events, defaults to select all and type
+        :return: bool: the result of verify after the last attempt
+        """
+        if verify is None:
+            def verify():
+                return (element.get_attribute("value") or "").strip() == value
+
+        if self._use_fast(name):
+            self._driver.execute_script(SET_VALUE_SCRIPT, element, value, blur)
+            worked = verify()
+            self._record(name, worked)
+            if worked:
+                return True
+
+        if fallback is not None:
+            fallback()
+        else:
+            element.send_keys(Keys.CONTROL + "a")
+            element.send_keys(value)
+            if blur:
+                element.send_keys(Keys.TAB)
+        return verify()
+
+    def summary(self):
+        """
+        summary - fast and fallen back interaction counts for the stopping message
+        :return: str: the summary
+        """
+        if self.fast + self.fallbacks == 0:
+            return ""
+        return ", script interactions " + str(self.fast) + " fast, " + str(self.fallbacks) + " fell back"
@@ -27,7 +27,7 @@ class LocationHandler:
         """
         __init__ - handles parsing the locations file
         :param locations: path to the file containing locations and entry points
-        :param locations_type: type of locations, camping or permits
+        :param locations_type: type of locations, camping, permits or regions
         """
         self.locations = dict()
         self.locations_type = locations_type
@@ -71,11 +71,15 @@ class LocationHandler:
 
                 if len(split_line) == 2:
                     campground = split_line[0].strip()
-                    sites = [int(site.strip()) for site in split_line[1].split(",") if site.strip() != ""]
                 else:
                     park = split_line[0].strip()
                     campground = split_line[1].strip()
-                    sites = [int(site.strip()) for site in split_line[2].split(",") if site.strip() != ""]
+
+                if split_line[-1].strip() == "*":
+                    # The whole campground, swept page by page in one browser
+                    self.locations[park + ":" + campground + ":*"] = "*"
+                    continue
+                sites = [int(site.strip()) for site in split_line[-1].split(",") if site.strip() != ""]
 
                 for site in sites:
                     self.locations[park + ":" + campground + ":" + str(site).zfill(3)] = site
@@ -88,11 +92,16 @@ class LocationHandler:
                 for entry_point in entry_points:
                     self.locations[park.strip() + ":" + entry_point.strip()] = entry_point.strip()
 
+        elif "region" in self.locations_type:
+            # Each line is a search, e.g. Yosemite, scanned for every campground it returns
+            for location in location_data:
+                self.locations["Region:" + location] = location
+
         if 'dates' in self.details:
             try:
                 start_date = dh.DateHandler(self.details['dates'][0]).date
                 end_date = None
-                if "camp" in locations_type and len(self.details['dates']) <= 1:
+                if ("camp" in locations_type or "region" in locations_type) and len(self.details['dates']) <= 1:
                     raise Exception()
                 elif "permit" not in locations_type and len(self.details['dates']) == 2:
                     end_date = dh.DateHandler(self.details['dates'][1]).date
@@ -0,0 +1,380 @@
+"""
+This module provides the locator registry. Every control the flows look up by name has an
+ordered list of candidates, a fast id, CSS or CSS and text candidate first and the XPath the
+bot used before as the fallback. The candidate that matched is tried first from then on and
+every candidate is timed. A version of the registry can be swapped in from a json file with
+the locator_file preference, the names it lists replace the built in candidates.
+
+    python3 -m src.locators --check
+
+opens the fixture site pages and checks every locator against them,
+
+    python3 -m src.locators --export locators/2025-01.json
+
+writes the registry in use as a starting point for a new version.
+"""
+
+import argparse
+import json
+from os import makedirs, path
+from time import monotonic
+
+# The By strategy of a named lookup, the value is the locator name
+NAMED = "locator"
+
+BUILTIN_VERSION = "builtin"
+
+# name -> candidates in order, [strategy, value] or ["text", css selector, contained text]
+BUILTIN = {
+    "main_heading": [["css", "h3.h3[data-component='Heading']"],
+                     ["xpath", "//h3[(@data-component='Heading') and (@class='h3')]"]],
+    "search_input": [["css", "input[placeholder*='Where to']"],
+                     ["xpath", "//input[contains(@placeholder, 'Where to')]"]],
+    "log_in_link": [["id", "ga-global-nav-log-in-link"]],
+    "email": [["id", "email"]],
+    "password": [["id", "rec-acct-sign-in-password"]],
+    "sign_in_submit": [["css", "button.rec-acct-sign-in-btn[type='submit']"],
+                       ["xpath", "//button[contains(@class, 'rec-acct-sign-in-btn') and (@type='submit')]"]],
+    "close_modal": [["css", "button[aria-label='Close modal']"],
+                    ["xpath", "//button[@aria-label='Close modal']"]],
+    "filter_apply": [["text", "button", "Apply"],
+                     ["xpath", "//span[contains(text(), 'Apply')]"]],
+    "refresh_table": [["text", "button", "Refresh Table"],
+                      ["xpath", "//span[contains(text(), 'Refresh Table')]"]],
+    "clear_selection": [["text", "button", "Clear selection"],
+                        ["xpath", "//span[contains(text(), 'Clear selection')]"]],
+    "add_to_cart": [["text", "button", "Add to Cart"],
+                    ["xpath", "//span[contains(text(), 'Add to Cart')]"]],
+    "close_log_in": [["text", "button", "Close Log In"],
+                     ["xpath", "//span[contains(text(), 'Close Log In')]"]],
+    "add_guests": [["css", "button[aria-label='Add guests']"],
+                   ["xpath", "//button[@aria-label='Add guests']"]],
+    "add_group_members": [["css", "button[aria-label='Add group members']"],
+                          ["xpath", "//button[@aria-label='Add group members']"]],
+    "next_available": [["text", "button", "Next Available"],
+                       ["xpath", "//*[contains(text(), 'Next Available')]"]],
+    "filters": [["text", "button", "Filters"],
+                ["xpath", "//span[contains(text(), 'Filters')]"]],
+    "clear_dates": [["text", "button", "Clear Dates"],
+                    ["xpath", "//span[contains(text(), 'Clear Dates')]"]],
+    "book_now": [["text", "button", "Book Now"],
+                 ["xpath", "//span[contains(text(), 'Book Now')]"]],
+}
+
+# The By strategies, spelled out so the registry loads without selenium
+STRATEGIES = {"id": "id", "css": "css selector", "xpath": "xpath"}
+
+# The elements matching a CSS selector whose text contains a string, one call instead of a text scan of the DOM
+TEXT_SCRIPT = """
+var root = arguments[2] || document;
+var text = arguments[1];
+return Array.prototype.filter.call(root.querySelectorAll(arguments[0]), function (element) {
+    return (element.textContent || '').indexOf(text) !== -1;
+});
+"""
+
+# The first element of any candidate, for the DevTools engine, candidates are filled in as json
+FIRST_SCRIPT = """
+var candidates = %s;
+var tag = %s;
+for (var index = 0; index < candidates.length; index++) {
+    var candidate = candidates[index];
+    var found = null;
+    if (candidate[0] === 'id') {
+        found = document.getElementById(candidate[1]);
+    } else if (candidate[0] === 'css') {
+        found = document.querySelector(candidate[1]);
+    } else if (candidate[0] === 'text') {
+        found = Array.prototype.find.call(document.querySelectorAll(candidate[1]), function (element) {
+            return (element.textContent || '').indexOf(candidate[2]) !== -1;
+        }) || null;
+    } else {
+        found = document.evaluate(candidate[1], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null)
+            .singleNodeValue;
+    }
+    if (found !== null) { return tag === null ? found : (found.closest(tag) || found); }
+}
+return null;
+"""
+
+# Loaded registries of this process by locator file
+_registries = dict()
+
+
+class LocatorFileException(Exception):
+    pass
+
+
+def describe_candidate(candidate):
+    if candidate[0] == "text":
+        return "text " + candidate[1] + " '" + candidate[2] + "'"
+    return candidate[0] + " " + candidate[1]
+
+
+class LocatorRegistry:
+    """ This class resolves the named locators of one registry version and times them. """
+
+    def __init__(self, version, locators):
+        """
+        __init__ - constructor
+        :param version: the version name, shown in the failures and the summary
+        :param locators: dict of name to candidate list
+        """
+        self.version = version
+        self._locators = locators
+        # name -> index of the candidate that matched last
+        self._preferred = dict()
+        # (name, candidate index) -> [lookups, matches, seconds]
+        self._stats = dict()
+
+    def names(self):
+        return sorted(self._locators.keys())
+
+    def candidates(self, name):
+        if name not in self._locators:
+            raise LocatorFileException("No locator named " + name + " in version " + self.version)
+        return self._locators[name]
+
+    @staticmethod
+    def _find_candidate(driver, candidate, root):
+        if candidate[0] == "text":
+            return driver.execute_script(TEXT_SCRIPT, candidate[1], candidate[2], root) or list()
+        return (driver if root is None else root).find_elements(STRATEGIES[candidate[0]], candidate[1])
+
+    def _timed(self, driver, name, index, root):
+        candidate = self.candidates(name)[index]
+        started = monotonic()
+        elements = LocatorRegistry._find_candidate(driver, candidate, root)
+        stats = self._stats.setdefault((name, index), [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += 1 if len(elements) > 0 else 0
+        stats[2] += monotonic() - started
+        return elements
+
+    def find(self, driver, name, root=None, every=False):
+        """
+        find - the elements of the first candidate that matches, once one has matched only that one is
+        tried, so a control that is absent most iterations is not looked for with every candidate
+        :param driver: the chrome driver
+        :param name: the locator name
+        :param root: element to search under, defaults to the whole page
+        :param every: try the other candidates too, for lookups waiting on an element that has to appear
+        :return: list: the matching WebElements, empty if no candidate matched
+        """
+        preferred = self._preferred.get(name)
+        if preferred is not None and not every:
+            return self._timed(driver, name, preferred, root)
+
+        count = len(self.candidates(name))
+        order = list(range(count)) if preferred is None \
+            else [preferred] + [index for index in range(count) if index != preferred]
+        for index in order:
+            elements = self._timed(driver, name, index, root)
+            if len(elements) > 0:
+                self._preferred[name] = index
+                return elements
+        return list()
+
+    def locator(self, name):
+        """
+        locator - a (By, value) tuple for the expected conditions, the matching candidate if it has one
+        :param name: the locator name
+        :return: tuple: the locator, None if only text candidates are listed
+        """
+        candidates = self.candidates(name)
+        preferred = self._preferred.get(name, 0)
+        for candidate in [candidates[preferred]] + candidates:
+            if candidate[0] in STRATEGIES:
+                return STRATEGIES[candidate[0]], candidate[1]
+        return None
+
+    def script(self, name, tag=None):
+        """
+        script - a script returning the first element of the locator, for the DevTools engine
+        :param name: the locator name
+        :param tag: the enclosing tag to return instead, e.g. button
+        :return: str: the script
+        """
+        candidates = self.candidates(name)
+        preferred = self._preferred.get(name, 0)
+        ordered = [candidates[preferred]] + [candidate for index, candidate in enumerate(candidates)
+                                             if index != preferred]
+        return FIRST_SCRIPT % (json.dumps(ordered), json.dumps(tag))
+
+    def fallbacks(self):
+        return sorted(name for name, index in self._preferred.items() if index > 0)
+
+    def summary(self):
+        """
+        summary - the lookups and the locators only their fallbacks matched, for the stopping message
+        :return: str: the summary
+        """
+        lookups = sum(stats[0] for stats in self._stats.values())
+        if lookups == 0:
+            return ""
+        seconds = sum(stats[2] for stats in self._stats.values())
+        summary = ", locators " + self.version + " " + str(lookups) + " lookup(s) averaging " \
+                  + "%.1f" % (seconds / lookups * 1000) + "ms"
+        if len(self.fallbacks()) > 0:
+            summary += ", fell back on " + ", ".join(self.fallbacks())
+        return summary
+
+    def check(self, driver, name):
+        """
+        check - times every candidate of a locator on the current page
+        :param driver: the chrome driver
+        :param name: the locator name
+        :return: list: (candidate, matches, seconds) per candidate
+        """
+        results = list()
+        for index, candidate in enumerate(self.candidates(name)):
+            started = monotonic()
+            matches = len(LocatorRegistry._find_candidate(driver, candidate, None))
+            results.append((candidate, matches, monotonic() - started))
+        return results
+
+    def export(self, export_file):
+        if path.dirname(export_file):
+            makedirs(path.dirname(export_file), exist_ok=True)
+        with open(export_file, "w") as exported:
+            json.dump({"version": self.version, "locators": self._locators}, exported, indent=1)
+
+
+def validate(locators):
+    """
+    validate - checks the candidates of a locator file
+    :param locators: dict of name to candidate list
+    :return: None, raises LocatorFileException on the first bad candidate
+    """
+    for name, candidates in locators.items():
+        if not isinstance(candidates, list) or len(candidates) == 0:
+            raise LocatorFileException(name + " has no candidates")
+        for candidate in candidates:
+            if not isinstance(candidate, list) or len(candidate) < 2 \
+                    or (candidate[0] not in STRATEGIES and candidate[0] != "text") \
+                    or (candidate[0] == "text" and len(candidate) != 3):
+                raise LocatorFileException(name + " has a malformed candidate: " + json.dumps(candidate))
+
+
+def load(locator_file=None):
+    """
+    load - the registry of this process for a locator file, loaded once
+    :param locator_file: json file of the version to use, None for the built in locators
+    :return: LocatorRegistry: the registry
+    """
+    if locator_file in _registries:
+        return _registries[locator_file]
+
+    version = BUILTIN_VERSION
+    locators = {name: [list(candidate) for candidate in candidates] for name, candidates in BUILTIN.items()}
+    if locator_file is not None:
+        try:
+            with open(locator_file, "r") as version_file:
+                document = json.load(version_file)
+        except (OSError, ValueError) as e:
+            raise LocatorFileException("Unable to read " + locator_file + ": " + str(e))
+        if not isinstance(document, dict) or not isinstance(document.get("locators"), dict):
+            raise LocatorFileException(locator_file + " has no locators")
+        validate(document["locators"])
+        version = str(document.get("version", path.splitext(path.basename(locator_file))[0]))
+        locators.update(document["locators"])
+
+    registry = LocatorRegistry(version, locators)
+    _registries[locator_file] = registry
+    return registry
+
+
+# Page states of the fixture site: (description, page to load or None to stay, script setting it up, locators)
+CHECKS = [
+    ("main page", "", None, ["main_heading", "search_input"]),
+    ("campground", "camping/campgrounds/1000", None, ["close_modal", "refresh_table"]),
+    ("campground filter menu", None, "document.querySelector('.filter > button').click();", ["filter_apply"]),
+    ("campground selection", None,
+     "var cells = document.querySelectorAll('#grid .available .rec-availability-date');"
+     "cells[0].click(); cells[cells.length - 1].click();", ["clear_selection", "add_to_cart"]),
+    ("campground log in prompt", None, "document.getElementById('add-to-cart').click();", ["close_log_in"]),
+    ("permit", "permits/2001/registration/detailed-availability", None,
+     ["add_group_members", "next_available", "filters"]),
+    ("permit selection", None, "document.querySelector('#grid .available button').click();",
+     ["clear_dates", "book_now"]),
+    ("permit log in prompt", None, "document.getElementById('book-now').click();", ["close_log_in"]),
+]
+
+
+def run_check(locator_file, directory):
+    """
+    run_check - checks every locator the fixture site has a page for
+    :param locator_file: json file of the version to check, None for the built in locators
+    :param directory: where the simulator writes its inputs
+    :return: bool: True if every checked locator matched
+    """
+    # Imported here so the registry can be exported without the fixture site
+    from datetime import date, timedelta
+    import src.overseer as overwatch
+    import src.event_bus as eb
+    from src.scale_simulator import SimulationSettings, ScaleSimulator
+
+    registry = load(locator_file)
+    simulator = ScaleSimulator(SimulationSettings([2], label="locator_check", directory=directory))
+    site, keys, prefs = simulator.setup(2)
+    overseer = overwatch.Overseer(prefs)
+    events = eb.configure(overseer.preferences)
+    # Openings inside the first grid window, so the selection and booking controls can be shown
+    today = date.today()
+    site.state.open_campsite("1000", "001", today + timedelta(days=1), today + timedelta(days=3))
+    site.state.open_permit("2001", "EP001", today + timedelta(days=1), 4)
+
+    print("Locator version " + registry.version)
+    checked = set()
+    failed = list()
+    overseer.backend.start(overseer.lifecycle)
+    driver = overseer.create_driver("locator check")
+    try:
+        if driver is None:
+            raise RuntimeError("Unable to create the driver, see the log")
+        for description, page, setup, names in CHECKS:
+            if page is not None:
+                driver.get(site.url + page)
+            if setup is not None:
+                driver.execute_script(setup)
+            print(description)
+            for name in names:
+                checked.add(name)
+                results = registry.check(driver, name)
+                if all(matches == 0 for candidate, matches, seconds in results):
+                    failed.append(name)
+                for index, (candidate, matches, seconds) in enumerate(results):
+                    print("  " + (name if index == 0 else "").ljust(20) + ("FAIL " if matches == 0 else "ok   ")
+                          + str(matches).rjust(3) + " match(es) " + ("%.1f" % (seconds * 1000)).rjust(7) + "ms  "
+                          + describe_candidate(candidate))
+    finally:
+        if driver is not None:
+            overseer.lifecycle.release(driver)
+        overseer.backend.stop(overseer.lifecycle)
+        site.stop()
+        events.flush()
+
+    unchecked = [name for name in registry.names() if name not in checked]
+    if len(unchecked) > 0:
+        print("Not on the fixture pages: " + ", ".join(unchecked))
+    if len(failed) > 0:
+        print("No candidate matched: " + ", ".join(failed))
+    return len(failed) == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks or exports the locator registry")
+    parser.add_argument("--file", default=None, help="locator version file, the built in locators if not given")
+    parser.add_argument("--check", action="store_true", help="check every locator against the fixture site")
+    parser.add_argument("--export", metavar="FILE", help="write the registry in use to a version file")
+    parser.add_argument("--dir", default="simulations", help="where the fixture inputs are written")
+    arguments = parser.parse_args()
+
+    if arguments.export:
+        load(arguments.file).export(arguments.export)
+        print("Locators written to " + arguments.export)
+    if arguments.check and not run_check(arguments.file, arguments.dir):
+        exit(1)
+
+if __name__ == '__main__':
+    main()
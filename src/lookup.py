@@ -0,0 +1,101 @@
+"""
+This module provides the element lookups used with implicit waits switched off.
+A "must" lookup waits a bounded time for the element, a "may" lookup checks instantly.
+Lookups by the NAMED strategy resolve a name through the locator registry.
+"""
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+
+import src.locators as lc
+
+
+class Lookup:
+    """ This class separates elements that must appear from elements that may be absent. """
+
+    def __init__(self, driver, timeout, poll_frequency=0.05, locators=None):
+        """
+        __init__ - constructor
+        :param driver: the chrome driver, its implicit wait is expected to be 0
+        :param timeout: default seconds a must lookup waits for the element
+        :param poll_frequency: seconds between checks of a must lookup
+        :param locators: the LocatorRegistry of the NAMED lookups, defaults to the built in one
+        """
+        self._driver = driver
+        self._timeout = timeout
+        self._poll_frequency = poll_frequency
+        self.locators = locators if locators is not None else lc.load()
+
+    def _find(self, by, value, root, every=False):
+        if by == lc.NAMED:
+            return self.locators.find(self._driver, value, root, every)
+        return (self._driver if root is None else root).find_elements(by, value)
+
+    def clickable(self, name):
+        """
+        clickable - a wait condition for a named locator, ready once its element is visible and enabled
+        :param name: the locator name
+        :return: condition callable returning the element
+        """
+        def condition(driver):
+            elements = self.locators.find(driver, name, every=True)
+            if len(elements) > 0 and elements[0].is_displayed() and elements[0].is_enabled():
+                return elements[0]
+            return False
+        return condition
+
+    def must_all(self, by, value, timeout=None, root=None):
+        """
+        must_all - waits until at least one matching element is present
+        :param by: the By strategy
+        :param value: the locator value
+        :param timeout: seconds to wait, defaults to the lookup timeout
+        :param root: element to search under, defaults to the whole page
+        :return: list: the matching WebElements, raises TimeoutException if none appear
+        """
+        timeout = self._timeout if timeout is None else timeout
+
+        elements = self._find(by, value, root)
+        if len(elements) > 0:
+            return elements
+
+        try:
+            return WebDriverWait(self._driver, timeout, self._poll_frequency).until(
+                lambda driver: self._find(by, value, root, True) or False)
+        except TimeoutException:
+            if by == lc.NAMED:
+                raise TimeoutException("Element never appeared: no candidate of locator " + value + " in version "
+                                       + self.locators.version + " matched")
+            raise TimeoutException("Element never appeared: " + by + "=" + value)
+
+    def must(self, by, value, timeout=None, root=None):
+        """
+        must - waits until the element is present
+        :param by: the By strategy
+        :param value: the locator value
+        :param timeout: seconds to wait, defaults to the lookup timeout
+        :param root: element to search under, defaults to the whole page
+        :return: WebElement: the first match, raises TimeoutException if it never appears
+        """
+        return self.must_all(by, value, timeout, root)[0]
+
+    def may(self, by, value, root=None):
+        """
+        may - checks for the elements without waiting
+        :param by: the By strategy
+        :param value: the locator value
+        :param root: element to search under, defaults to the whole page
+        :return: list: the matching WebElements, empty if none are present
+        """
+        return self._find(by, value, root)
+
+    def first(self, by, value, root=None):
+        """
+        first - checks for an element without waiting
+        :param by: the By strategy
+        :param value: the locator value
+        :param root: element to search under, defaults to the whole page
+        :return: WebElement: the first match, None if none are present
+        """
+        elements = self.may(by, value, root)
+        return elements[0] if len(elements) > 0 else None
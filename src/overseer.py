@@ -3,91 +3,526 @@ This module provides the overseer functionality
 """
 
 import multiprocessing as mp
-from traceback import print_exc
+import signal
 from selenium import webdriver
 from os import path
-from os import getcwd
-from sys import platform
+from os import getpid
 
 from src.recgov import RecGov
 from src.camp_recgov import CampRecGov
 from src.permit_recgov import PermitRecGov
+from src.region_recgov import RegionRecGov
 import src.preferences_handler as ph
+import src.event_bus as eb
+import src.process_stats as ps
+import src.rate_budget as rb
+import src.burst as bst
+import src.sampling_profiler as sp
+from src.tab_worker import TabWorker
+from src.driver_lifecycle import DriverLifecycle
+from src.trace_capture import TraceSettings, TraceCapture
+from src.flow_runner import Watchdog, WorkerStalledException
+from src.driver_backend import create_backend
+from src.profile_template import ProfileTemplate
+from src.preflight import Preflight, PlannedLocation, RunPlan, describe
+import src.tenancy as tn
 
 
 class Overseer:
     """ This class provides the Overseer which is the driver for the bot. """
 
-    def __init__(self, prefs='preferences/preferences.txt'):
+    # Browsers started again for one location after the watchdog ended a stalled one
+    MAX_RESTARTS = 3
+
+    def __init__(self, prefs='preferences/preferences.txt', trace=None, tenants=None):
         """
         __init__ - basic constructor
         :param prefs: the preference file to be used
+        :param trace: TraceSettings of the --trace mode, None when not tracing
+        :param tenants: preference files of the other tenants, None or empty for a single user run
+        """
+        self.tenants = None
+        self.tenant_plans = None
+        # Started in each worker process of a multi-tenant run
+        self.fan_out = None
+        if tenants:
+            # The first preference set also holds the run settings, e.g. the backend and the rate limit
+            self.tenants = tn.load_tenants([prefs] + list(tenants))
+            self.preferences = self.tenants[0].preferences
+        else:
+            self.preferences = ph.PreferencesHandler(prefs)
+        self.trace = trace
+        self.lifecycle = DriverLifecycle(self.preferences.driver_registry, getpid())
+        self.backend = create_backend(self.preferences)
+        self.profiles = None
+        # Profiles are directories on this host, remote browsers keep starting empty
+        if self.preferences.profile_template is not None and self.preferences.driver_backend != "remote":
+            self.profiles = ProfileTemplate(self.preferences.profile_template, self.preferences.profile_max_age)
+
+    @staticmethod
+    def init_worker(budget=None, stack_dir="stacks", bursts=None):
+        """
+        init_worker - pool initializer, ctrl-c is left to the overseer which reaps the drivers,
+        SIGUSR1 turns the sampling profiler of the worker on and off
+        :param budget: the RequestBudget shared by the workers, None for no limit
+        :param stack_dir: where the profiler writes the collapsed stacks
+        :param bursts: the BurstGroups shared by the workers, None without burst groups
+        :return: None
+        """
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        rb.install(budget)
+        bst.install(bursts)
+        sp.install(stack_dir)
+
+    @staticmethod
+    def handle_terminate(signum, frame):
+        """
+        handle_terminate - turns SIGTERM into the same shutdown path as ctrl-c
+        :return: None
+        """
+        raise KeyboardInterrupt()
+
+    @staticmethod
+    def report_budget(budget):
+        """
+        report_budget - publishes each location's share of the request budget
+        :param budget: the RequestBudget of the run
+        :return: None
+        """
+        for location_str, requests, share, wait in budget.report():
+            eb.get_event_bus().info(location_str, str(requests) + " request(s), " + "%.1f" % (share * 100)
+                                    + "% of the budget, waited " + "%.3f" % wait + "s per request")
+
+    @staticmethod
+    def report_bursts(bursts):
+        """
+        report_bursts - publishes how often each burst group sampled its location
+        :param bursts: the BurstGroups of the run
+        :return: None
         """
-        self.preferences = ph.PreferencesHandler(prefs)
+        for location_str, size, polls, cycle, interval, booked_by in bursts.report():
+            eb.get_event_bus().info(location_str, str(size) + " burst member(s), " + str(polls) + " poll(s), cycle "
+                                    + "%.2f" % cycle + "s, the grid sampled every " + "%.2f" % interval + "s"
+                                    + (", booked by member " + str(booked_by + 1) if booked_by is not None else ""))
 
     @staticmethod
     def merge_parameters(locations, rec_type):
         return [[location, rec_type] for location in locations]
 
-    def start_driver(self, merged_location_type):
+    def traced(self, location):
         """
-        start_driver - creates the chrome driver and starts the browser
-        :param merged_location_type: list containing location and rec_type for this driver
-        :return: None
+        traced - checks if --trace selected the location
+        :param location: the location string
+        :return: bool: True if the location is traced
+        """
+        return self.trace is not None and self.trace.matches(location)
+
+    def create_driver(self, location_str, traced=False, slot=0, profile=None, clone=True):
+        """
+        create_driver - creates the chrome driver and starts the browser
+        :param location_str: formatted location(s) the browser is for
+        :param traced: turn on the performance log for --trace
+        :param slot: index of the worker, spreads the remote sessions over the hubs
+        :param profile: the profile directory, None for a copy of the warm template or an empty profile
+        :param clone: False to start on an empty profile even when there is a warm template
+        :return: the driver, None if it could not be created
         """
-        driver = None
+        events = eb.get_event_bus()
+        cloned = False
+        if profile is None and clone and self.profiles is not None:
+            profile = self.profiles.clone(slot)
+            cloned = profile is not None
         try:
-            print(RecGov.format_location_string(merged_location_type[0])
-                  + ": driver starting")
-            # windows default
-            exec_path = path.join(getcwd(), 'chromedriver.exe')
-            if platform == "linux":
-                exec_path = path.join(getcwd(), 'chromedriver_linux')
-            driver = webdriver.Chrome(executable_path=exec_path,
-                                      chrome_options=webdriver.ChromeOptions())
+            events.info(location_str, "driver starting on the " + self.preferences.driver_backend + " backend")
+            options = webdriver.ChromeOptions()
+            # Lets a checkout browser outlive its chromedriver, see DriverLifecycle.keep
+            options.add_experimental_option("detach", True)
+            capabilities = webdriver.DesiredCapabilities.CHROME.copy()
+            if traced:
+                TraceSettings.add_capabilities(options, capabilities)
+            if self.preferences.cdp_engine:
+                # Chrome refuses DevTools websockets from other origins unless allowed
+                options.add_argument("--remote-allow-origins=*")
+            if profile is not None:
+                options.add_argument("--user-data-dir=" + path.abspath(profile))
+            driver = self.backend.create(options, capabilities, slot)
+            self.lifecycle.register(driver, location_str, profile if cloned else None)
             driver.maximize_window()
-            driver.implicitly_wait(self.preferences.wait_duration)
+            # Lookups wait explicitly (src/lookup.py), an implicit wait would stall every
+            # check for an element that is expected to be absent
+            driver.implicitly_wait(self.preferences.implicit_wait)
+            return driver
 
         except Exception as e:
-            print(print_exc())
-            print(RecGov.format_location_string(merged_location_type[0])
-                  + ": Unable to create driver for location: ")
-            driver = None
+            events.error(location_str, "Unable to create driver for location")
+            if cloned:
+                ProfileTemplate.remove_profile(profile)
+
+        return None
+
+    def warm_profile(self):
+        """
+        warm_profile - warms the profile template if it is missing or too old and removes copies
+        left by runs that were killed
+        :return: None
+        """
+        removed = self.profiles.sweep(self.lifecycle.profiles())
+        if removed > 0:
+            eb.get_event_bus().info(None, "Removed " + str(removed) + " leftover profile copies")
+        if not self.profiles.stale():
+            return
+        eb.get_event_bus().info(None, "Warming the profile template")
+        if not self.profiles.warm(lambda profile: self.create_driver("profile template", profile=profile),
+                                  self.lifecycle.release, self.preferences.url):
+            eb.get_event_bus().info(None, "Unable to warm the profile template, browsers start with empty profiles")
+
+    def watch_preferences(self, merged_location_type):
+        """
+        watch_preferences - the preferences a location is polled with, a watch polls as its first tenant
+        :param merged_location_type: the PlannedLocation or Watch
+        :return: the preferences
+        """
+        if isinstance(merged_location_type, tn.Watch):
+            return self.tenants[merged_location_type.tenants[0]].preferences
+        return self.preferences
+
+    def create_rec_gov(self, driver, merged_location_type, preferences=None):
+        """
+        create_rec_gov - creates the camp or permit flow for a location
+        :param driver: the chrome driver for the flow
+        :param merged_location_type: list containing location and rec_type
+        :param preferences: the preferences of the flow, None for those of the location
+        :return: the RecGov subclass, None for an invalid rec_type
+        """
+        rcgv = None
+        if preferences is None:
+            preferences = self.watch_preferences(merged_location_type)
+        if "camp" in merged_location_type[1].lower():
+            rcgv = CampRecGov(driver=driver, preferences=preferences,
+                              camping_location=merged_location_type[0])
+        elif "permit" in merged_location_type[1].lower():
+            rcgv = PermitRecGov(driver=driver, preferences=preferences,
+                                permit_location=merged_location_type[0])
+        elif "region" in merged_location_type[1].lower():
+            rcgv = RegionRecGov(driver=driver, preferences=preferences,
+                                region_location=merged_location_type[0])
+        else:
+            eb.get_event_bus().info(RecGov.format_location_string(merged_location_type[0]),
+                                    "Invalid Rec Type provided")
+            return None
+
+        if len(merged_location_type) > 2 and merged_location_type[2] is not None:
+            # Resolved by the preflight, the flow skips the search
+            rcgv.set_location_link(merged_location_type[2])
+
+        if self.traced(merged_location_type[0]):
+            rcgv.set_trace(TraceCapture(driver, merged_location_type[0], self.trace, eb.get_event_bus()))
+        if isinstance(merged_location_type, tn.Watch) and len(merged_location_type.tenants) > 1 \
+                and self.fan_out is not None:
+            rcgv.set_hit_handler(lambda watch=merged_location_type: self.fan_out.trigger(watch))
+        return rcgv
+
+    def book_for_tenant(self, watch, tenant):
+        """
+        book_for_tenant - runs a short booking session for one more tenant of a watch that saw a hit,
+        in a browser of its own with the tenant's credentials, guests and login
+        :param watch: the Watch
+        :param tenant: index of the tenant
+        :return: bool: True if the session reached checkout
+        """
+        events = eb.get_event_bus()
+        name = self.tenants[tenant].name
+        location_str = RecGov.format_location_string(watch.location) + " for " + name
+        events.info(location_str, "fanning out the hit")
+        driver = self.create_driver(location_str)
+        if driver is None:
+            return False
+
+        booked = False
+        try:
+            rcgv = self.create_rec_gov(driver, PlannedLocation(watch.location, watch.rec_type, watch.link),
+                                       tn.booking_preferences(self.tenants[tenant].preferences))
+            if rcgv is not None:
+                booked = rcgv.execute()
+        except Exception:
+            events.error(location_str, "Overseer.book_for_tenant() failed")
+
+        if booked:
+            self.lifecycle.keep(driver)
+        else:
+            self.lifecycle.release(driver)
+        return booked
+
+    @staticmethod
+    def worker_results(rec_govs, fan_out):
+        """
+        worker_results - what a worker polled, for the savings of a multi-tenant run
+        :param rec_govs: list of (location, RecGov) the worker ran
+        :param fan_out: the FanOut of the worker, None outside a multi-tenant run
+        :return: list: (location, rec_type, iterations, tenants a booking session was started for)
+        """
+        results = list()
+        for merged_location_type, rcgv in rec_govs:
+            key = (merged_location_type[0], merged_location_type[1])
+            fanned_out = tuple(fan_out.sessions.get(key, list())) if fan_out is not None else tuple()
+            results.append((merged_location_type[0], merged_location_type[1], rcgv.iterations(), fanned_out))
+        return results
+
+    def start_driver(self, merged_location_type, slot=0, member=None):
+        """
+        start_driver - creates the chrome driver and starts the browser
+        :param merged_location_type: list containing location and rec_type for this driver
+        :param slot: index of the worker
+        :param member: the BurstMember of a location polled by a burst group, None otherwise
+        :return: list: what the worker polled, see worker_results
+        """
+        events = eb.configure(self.preferences)
+        location_str = bst.member_label(RecGov.format_location_string(merged_location_type[0]), member)
+        sp.set_label(location_str)
+        if self.tenants is not None:
+            self.fan_out = tn.FanOut(self.book_for_tenant)
+        driver = self.create_driver(location_str, self.traced(merged_location_type[0]), slot)
+        rec_govs = list()
+
+        if driver is not None:
+            rcgv = self.create_rec_gov(driver, merged_location_type)
+            if rcgv is None:
+                self.lifecycle.release(driver)
+                sp.finish()
+                events.flush()
+                return list()
+            if member is not None:
+                rcgv.set_burst(member)
+            rec_govs.append((merged_location_type, rcgv))
+
+            booked = False
+            restarts = 0
+            while True:
+                # Bound to this browser, a restart gets a watchdog for the new one
+                watchdog = Watchdog(lambda stalled_driver=driver: self.lifecycle.kill(stalled_driver),
+                                    events, location_str)
+                rcgv.set_watchdog(watchdog)
+                try:
+                    booked = rcgv.execute()
+                    break
+                except WorkerStalledException as e:
+                    events.info(location_str, str(e))
+                finally:
+                    watchdog.stop()
+
+                restarts += 1
+                if restarts > Overseer.MAX_RESTARTS:
+                    events.info(location_str, "Giving up after " + str(Overseer.MAX_RESTARTS) + " browser restarts")
+                    driver = None
+                    break
+                # A location that traced all its iterations starts the new browser without the performance log
+                traced = self.traced(merged_location_type[0]) and rcgv.tracing()
+                driver = self.create_driver(location_str, traced, slot)
+                if driver is None:
+                    break
+                # Carries on with the poll count and the location link found by the stalled browser
+                rcgv.replace_driver(driver)
+                if traced:
+                    rcgv.set_trace(TraceCapture(driver, merged_location_type[0], self.trace, events))
+
+            if driver is not None:
+                ps.report_browser_usage(events, location_str, driver, [rcgv])
+                if booked:
+                    self.lifecycle.keep(driver)
+                else:
+                    self.lifecycle.release(driver)
+
+        if self.fan_out is not None:
+            self.fan_out.join()
+        sp.finish()
+        # Pool workers exit without running atexit, write out everything queued
+        events.flush()
+        return Overseer.worker_results(rec_govs, self.fan_out)
+
+    def start_tab_worker(self, merged_locations, slot=0):
+        """
+        start_tab_worker - polls several locations from the tabs of one browser
+        :param merged_locations: list of [location, rec_type] for this browser
+        :param slot: index of the worker
+        :return: list: what the worker polled, see worker_results
+        """
+        events = eb.configure(self.preferences)
+        location_str = ", ".join(RecGov.format_location_string(merged_location_type[0])
+                                 for merged_location_type in merged_locations)
+        sp.set_label(location_str)
+        if self.tenants is not None:
+            self.fan_out = tn.FanOut(self.book_for_tenant)
+        driver = self.create_driver(location_str, any(self.traced(merged_location_type[0])
+                                                      for merged_location_type in merged_locations), slot)
+        rec_govs = list()
+
+        def create_tab(tab_driver, merged_location_type):
+            rcgv = self.create_rec_gov(tab_driver, merged_location_type)
+            if rcgv is not None:
+                rec_govs.append((merged_location_type, rcgv))
+            return rcgv
 
         if driver is not None:
-            rcgv = None
-            if "camp" in merged_location_type[1].lower():
-                rcgv = CampRecGov(driver=driver, preferences=self.preferences,
-                                  camping_location=merged_location_type[0])
-            elif "permit" in merged_location_type[1].lower():
-                rcgv = PermitRecGov(driver=driver, preferences=self.preferences,
-                                    permit_location=merged_location_type[0])
+            # The tabs share cookies, a multi-tenant run only groups the watches of one tenant
+            worker = TabWorker(driver, self.watch_preferences(merged_locations[0]), merged_locations, create_tab,
+                               events)
+            booked = False
+            try:
+                worker.open_tabs()
+                booked = worker.run()
+            except Exception:
+                events.error(location_str, "Overseer.start_tab_worker() failed")
+
+            if booked:
+                self.lifecycle.keep(driver)
             else:
-                print("Invalid Rec Type provided")
-                return
+                self.lifecycle.release(driver)
 
-            if rcgv is None or not rcgv.execute():
-                driver.quit()
+        if self.fan_out is not None:
+            self.fan_out.join()
+        sp.finish()
+        events.flush()
+        return Overseer.worker_results(rec_govs, self.fan_out)
 
-    def start(self):
+    def plan(self):
         """
-        start - creates a separate process for each driver
-        :return: None
+        plan - runs the preflight over every location of the locations files
+        :return: RunPlan: the locations that can run, the merged watches in a multi-tenant run
         """
-        num_processes = (len(self.preferences.camping_locations.keys())
-                         if self.preferences.camping_locations is not None else 0)
-        num_processes += (len(self.preferences.permit_locations.keys())
-                          if self.preferences.permit_locations is not None else 0)
+        if self.tenants is None:
+            run_plan = Preflight(self.preferences, traced=self.trace is not None).compile(
+                Overseer.merged_list(self.preferences))
+            describe(run_plan, eb.get_event_bus(), RecGov.format_location_string)
+            return run_plan
 
-        process_pool = mp.Pool(processes=num_processes)
+        # Each tenant is checked with its own preferences, then the identical sources are merged
+        self.tenant_plans = list()
+        for tenant in self.tenants:
+            run_plan = Preflight(tenant.preferences, traced=self.trace is not None).compile(
+                Overseer.merged_list(tenant.preferences))
+            describe(run_plan, eb.get_event_bus(),
+                     lambda location, name=tenant.name: RecGov.format_location_string(location) + " for " + name)
+            self.tenant_plans.append(run_plan)
+        watches = tn.compile_watches(self.tenants, self.tenant_plans)
+        eb.get_event_bus().info(None, "Tenancy: " + str(sum(len(run_plan.locations) for run_plan in self.tenant_plans))
+                                + " location(s) of " + str(len(self.tenants)) + " tenant(s) merged into "
+                                + str(len(watches)) + " watch(es)")
+        return RunPlan(watches, tuple(reason for run_plan in self.tenant_plans for reason in run_plan.rejected),
+                       tuple(warning for run_plan in self.tenant_plans for warning in run_plan.warnings))
 
+    @staticmethod
+    def merged_list(preferences):
+        """
+        merged_list - the [location, rec_type] pairs of the locations files
+        :param preferences: the preferences naming the locations files
+        :return: list: the pairs
+        """
         merged_list = list()
-        if self.preferences.camping_locations is not None:
+        if preferences.camping_locations is not None:
+            merged_list.extend(Overseer.merge_parameters(
+                preferences.camping_locations.keys(), "Camping"))
+        if preferences.permit_locations is not None:
             merged_list.extend(Overseer.merge_parameters(
-                self.preferences.camping_locations.keys(), "Camping"))
-        if self.preferences.permit_locations is not None:
+                preferences.permit_locations.keys(), "Permits"))
+        if preferences.region_locations is not None:
             merged_list.extend(Overseer.merge_parameters(
-                self.preferences.permit_locations.keys(), "Permits"))
+                preferences.region_locations.keys(), "Region"))
+        return merged_list
 
-        process_pool.map(self.start_driver, merged_list)
+    def report_tenancy(self, results, work):
+        """
+        report_tenancy - publishes the browsers and poll requests the merged watches saved
+        :param results: the lists returned by the workers
+        :param work: the work items the pool ran
+        :return: None
+        """
+        watches = [watch for item in work for watch in (item if isinstance(item, list) else [item])]
+        separate, merged, saved = tn.savings(self.tenant_plans, watches,
+                                             [result for worker in results for result in worker],
+                                             self.preferences.tabs_per_browser)
+        eb.get_event_bus().info(None, "Tenancy: " + str(sum(merged)) + " browser(s) started instead of "
+                                + str(sum(separate)) + ", " + str(saved) + " grid reload(s) saved")
+        for index, tenant in enumerate(self.tenants):
+            eb.get_event_bus().info(None, "Tenancy: " + tenant.name + " started " + str(merged[index])
+                                    + " browser(s), including its fanned out bookings, instead of "
+                                    + str(separate[index]))
+
+    def start(self):
+        """
+        start - creates a separate process for each driver, or for each group of
+        tabs_per_browser locations when more than one tab per browser is set
+        :return: None
+        """
+        # Only the planned locations reach the workers, nothing is started for the rejected ones
+        merged_list = list(self.plan().locations)
+        if len(merged_list) == 0:
+            eb.get_event_bus().info(None, "Nothing to run, fix the preflight rejections above")
+            eb.get_event_bus().flush()
+            return
+
+        # Clean up after runs that crashed or were killed
+        self.lifecycle.reap_orphans()
+        signal.signal(signal.SIGTERM, Overseer.handle_terminate)
+
+        tabs_per_browser = self.preferences.tabs_per_browser
+        if tabs_per_browser > 1:
+            worker = self.start_tab_worker
+            groups = [merged_list]
+            if self.tenants is not None:
+                # Tabs share the login, so one browser only holds the watches one tenant polls
+                groups = [[watch for watch in merged_list if watch.tenants[0] == tenant]
+                          for tenant in range(len(self.tenants))]
+            work = [group[index:index + tabs_per_browser]
+                    for group in groups for index in range(0, len(group), tabs_per_browser)]
+            if self.preferences.burst_drivers:
+                eb.get_event_bus().info(None, "burst_drivers needs tabs_per_browser 1, polling every location once")
+            arguments = [(item, slot) for slot, item in enumerate(work)]
+            bursts = None
+            budget_locations = [RecGov.format_location_string(merged_location_type[0])
+                                for merged_location_type in merged_list]
+        else:
+            worker = self.start_driver
+            # A burst group runs its location in several workers, offset by the shared phase
+            work, members, bursts = bst.expand(merged_list, self.preferences.burst_drivers,
+                                               RecGov.format_location_string)
+            arguments = [(item, slot, members[slot]) for slot, item in enumerate(work)]
+            # Every burst member takes its own turns, so a group of K gets K shares of the budget
+            budget_locations = [bst.member_label(RecGov.format_location_string(item[0]), members[slot])
+                                for slot, item in enumerate(work)]
 
+        # Shared memory has to be created before the pool for the workers to inherit it
+        budget = None
+        if self.preferences.rate_limit > 0:
+            budget = rb.RequestBudget(self.preferences.rate_limit, budget_locations,
+                                      self.preferences.rate_weights, self.preferences.rate_burst)
+
+        # The shared chromedriver service is started here so every worker can open its session on it
+        self.backend.start(self.lifecycle)
+        if self.profiles is not None:
+            self.warm_profile()
+        results = None
+        # Workers past the backend capacity wait for a free slot, the slot picks the remote hub
+        process_pool = mp.Pool(processes=self.backend.concurrency(len(work)), initializer=Overseer.init_worker,
+                               initargs=(budget, self.preferences.stack_dir, bursts))
+        try:
+            results = process_pool.starmap(worker, arguments, chunksize=1)
+            process_pool.close()
+        except KeyboardInterrupt:
+            eb.get_event_bus().info(None, "Stopping, cleaning up drivers")
+            process_pool.terminate()
+        finally:
+            process_pool.join()
+            # Sessions without a chromedriver of their own are quit first, so stopping the shared
+            # service keeps only the checkout browsers, on ctrl-c as well
+            self.lifecycle.quit_sessions()
+            self.backend.stop(self.lifecycle)
+            self.lifecycle.reap_run()
+            self.lifecycle.reap_orphans()
+            if budget is not None:
+                Overseer.report_budget(budget)
+            if bursts is not None:
+                Overseer.report_bursts(bursts)
+            if self.tenants is not None and results is not None:
+                self.report_tenancy(results, work)
+            eb.get_event_bus().flush()
@@ -0,0 +1,324 @@
+"""
+This module provides the browserless permit quota poller. The entry point quotas are read
+as json over kept alive HTTP connections and decoded into QuotaRecords, so the browser is
+only needed to book once a date has room for the group.
+
+    python3 -m src.permit_api --check fixtures/permit_api
+
+decodes the payloads in a directory and checks them against their expected records.
+"""
+
+import argparse
+import http.client
+import json
+from collections import namedtuple
+from datetime import date, timedelta
+from os import listdir, path
+from urllib.parse import urlencode, urlsplit
+
+# One entry point on one date
+QuotaRecord = namedtuple("QuotaRecord", ["entry_point", "date", "remaining", "total"])
+
+# The two availability endpoints, most permits use the first, the Inyo permits (e.g. Mt Whitney) the second
+MONTH_PATH = "/api/permits/{permit_id}/availability/month"
+INYO_PATH = "/api/permitinyo/{permit_id}/availabilityv2"
+CONTENT_PATH = "/api/permitcontent/{permit_id}"
+
+# The client of this process, shared by the permit locations polled in its tabs
+_client = None
+
+
+class PayloadFormatException(Exception):
+    pass
+
+
+class QuotaUnavailableException(Exception):
+    pass
+
+
+class UnknownEntryPointException(Exception):
+    pass
+
+
+def _payload(document):
+    if not isinstance(document, dict) or not isinstance(document.get("payload"), dict):
+        raise PayloadFormatException("No payload object in the response")
+    return document["payload"]
+
+
+def _day(value):
+    """
+    _day - the date of a payload key, e.g. 2022-06-12 or 2022-06-12T00:00:00Z
+    :param value: the key
+    :return: date: the date
+    """
+    try:
+        year, month, day = value[:10].split("-")
+        return date(int(year), int(month), int(day))
+    except (ValueError, AttributeError):
+        raise PayloadFormatException("Not a date: " + str(value))
+
+
+def _record(entry_point, day, quota):
+    try:
+        return QuotaRecord(entry_point, day, int(quota["remaining"]), int(quota["total"]))
+    except (KeyError, TypeError, ValueError):
+        raise PayloadFormatException("No remaining and total for " + str(entry_point) + " on " + str(day))
+
+
+def parse_divisions(document):
+    """
+    parse_divisions - the entry points of a permit from its content payload
+    :param document: the decoded permitcontent response
+    :return: dict: division id -> (name, code)
+    """
+    divisions = _payload(document).get("divisions")
+    if not isinstance(divisions, dict):
+        raise PayloadFormatException("No divisions in the permit content")
+    return {str(division_id): (division.get("name", ""), division.get("code", ""))
+            for division_id, division in divisions.items()}
+
+
+def parse_month_availability(document):
+    """
+    parse_month_availability - decodes the month availability payload, keyed by division then date
+    :param document: the decoded availability/month response
+    :return: list: the QuotaRecords, entry_point is the division id
+    """
+    availability = _payload(document).get("availability")
+    if not isinstance(availability, dict):
+        raise PayloadFormatException("No availability in the month payload")
+
+    records = list()
+    for division_id, division in availability.items():
+        for day, quota in (division.get("date_availability") or dict()).items():
+            records.append(_record(str(division_id), _day(day), quota))
+    return records
+
+
+def parse_inyo_availability(document):
+    """
+    parse_inyo_availability - decodes the Inyo availability payload, keyed by date then division
+    :param document: the decoded availabilityv2 response
+    :return: list: the QuotaRecords, entry_point is the division id
+    """
+    records = list()
+    for day, divisions in _payload(document).items():
+        if not isinstance(divisions, dict):
+            raise PayloadFormatException("No divisions on " + str(day))
+        for division_id, quota in divisions.items():
+            records.append(_record(str(division_id), _day(day), quota))
+    return records
+
+
+class KeepAliveClient:
+    """ This class keeps one HTTP connection per host open and reuses it for every request. """
+
+    def __init__(self, timeout=10):
+        """
+        __init__ - constructor
+        :param timeout: seconds a request may take
+        """
+        self._timeout = timeout
+        # (scheme, host) -> connection
+        self._connections = dict()
+        self.requests = 0
+        self.connects = 0
+
+    def _connection(self, scheme, host):
+        key = (scheme, host)
+        if key not in self._connections:
+            connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            self._connections[key] = connection_class(host, timeout=self._timeout)
+            self.connects += 1
+        return self._connections[key]
+
+    def get_json(self, url):
+        """
+        get_json - fetches and decodes a json document, reconnecting once if the server closed the connection
+        :param url: the absolute url
+        :return: the decoded document
+        """
+        parts = urlsplit(url)
+        target = parts.path + ("?" + parts.query if parts.query else "")
+        for attempt in range(2):
+            connection = self._connection(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", target, headers={"Accept": "application/json",
+                                                           "Connection": "keep-alive"})
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                del self._connections[(parts.scheme, parts.netloc)]
+                if attempt == 1:
+                    raise
+                continue
+
+            self.requests += 1
+            if response.status != 200:
+                raise QuotaUnavailableException(url + " returned " + str(response.status))
+            try:
+                return json.loads(body.decode("utf-8"))
+            except ValueError:
+                raise PayloadFormatException(url + " did not return json")
+
+    def close(self):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+
+def get_client():
+    """
+    get_client - the keep alive client of this process, created on first use
+    :return: KeepAliveClient: the client
+    """
+    global _client
+    if _client is None:
+        _client = KeepAliveClient()
+    return _client
+
+
+class PermitQuotaPoller:
+    """ This class reads the quota of one permit entry point over HTTP. """
+
+    def __init__(self, client, base_url, permit_id, entry_point):
+        """
+        __init__ - constructor
+        :param client: the KeepAliveClient, shared by the locations of a worker
+        :param base_url: the site url, e.g. https://www.recreation.gov/
+        :param permit_id: the permit id from the availability link
+        :param entry_point: the entry point ID or name from the permit locations file
+        """
+        self._client = client
+        self._base_url = base_url.rstrip("/")
+        self._permit_id = permit_id
+        self._entry_point = entry_point
+        self._division_id = None
+        # MONTH_PATH or INYO_PATH, found on the first read
+        self._kind = None
+
+    def _url(self, template, params=None):
+        url = self._base_url + template.format(permit_id=self._permit_id)
+        return url + ("?" + urlencode(params) if params else "")
+
+    def division_id(self):
+        """
+        division_id - resolves the entry point to its division id by code, name or id
+        :return: str: the division id
+        """
+        if self._division_id is None:
+            wanted = self._entry_point.strip().lower()
+            divisions = parse_divisions(self._client.get_json(self._url(CONTENT_PATH)))
+            for division_id, (name, code) in divisions.items():
+                if wanted in (division_id.lower(), name.strip().lower(), code.strip().lower()):
+                    self._division_id = division_id
+                    break
+            else:
+                matches = [division_id for division_id, (name, code) in divisions.items()
+                           if wanted in name.lower()]
+                if len(matches) != 1:
+                    raise UnknownEntryPointException("Entry point " + self._entry_point + " matches "
+                                                     + str(len(matches)) + " divisions")
+                self._division_id = matches[0]
+        return self._division_id
+
+    def _read(self, kind, day):
+        first = day.replace(day=1)
+        if kind == MONTH_PATH:
+            return parse_month_availability(self._client.get_json(self._url(MONTH_PATH, [
+                ("start_date", first.isoformat() + "T00:00:00.000Z"), ("commercial_acct", "false"),
+                ("is_lottery", "false")])))
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return parse_inyo_availability(self._client.get_json(self._url(INYO_PATH, [
+            ("start_date", first.isoformat()), ("end_date", last.isoformat()), ("commercial_acct", "false")])))
+
+    def quota(self, day):
+        """
+        quota - the quota of the entry point on a day
+        :param day: the date
+        :return: QuotaRecord: the record, None if the payload has no quota for that day
+        """
+        division_id = self.division_id()
+        if self._kind is None:
+            try:
+                records = self._read(MONTH_PATH, day)
+                self._kind = MONTH_PATH
+            except QuotaUnavailableException:
+                records = self._read(INYO_PATH, day)
+                self._kind = INYO_PATH
+        else:
+            records = self._read(self._kind, day)
+
+        for record in records:
+            if record.entry_point == division_id and record.date == day:
+                return record
+        return None
+
+
+def comparable(result):
+    """
+    comparable - a decoded payload in the form of its expected file, records sorted by entry point and date
+    :param result: the divisions dict or the list of QuotaRecords
+    :return: the json compatible form
+    """
+    if isinstance(result, dict):
+        return {division_id: list(division) for division_id, division in result.items()}
+    return sorted(({"entry_point": record.entry_point, "date": record.date.isoformat(),
+                    "remaining": record.remaining, "total": record.total} for record in result),
+                  key=lambda record: (record["entry_point"], record["date"]))
+
+
+def check(directory):
+    """
+    check - decodes the recorded payloads in a directory by their file name prefix,
+    content_, month_ or inyo_, and compares the records with the payload's .expected.json
+    :param directory: the directory of json files
+    :return: bool: True if every payload decoded to its expected records
+    """
+    parsers = {"content_": parse_divisions, "month_": parse_month_availability, "inyo_": parse_inyo_availability}
+    matched = True
+    for name in sorted(listdir(directory)):
+        parser = [parser for prefix, parser in parsers.items() if name.startswith(prefix)]
+        if len(parser) == 0 or not name.endswith(".json") or name.endswith(".expected.json"):
+            continue
+        expected_file = path.join(directory, name[:-len(".json")] + ".expected.json")
+        try:
+            with open(path.join(directory, name), "r") as payload_file:
+                result = comparable(parser[0](json.load(payload_file)))
+        except (PayloadFormatException, ValueError) as e:
+            matched = False
+            print(name + ": " + str(e))
+            continue
+        if not path.exists(expected_file):
+            matched = False
+            print(name + ": no " + path.basename(expected_file) + " with the records it has to decode to")
+            continue
+        with open(expected_file, "r") as expected_output:
+            expected = json.load(expected_output)
+        if isinstance(expected, list):
+            expected = sorted(expected, key=lambda record: (record["entry_point"], record["date"]))
+        if result == expected:
+            print(name + ": " + str(len(result)) + " record(s) as expected")
+            continue
+        matched = False
+        print(name + ": does not match " + path.basename(expected_file))
+        for record in (expected.items() if isinstance(expected, dict) else expected):
+            if record not in (result.items() if isinstance(result, dict) else result):
+                print("    missing  " + str(record))
+        for record in (result.items() if isinstance(result, dict) else result):
+            if record not in (expected.items() if isinstance(expected, dict) else expected):
+                print("    decoded  " + str(record))
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decodes recorded permit quota payloads")
+    parser.add_argument("--check", default="fixtures/permit_api", help="directory of recorded payloads")
+    arguments = parser.parse_args()
+    if not check(arguments.check):
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,10 @@
 This module provides the flow for permit reservations
 """
 
-from traceback import print_exc
-from time import sleep
-from re import sub
-from datetime import date, datetime, time
+from time import sleep, monotonic
+from re import sub, search
+from traceback import format_exc
+from datetime import date
 from datetime import timedelta
 from calendar import monthrange
 from selenium import webdriver
@@ -13,14 +13,14 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
 
-from src.recgov import RecGov
+from src.recgov import RecGov, EndOfTriesException
 from src.date_handler import DateHandler
-
-
-class EndOfTriesException(Exception):
-    pass
+from src.url_builder import UrlBuilder
+from src.flow_runner import WorkerStalledException
+from src.permit_api import PermitQuotaPoller, QuotaUnavailableException, get_client
+import src.wait_strategy as ws
+import src.locators as lc
 
 
 class CommercialTripException(Exception):
@@ -30,6 +30,8 @@ class CommercialTripException(Exception):
 class PermitRecGov(RecGov):
     """ This class provides the functionality for permit reservations. """
 
+    TERMINAL_EXCEPTIONS = (EndOfTriesException, CommercialTripException)
+
     def __init__(self, driver, preferences, permit_location):
         """
         __init__ - constructor
@@ -39,6 +41,11 @@ class PermitRecGov(RecGov):
         """
         super(PermitRecGov, self).__init__(driver, preferences, permit_location)
         self._permit_details = preferences.permit_details
+        self._entry_point = None
+        self._permit_http = preferences.permit_http
+        self._permit_http_interval = preferences.permit_http_interval
+        self._quota_poller = None
+        self._quota_read = None
 
     def execute(self):
         """
@@ -46,70 +53,137 @@ class PermitRecGov(RecGov):
         :return: bool: True if successfully in checkout, False otherwise
         """
         try:
-            super(PermitRecGov, self).navigate_site()
-            super(PermitRecGov, self).log_into_account()
-            self._navigate_permit_heading()
-            self._load_permit_link()
-            self._poll()
+            super(PermitRecGov, self).run_steps(super(PermitRecGov, self).flow_steps())
             # unreachable unless successfully booking
             # detaches browser on successful selection of permits
             return True
         except EndOfTriesException as e:
-            print(e)
+            self._events.info(None, str(e))
         except CommercialTripException as e:
-            print(e)
+            self._events.info(None, str(e))
+        except WorkerStalledException:
+            # The overseer restarts the browser and runs the flow again
+            raise
         except Exception:
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location), "execute() failed")
 
         return False
 
-    def _poll(self):
+    def locate(self):
         """
-        _poll - polls the availability page
+        locate - opens the permit availability page, skipping the search when the link is already known
         :return: None
         """
-        retries = 0
+        if self._location_link is None:
+            self._navigate_permit_heading()
+            self._load_permit_link()
+        self._reload_availability()
 
-        self._driver.refresh()
+    def configure(self):
+        """
+        configure - sets the permit type, group size and date and selects the entry point
+        :return: None
+        """
         self._scheduling_details()
-        entry_point = self._select_permit()
-        super(PermitRecGov, self).wait()
-        result = 0
-
-        # if an end time is specified, execute until that time
-        # otherwise, execute for a set number of times
-        if self._time_end:
-            current_time = datetime.now().time()
-            while current_time < self._time_end:
-                self._refresh_availability_table()
-                result = self._handle_availability(entry_point, retries + 1)
-                if result == 1:
-                    return True
-                retries += 1
-                current_time = datetime.now().time()
-
-                self._driver.refresh()
-                self._scheduling_details()
-                entry_point = self._select_permit()
+        self._entry_point = self._select_permit()
+
+    def poll_once(self, iteration):
+        """
+        poll_once - evaluates the availability grid once and reloads it for the next iteration
+        :param iteration: the current refresh try
+        :return: int: 1 if in checkout, 0 otherwise
+        """
+        iteration_start = monotonic()
+        traced = super(PermitRecGov, self).begin_trace(iteration)
+        engine = super(PermitRecGov, self).cdp_engine()
+        quota_closed = False
+        if self._permit_http:
+            quota_closed = not self._quota_open()
+            if not quota_closed and self._permit_http:
+                # The page was left alone while the quota was closed, bring the grid up to date to book
+                self._reload_grid()
+
+        if quota_closed:
+            result = 0
+        elif engine is not None and not self._any_available(engine):
+            result = 0
         else:
-            while retries < self._num_refreshes:
-                self._refresh_availability_table()
-                result = self._handle_availability(entry_point, retries + 1)
-                if result == 1:
-                    return True
-                retries += 1
+            self._refresh_availability_table()
+            result = self._handle_availability(self._entry_point, iteration)
+        super(PermitRecGov, self).end_trace(iteration, traced)
+        self._events.poll(RecGov.format_location_string(self._location),
+                          "#" + str(iteration) + " result " + str(result) + (" (quota)" if quota_closed else ""))
+        # In checkout the grid is left as it is, the iteration is still timed like camp's
+        if result != 1 and not self._permit_http:
+            self._reload_grid()
+        super(PermitRecGov, self).record_iteration(iteration, iteration_start)
+
+        return result
+
+    def _reload_grid(self):
+        """
+        _reload_grid - reloads the availability page and sets the scheduling details and entry point again
+        :return: None
+        """
+        self._reload_availability()
+        self._scheduling_details()
+        self._entry_point = self._select_permit()
 
-                self._driver.refresh()
-                self._scheduling_details()
-                entry_point = self._select_permit()
+    def _quota_open(self):
+        """
+        _quota_open - reads the entry point quota over HTTP, the browser stays idle on the
+        availability page until the requested date has room for the group
+        :return: bool: True if Selenium should reload and evaluate the grid
+        """
+        if self._permit_details['dates'] is None or self._permit_details['dates'][0] is None:
+            return True
+        try:
+            if self._quota_poller is None:
+                permit_id = search(r"/permits/(\d+)", self._location_link or "")
+                if permit_id is None:
+                    raise QuotaUnavailableException("No permit id in the availability link")
+                self._quota_poller = PermitQuotaPoller(get_client(), self._url, permit_id.group(1),
+                                                       self._location.split(":")[1])
+            super(PermitRecGov, self).throttle()
+            self._quota_read = monotonic()
+            record = self._quota_poller.quota(self._permit_details['dates'][0])
+            super(PermitRecGov, self).decide("HTTP quota " + (str(record.remaining) + " of " + str(record.total)
+                                                              if record is not None else "not listed")
+                                             + ", " + str(self._guests) + " needed")
+            return record is not None and record.remaining >= self._guests
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location),
+                               "PermitRecGov._quota_open() failed, polling through Selenium")
+            self._permit_http = False
+        return True
 
-        except_str = RecGov.format_location_string(self._location) + ": driver stopping, tried " + \
-                     str(retries) + " times"
-        if self._time_end:
-            except_str += ", reached timeout " + str(self._time_end)
+    def poll_delay(self):
+        """
+        poll_delay - seconds until the location is due, a quota read over HTTP waits permit_http_interval
+        after the last one as well
+        :return: float: 0 when the location is due
+        """
+        delay = super(PermitRecGov, self).poll_delay()
+        if self._permit_http and self._quota_read is not None:
+            delay = max(delay, self._quota_read + self._permit_http_interval - monotonic())
+        return delay
 
-        # Unable to successfully book permits
-        raise EndOfTriesException(except_str)
+    def _any_available(self, engine):
+        """
+        _any_available - checks the grid for an open cell in one DevTools call, the page is
+        reloaded by Selenium every iteration so only the read goes over DevTools
+        :param engine: the CdpEngine of this tab
+        :return: bool: True if Selenium should evaluate the grid
+        """
+        try:
+            available = engine.evaluate("return document.querySelector('.rec-grid-grid-cell.available') !== null;")
+            super(PermitRecGov, self).decide("DevTools grid read: " + ("an open cell" if available else "no open cell"))
+            return available
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location),
+                               "PermitRecGov._any_available() failed, polling through Selenium")
+            super(PermitRecGov, self).set_cdp_enabled(False)
+        return True
 
     def _navigate_permit_heading(self):
         """
@@ -124,7 +198,20 @@ class PermitRecGov(RecGov):
         :return: None
         """
         super(PermitRecGov, self).navigate_location_link(self._location.split(":")[0], "/permits/",
-                                                         "/registration/detailed-availability")
+                                                         "/registration/detailed-availability",
+                                                         UrlBuilder.permit_query(self._permit_details, self._guests))
+
+    def _reload_availability(self):
+        """
+        _reload_availability - reloads the availability page, through the deep link when enabled
+        so a Next Available date found on the first pass is encoded as well
+        :return: None
+        """
+        if self._deep_links and self._location_link is not None:
+            super(PermitRecGov, self).load_page(UrlBuilder.with_query(
+                self._location_link, UrlBuilder.permit_query(self._permit_details, self._guests)))
+        else:
+            super(PermitRecGov, self).load_page()
 
     def _permit_type(self):
         """
@@ -136,7 +223,7 @@ class PermitRecGov(RecGov):
         if 'permit_type' in self._permit_details:
             permit_type = ", ".join(self._permit_details['permit_type']).lower()
 
-        permit_type_element = self._driver.find_elements_by_id("permit-type")
+        permit_type_element = self._lookup.may(By.ID, "permit-type")
 
         if len(permit_type_element) > 0:
             # Find the correct option and click it
@@ -162,7 +249,7 @@ class PermitRecGov(RecGov):
             if "yes" in commercial_trip_type:
                 commercial_trip_id = "prompt-answer-yes1"
 
-        commercial_trip = self._driver.find_elements_by_id(commercial_trip_id)
+        commercial_trip = self._lookup.may(By.ID, commercial_trip_id)
 
         if len(commercial_trip) > 0:
             # Only click if the option is actually present
@@ -172,19 +259,39 @@ class PermitRecGov(RecGov):
                 sleep(self._wait_duration)
                 raise CommercialTripException(RecGov.format_location_string(self._location) + ": You have selected a commercial trip")
 
-    def _add_group_member(self, path):
+    def _add_group_member(self, locator):
         """
         _add_group_member - adds the correct number of guests to the reservation
-        :param path: the path to the button, changes based on the page
+        :param locator: the name of the button's locator, changes based on the page
         :return: None
         """
-        add_group_member = self._driver.find_elements_by_xpath(path)
+        add_group_member = self._lookup.first(lc.NAMED, locator)
+        if add_group_member is None:
+            return
+
+        def missing_guests():
+            # Only add the guests the deep link has not already added
+            current_guests = self._driver.execute_script(
+                "var field = arguments[0].parentElement.querySelector('input');"
+                "return field === null ? null : field.value;", add_group_member)
+            if current_guests is not None and current_guests.strip().isdigit():
+                return max(self._guests - int(current_guests.strip()), 0)
+            return None
+
+        def add_missing_guests():
+            missing = missing_guests()
+            for i in range(self._guests if missing is None else missing):
+                add_group_member.click()
+
+        missing = missing_guests()
+        if missing == 0:
+            return
 
-        if len(add_group_member) > 0:
-            # Click the button to add the correct number of guests
-            # Unable to send the value to the selection field as the field will reject the value
-            for i in range(self._guests):
-                add_group_member[0].click()
+        # Click the button to add the correct number of guests, all clicks in one script call
+        # Unable to send the value to the selection field as the field will reject the value
+        # A counter that can not be read is taken as added, clicking again could overshoot
+        self._interactions.click("group size", [add_group_member] * (self._guests if missing is None else missing),
+                                 lambda: missing_guests() in (0, None), add_missing_guests)
 
     def _select_dates(self):
         """
@@ -192,16 +299,18 @@ class PermitRecGov(RecGov):
         :return: None
         """
         if self._permit_details['dates'] is not None:
-            super(PermitRecGov, self).select_date(self._permit_details['dates'][0], "SingleDatePicker1")
-            self._driver.find_element_by_id("SingleDatePicker1").send_keys(Keys.TAB)
+            # Skip typing the date when the deep link already set it
+            if super(PermitRecGov, self).date_applied(self._permit_details['dates'][0], "SingleDatePicker1"):
+                return
+            super(PermitRecGov, self).select_date(self._permit_details['dates'][0], "SingleDatePicker1", blur=True)
             return
 
         # No dates provided, use the next available
-        sleep(self._wait_duration)
+        self._waits.until("PermitRecGov._select_dates()", self._lookup.clickable("next_available"))
         super(PermitRecGov, self).next_available()
 
         # Grab this next available date from the calendar
-        date_input = self._driver.find_element_by_id("SingleDatePicker1")
+        date_input = self._lookup.must(By.ID, "SingleDatePicker1")
         next_avail_dates = date_input.get_attribute("value")
 
         if next_avail_dates is None:
@@ -219,19 +328,22 @@ class PermitRecGov(RecGov):
         :return: None
         """
         try:
+            # The form renders as a whole after a refresh, wait for it once so the
+            # optional controls below can be checked instantly
+            self._lookup.must(By.ID, "SingleDatePicker1", self._long_delay)
             self._permit_type()
             self._commercial_trip()
             # Attempt to add group members using the two different page layouts
-            self._add_group_member("//button[@aria-label='Add guests']")
-            self._add_group_member("//button[@aria-label='Add group members']")
+            self._add_group_member("add_guests")
+            self._add_group_member("add_group_members")
             self._select_dates()
 
         except CommercialTripException as e:
             raise e
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": PermitRecGov._scheduling_details() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "PermitRecGov._scheduling_details() failed")
             raise e
 
     def _refresh_availability_table(self):
@@ -248,8 +360,8 @@ class PermitRecGov(RecGov):
             """
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": PermitRecGov._refresh_availability_table() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "PermitRecGov._refresh_availability_table() failed")
             raise e
 
     def _book_now(self, entry_point, book_date, iteration):
@@ -260,15 +372,15 @@ class PermitRecGov(RecGov):
         :return: True if successfully in checkout, else False
         """
         try:
-            output_str = "#" + str(iteration) + ": " + RecGov.format_location_string(self._location) + \
+            output_str = "#" + str(iteration) + \
                          ": Able to book: " + entry_point + " for: " + book_date + ", you must log in to proceed"
             
-            if super(PermitRecGov, self).book_now("//span[contains(text(), 'Book Now')]"):
+            if super(PermitRecGov, self).book_now("book_now"):
                 return super(PermitRecGov, self).finish_book_now(output_str, RecGov.format_location_string(self._location))
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": PermitRecGov._book_now() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "PermitRecGov._book_now() failed")
             raise e
 
         # Any issues, etc. continue polling the availability page
@@ -279,10 +391,7 @@ class PermitRecGov(RecGov):
         _clear_selection - clears the selection on the table
         :return: None
         """
-        clear_selection_elements = self._driver.find_elements_by_xpath("//span[contains(text(), 'Clear Dates')]")
-        if len(clear_selection_elements) > 0:
-            clear_selection = RecGov.find_parent_with_tag(clear_selection_elements[0], "button")
-            clear_selection.click()
+        self._elements.act(lc.NAMED, "clear_dates", lambda button: button.click(), "button", must=False)
 
     def _handle_availability(self, entry_point, iteration):
         """
@@ -295,10 +404,10 @@ class PermitRecGov(RecGov):
             self._clear_selection()
     
             # Grab the container for the page
-            grid_cell_available = self._driver.find_elements_by_class_name('rec-grid-grid-cell.available')
+            grid_cell_available = self._lookup.may(By.CLASS_NAME, 'rec-grid-grid-cell.available')
 
             for index in range(0, len(grid_cell_available)):
-                available_date_button = grid_cell_available[0].find_elements_by_tag_name("button")
+                available_date_button = self._lookup.may(By.TAG_NAME, "button", root=grid_cell_available[0])
                 if len(available_date_button) == 0:
                     return 0
 
@@ -320,12 +429,16 @@ class PermitRecGov(RecGov):
                     permits_available = int(sub("[^0-9]", "", str(permits_available.split("out of")[0])))
 
                 book_date = self._permit_details['dates'][0]
+                super(PermitRecGov, self).decide("open cell on day " + str(day_date) + " with " + str(permits_available)
+                                                 + " permit(s), " + str(self._guests) + " needed on day "
+                                                 + str(book_date.day))
 
                 if permits_available < self._guests or book_date.day != day_date:
                     return 0
 
-                ActionChains(self._driver).move_to_element(available_date_button).click(
-                    available_date_button).perform()
+                # Selecting the cell brings up Book Now
+                self._interactions.click("date selection", [available_date_button],
+                                         lambda: self._lookup.first(lc.NAMED, "book_now") is not None)
 
                 book_date_str = DateHandler.datetime_to_normal_text(book_date)
 
@@ -334,8 +447,9 @@ class PermitRecGov(RecGov):
                 return 1 if self._book_now(entry_point, book_date_str, iteration) else 0
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": CampRecGov._handle_availability() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "CampRecGov._handle_availability() failed")
+            super(PermitRecGov, self).dump_flight("PermitRecGov._handle_availability() failed", format_exc())
             return 0
 
     def _select_permit(self):
@@ -344,18 +458,23 @@ class PermitRecGov(RecGov):
         :return: None
         """
         try:
-            filter_button = self._driver.find_element_by_xpath("//span[contains(text(), 'Filters')]")
+            filter_button = self._lookup.must(lc.NAMED, "filters")
             filter_button = RecGov.find_parent_with_tag(filter_button, "button")
             filter_button.click()
 
-            entry_point_input = self._driver.find_element_by_id("division-search-input")
+            entry_point_input = self._lookup.must(By.ID, "division-search-input")
             entry_point_input.send_keys(self._location.split(":")[1])
             entry_point_input.send_keys(Keys.RETURN)
-            sleep(self._wait_duration)
+            # Wait for the grid to show the entry point row and the filter requests to finish
+            entry_point_row = "//div[contains(@class, 'rec-grid-row') and contains(., '" \
+                              + self._location.split(":")[1] + "')]"
+            self._waits.until("PermitRecGov._select_permit()",
+                              ws.all_of(ws.element_present((By.XPATH, entry_point_row)),
+                                        ws.network_settled()))
 
             return self._location.split(":")[1]
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": PermitRecGov._select_permit() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "PermitRecGov._select_permit() failed")
             raise e
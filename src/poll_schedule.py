@@ -0,0 +1,322 @@
+"""
+This module provides the cancellation schedule. Every poll and every opening found is
+recorded per location and time of day, and the recorded history predicts when openings
+show up. Polling runs back to back in the predicted windows and idles in between.
+
+    python3 -m src.poll_schedule --file schedule/observations.jsonl
+
+prints the predicted windows of each location and the predicted and observed hits.
+"""
+
+import argparse
+import json
+from datetime import datetime
+from os import makedirs, path
+from time import time
+
+# Width of a time of day slot, openings are predicted per slot
+SLOT_MINUTES = 10
+SLOTS = 24 * 60 // SLOT_MINUTES
+# Polls worth of the pooled rate a location starts from, so a few lucky polls do not make a window
+PRIOR_POLLS = 50.0
+# Share of a slot's counts given to each neighbour, openings drift a few minutes day to day
+NEIGHBOUR_SHARE = 0.25
+# How many times the location's average chance a slot needs to be a predicted window
+WINDOW_RATIO = 2.0
+
+
+def slot_of(timestamp):
+    """
+    slot_of - the time of day slot of a timestamp
+    :param timestamp: seconds since the epoch
+    :return: int: the slot index
+    """
+    moment = datetime.fromtimestamp(timestamp)
+    return (moment.hour * 60 + moment.minute) // SLOT_MINUTES
+
+
+def slot_label(slot):
+    minutes = slot * SLOT_MINUTES
+    return "%02d:%02d" % (minutes // 60, minutes % 60)
+
+
+def window_ranges(slots):
+    """
+    window_ranges - formats slots as time of day ranges
+    :param slots: the slot indexes
+    :return: str: e.g. 06:50-07:20, 17:00-17:10
+    """
+    ranges = list()
+    for slot in sorted(slots):
+        if len(ranges) > 0 and ranges[-1][1] == slot:
+            ranges[-1][1] = slot + 1
+        else:
+            ranges.append([slot, slot + 1])
+    return ", ".join(slot_label(start) + "-" + slot_label(end) for start, end in ranges)
+
+
+class ObservationStore:
+    """ This class appends poll and hit counts to a json lines file shared by the workers. """
+
+    def __init__(self, observations_file):
+        """
+        __init__ - constructor
+        :param observations_file: path to the observations file, created on the first write
+        """
+        self._file = observations_file
+
+    def load(self):
+        """
+        load - sums the recorded counts per location and slot
+        :return: dict: location -> {"polls": list per slot, "hits": list per slot}
+        """
+        counts = dict()
+        if not path.exists(self._file):
+            return counts
+
+        with open(self._file, "r") as observations:
+            for line in observations:
+                try:
+                    record = json.loads(line)
+                    slot = int(record["slot"]) % SLOTS
+                except (ValueError, KeyError, TypeError):
+                    # A worker killed mid write leaves a partial line
+                    continue
+                location = counts.setdefault(record["location"], {"polls": [0] * SLOTS, "hits": [0] * SLOTS})
+                location["polls"][slot] += record.get("polls", 0)
+                location["hits"][slot] += record.get("hits", 0)
+        return counts
+
+    def append(self, location, day, slot, polls, hits):
+        """
+        append - records the counts of one location and slot, one short line per write
+        so the workers can append to the same file
+        :param location: the formatted location string
+        :param day: the date of the slot, iso format
+        :param slot: the slot index
+        :param polls: polls made in the slot
+        :param hits: openings found in the slot
+        :return: None
+        """
+        if path.dirname(self._file):
+            makedirs(path.dirname(self._file), exist_ok=True)
+        with open(self._file, "a") as observations:
+            observations.write(json.dumps({"location": location, "day": day, "slot": slot,
+                                           "polls": polls, "hits": hits}) + "\n")
+
+
+class CancellationModel:
+    """ This class predicts the chance a poll finds an opening, per location and slot. """
+
+    def __init__(self, counts):
+        """
+        __init__ - constructor
+        :param counts: the counts from ObservationStore.load
+        """
+        self._counts = {location: {"polls": CancellationModel._spread(location_counts["polls"]),
+                                   "hits": CancellationModel._spread(location_counts["hits"])}
+                        for location, location_counts in counts.items()}
+        self._pooled_polls = [sum(counts["polls"][slot] for counts in self._counts.values()) for slot in range(SLOTS)]
+        self._pooled_hits = [sum(counts["hits"][slot] for counts in self._counts.values()) for slot in range(SLOTS)]
+        total_polls = sum(self._pooled_polls)
+        self._overall = sum(self._pooled_hits) / total_polls if total_polls > 0 else 0.0
+
+    @staticmethod
+    def _spread(values):
+        """
+        _spread - shares part of each slot with its neighbours, wrapping at midnight
+        :param values: list per slot
+        :return: list: the spread values
+        """
+        return [values[slot] * (1 - 2 * NEIGHBOUR_SHARE)
+                + (values[slot - 1] + values[(slot + 1) % SLOTS]) * NEIGHBOUR_SHARE for slot in range(SLOTS)]
+
+    def _pooled(self, slot):
+        # Every location's history in the slot, itself pulled towards the overall rate
+        return (self._pooled_hits[slot] + PRIOR_POLLS * self._overall) / (self._pooled_polls[slot] + PRIOR_POLLS)
+
+    def probability(self, location, slot):
+        """
+        probability - the chance a poll of the location in the slot finds an opening
+        :param location: the formatted location string
+        :param slot: the slot index
+        :return: float: the probability
+        """
+        pooled = self._pooled(slot)
+        if location not in self._counts:
+            return pooled
+        counts = self._counts[location]
+        return (counts["hits"][slot] + PRIOR_POLLS * pooled) / (counts["polls"][slot] + PRIOR_POLLS)
+
+    def windows(self, location):
+        """
+        windows - the slots predicted to be WINDOW_RATIO times as likely as the location's average,
+        every slot when the history shows no such window yet so polling stays at a flat cadence
+        :param location: the formatted location string
+        :return: set: the slot indexes
+        """
+        probabilities = [self.probability(location, slot) for slot in range(SLOTS)]
+        average = sum(probabilities) / SLOTS
+        windows = set(slot for slot in range(SLOTS) if probabilities[slot] >= average * WINDOW_RATIO)
+        if average == 0 or len(windows) == 0:
+            return set(range(SLOTS))
+        return windows
+
+
+class PollScheduler:
+    """ This class paces the polls of one location and records what they found. """
+
+    def __init__(self, model, store, location_str, idle):
+        """
+        __init__ - constructor
+        :param model: the CancellationModel
+        :param store: the ObservationStore the counts are written to
+        :param location_str: the formatted location string
+        :param idle: seconds between polls outside the predicted windows, 0 polls at a flat cadence
+        """
+        self._model = model
+        self._store = store
+        self._location_str = location_str
+        self._idle = idle
+        self._windows = model.windows(location_str)
+        self._last_poll = None
+        # (day, slot) being counted and its polls and hits, written out when the slot changes
+        self._current = None
+        self._polls = 0
+        self._hits = 0
+        # slot -> polls and hits of this run, for the report
+        self._run_polls = dict()
+        self._run_hits = dict()
+        self._started = None
+
+    def delay(self, now=None):
+        """
+        delay - seconds until the location is due, 0 inside a predicted window
+        :param now: the current time, defaults to time()
+        :return: float: the delay
+        """
+        now = time() if now is None else now
+        if self._last_poll is None or self._idle <= 0 or slot_of(now) in self._windows:
+            return 0.0
+        return max(self._last_poll + self._idle - now, 0.0)
+
+    def _count(self, now):
+        key = (datetime.fromtimestamp(now).date().isoformat(), slot_of(now))
+        if self._current != key:
+            self.flush()
+            self._current = key
+        return key[1]
+
+    def record_poll(self, now=None):
+        """
+        record_poll - counts a finished poll
+        :param now: the current time, defaults to time()
+        :return: None
+        """
+        now = time() if now is None else now
+        slot = self._count(now)
+        if self._started is None:
+            self._started = now
+        self._last_poll = now
+        self._polls += 1
+        self._run_polls[slot] = self._run_polls.get(slot, 0) + 1
+
+    def record_hit(self, now=None):
+        """
+        record_hit - counts an opening and writes it out straight away, a booking ends the worker
+        :param now: the current time, defaults to time()
+        :return: None
+        """
+        now = time() if now is None else now
+        slot = self._count(now)
+        self._hits += 1
+        self._run_hits[slot] = self._run_hits.get(slot, 0) + 1
+        self.flush()
+
+    def flush(self):
+        """
+        flush - writes the counts of the current slot, called when the slot changes and when polling ends
+        :return: None
+        """
+        if self._current is not None and (self._polls > 0 or self._hits > 0):
+            self._store.append(self._location_str, self._current[0], self._current[1], self._polls, self._hits)
+        self._polls = 0
+        self._hits = 0
+
+    def report(self):
+        """
+        report - predicted and observed hits of this run against a flat cadence with the same polls
+        :return: dict: the polls, hits observed, hits predicted and hits a flat cadence predicts
+        """
+        polls = sum(self._run_polls.values())
+        if polls == 0:
+            return {"polls": 0, "observed": sum(self._run_hits.values()), "predicted": 0.0, "flat": 0.0}
+        predicted = sum(count * self._model.probability(self._location_str, slot)
+                        for slot, count in self._run_polls.items())
+        # The same polls spread evenly over the slots the run covered
+        run_slots = PollScheduler._slots_between(self._started, time())
+        flat = sum(polls / float(len(run_slots)) * self._model.probability(self._location_str, slot)
+                   for slot in run_slots)
+        return {"polls": polls, "observed": sum(self._run_hits.values()),
+                "predicted": predicted, "flat": flat}
+
+    @staticmethod
+    def _slots_between(start, end):
+        slots = list()
+        moment = start
+        while moment < end or len(slots) == 0:
+            slot = slot_of(moment)
+            if slot not in slots:
+                slots.append(slot)
+            moment += SLOT_MINUTES * 60
+        return slots
+
+    def summary(self):
+        """
+        summary - the report for the stopping message
+        :return: str: the summary
+        """
+        report = self.report()
+        if report["polls"] == 0:
+            return ""
+        return ", schedule predicted " + "%.2f" % report["predicted"] + " hits (flat cadence " \
+               + "%.2f" % report["flat"] + "), observed " + str(report["observed"])
+
+
+def create_scheduler(preferences, location_str):
+    """
+    create_scheduler - the scheduler for a location when poll_schedule is set
+    :param preferences: the preferences to be used during execution
+    :param location_str: the formatted location string
+    :return: PollScheduler: the scheduler, None when scheduling is off
+    """
+    if preferences.poll_schedule is None:
+        return None
+    store = ObservationStore(preferences.poll_schedule)
+    return PollScheduler(CancellationModel(store.load()), store, location_str, preferences.schedule_idle)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predicted opening windows from the recorded observations")
+    parser.add_argument("--file", default="schedule/observations.jsonl", help="the poll_schedule file")
+    arguments = parser.parse_args()
+
+    counts = ObservationStore(arguments.file).load()
+    model = CancellationModel(counts)
+    for location in sorted(counts):
+        windows = model.windows(location)
+        polls = counts[location]["polls"]
+        hits = counts[location]["hits"]
+        predicted = sum(polls[slot] * model.probability(location, slot) for slot in range(SLOTS))
+        window_polls = sum(polls[slot] for slot in windows)
+        window_hits = sum(hits[slot] for slot in windows)
+        other_polls = sum(polls) - window_polls
+        other_hits = sum(hits) - window_hits
+        print(location + ": " + str(sum(polls)) + " polls, " + str(sum(hits)) + " hits observed, "
+              + "%.2f" % predicted + " predicted")
+        print("    windows " + window_ranges(windows))
+        print("    hit rate in windows " + "%.4f" % (window_hits / float(max(window_polls, 1)))
+              + ", elsewhere " + "%.4f" % (other_hits / float(max(other_polls, 1))))
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,20 @@ class NoTimeOrRefreshCountProvidedException(Exception):
     pass
 
 
+def named_setting(location_str, settings, default):
+    """
+    named_setting - the value a "name=value" setting such as rate_weights or burst_drivers gives a location
+    :param location_str: the formatted location string
+    :param settings: list of (name, value), a location containing name gets the value
+    :param default: the value when no name matches
+    :return: the first matching value, default if none match
+    """
+    for name, value in settings or list():
+        if name.lower() in location_str.lower():
+            return value
+    return default
+
+
 class PreferencesHandler:
     """ This class provides the parsing for preferences. """
 
@@ -39,8 +53,9 @@ class PreferencesHandler:
                     preferences[pref_pair[0].strip()] = pref_pair[1].strip()
 
         # We don't care to execute if there aren't any locations provided
-        if 'permit_locations' not in preferences and 'camping_locations' not in preferences:
-            print("Please provide permit/camping locations file in " + prefs)
+        if 'permit_locations' not in preferences and 'camping_locations' not in preferences \
+                and 'region_locations' not in preferences:
+            print("Please provide permit/camping/region locations file in " + prefs)
             exit(1)
 
         # No credentials and no login variable, exit
@@ -66,6 +81,13 @@ class PreferencesHandler:
             self.permit_locations = location_handler.locations
             self.permit_details = location_handler.details
 
+        self.region_details = None
+        self.region_locations = None
+        if 'region_locations' in preferences:
+            location_handler = lh.LocationHandler(preferences['region_locations'], "regions")
+            self.region_locations = location_handler.locations
+            self.region_details = location_handler.details
+
         self.credentials = None
         if 'credentials' in preferences:
             _credential_handler = ch.CredentialHandler(preferences['credentials'])
@@ -73,11 +95,89 @@ class PreferencesHandler:
 
         self.wait_duration = int(preferences['wait_duration']) if 'wait_duration' in preferences else 1
         self.long_delay = int(preferences['long_delay']) if 'long_delay' in preferences else 5
+        # Set to wait_duration to compare iteration times against the old implicit wait
+        self.implicit_wait = float(preferences['implicit_wait']) if 'implicit_wait' in preferences else 0
+        # Condition based waits give up here, defaults to the old fixed sleep
+        self.wait_ceiling = \
+            float(preferences['wait_ceiling']) if 'wait_ceiling' in preferences else self.wait_duration
         self.guests = int(preferences['guests']) if 'guests' in preferences else 2
         self.login = \
             bool(preferences['login']) if 'login' in preferences and "True" in preferences['login'] else False
 
         self.url = preferences['url'] if 'url' in preferences else "https://www.recreation.gov/"
+        # Campground and permit names are looked up before the browsers start, the results are cached here
+        self.resolve_names = \
+            False if 'resolve_names' in preferences and "False" in preferences['resolve_names'] else True
+        self.facility_index = \
+            preferences['facility_index'] if 'facility_index' in preferences else ".facility_index.json"
+        # Registry of the driver processes, used to clean up drivers left behind
+        self.driver_registry = \
+            preferences['driver_registry'] if 'driver_registry' in preferences else ".driver_registry.json"
+        # local starts a chromedriver per browser, shared runs one chromedriver for the run,
+        # remote opens the browsers on the driver_hubs, separated by spaces
+        self.driver_backend = \
+            preferences['driver_backend'].lower() if 'driver_backend' in preferences else "local"
+        self.driver_hubs = preferences['driver_hubs'].split() if 'driver_hubs' in preferences else list()
+        # Requests per second for the whole run, every page load and grid refresh waits its turn, 0 for no limit
+        self.rate_limit = float(preferences['rate_limit']) if 'rate_limit' in preferences else 0
+        self.rate_burst = int(preferences['rate_burst']) if 'rate_burst' in preferences else 1
+        # Shares of the budget when it is short, "name=weight" separated by semicolons, 1 for the rest
+        self.rate_weights = list()
+        if 'rate_weights' in preferences:
+            for weight in preferences['rate_weights'].split(";"):
+                if "=" in weight and float(weight.split("=")[1]) > 0:
+                    self.rate_weights.append((weight.split("=")[0].strip(), float(weight.split("=")[1])))
+        # Drivers polling one location with phase offset refreshes, "name=drivers" separated by semicolons
+        self.burst_drivers = list()
+        if 'burst_drivers' in preferences:
+            for drivers in preferences['burst_drivers'].split(";"):
+                if "=" in drivers and int(drivers.split("=")[1]) > 1:
+                    self.burst_drivers.append((drivers.split("=")[0].strip(), int(drivers.split("=")[1])))
+        # Most browsers at once, per hub for remote, 0 for no limit
+        self.driver_capacity = int(preferences['driver_capacity']) if 'driver_capacity' in preferences else 0
+        # Warm profile template directory, every local browser starts from a copy of it
+        self.profile_template = preferences['profile_template'] if 'profile_template' in preferences else None
+        self.profile_max_age = float(preferences['profile_max_age']) if 'profile_max_age' in preferences else 24
+        # More than 1 polls that many locations from the tabs of a single browser
+        self.tabs_per_browser = int(preferences['tabs_per_browser']) if 'tabs_per_browser' in preferences else 1
+        # Flow steps are retried in the same browser, a stalled step or poll iteration restarts the browser
+        self.step_retries = int(preferences['step_retries']) if 'step_retries' in preferences else 2
+        self.step_timeout = int(preferences['step_timeout']) if 'step_timeout' in preferences else 120
+        self.watchdog_stall = int(preferences['watchdog_stall']) if 'watchdog_stall' in preferences else 60
+        # Clicks and input values dispatched from scripts, native events are still used when the page ignores them
+        self.fast_interactions = \
+            False if 'fast_interactions' in preferences and "False" in preferences['fast_interactions'] else True
+        # Refresh and read the grid over the DevTools websocket, needs websocket-client
+        self.cdp_engine = \
+            True if 'cdp_engine' in preferences and "True" in preferences['cdp_engine'] else False
+        # Read the permit quota over HTTP, the browser only reloads the grid once the date has room to book
+        self.permit_http = \
+            True if 'permit_http' in preferences and "True" in preferences['permit_http'] else False
+        # Fewest seconds between two quota reads of a location, rate_limit is off by default
+        self.permit_http_interval = \
+            float(preferences['permit_http_interval']) if 'permit_http_interval' in preferences else 5
+        # Iterations per location kept in memory and written to flight_dir when one fails or books, 0 for off
+        self.flight_recorder = int(preferences['flight_recorder']) if 'flight_recorder' in preferences else 0
+        self.flight_recorder_kb = \
+            int(preferences['flight_recorder_kb']) if 'flight_recorder_kb' in preferences else 512
+        self.flight_dir = preferences['flight_dir'] if 'flight_dir' in preferences else "flights"
+        # Where a worker writes its collapsed stacks when SIGUSR1 turns its profiler off
+        self.stack_dir = preferences['stack_dir'] if 'stack_dir' in preferences else "stacks"
+        # Locator version file replacing the built in locators it names, see src/locators.py
+        self.locator_file = preferences['locator_file'] if 'locator_file' in preferences else None
+        # Observations file of the cancellation schedule, polls idle outside the predicted windows when set
+        self.poll_schedule = preferences['poll_schedule'] if 'poll_schedule' in preferences else None
+        self.schedule_idle = float(preferences['schedule_idle']) if 'schedule_idle' in preferences else 10
+        self.deep_links = \
+            False if 'deep_links' in preferences and "False" in preferences['deep_links'] else True
+
+        # Event bus sinks, the console is always written to
+        self.log_file = preferences['log_file'] if 'log_file' in preferences else None
+        self.log_max_bytes = int(preferences['log_max_bytes']) if 'log_max_bytes' in preferences else 1048576
+        self.log_backup_count = int(preferences['log_backup_count']) if 'log_backup_count' in preferences else 3
+        self.traceback_interval = \
+            int(preferences['traceback_interval']) if 'traceback_interval' in preferences else 60
+        self.notify_url = preferences['notify_url'] if 'notify_url' in preferences else None
 
         self.time_start = None
         self.time_end = None
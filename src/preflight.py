@@ -0,0 +1,288 @@
+"""
+This module provides the preflight stage. Before any browser starts, every preference and
+location is checked, campground and permit names are resolved against a cached facility
+index and impossible date windows are rejected. What is left is compiled into an immutable
+run plan, and only the plan is handed to the workers.
+"""
+
+import json
+from collections import namedtuple
+from datetime import date
+from os import makedirs, path
+from time import time
+from urllib.parse import urljoin
+
+from src.url_builder import UrlBuilder
+from src.locators import LocatorFileException, load
+from src.permit_api import KeepAliveClient, PermitQuotaPoller, PayloadFormatException, UnknownEntryPointException
+
+# One location for the workers, indexed like the [location, rec_type] pairs it replaces,
+# link is the resolved location page or None when the browser still has to search for it
+PlannedLocation = namedtuple("PlannedLocation", ["location", "rec_type", "link"])
+
+# The compiled plan, every field is a tuple so nothing a worker holds can change it
+RunPlan = namedtuple("RunPlan", ["locations", "rejected", "warnings"])
+
+SEARCH_PATH = "api/search"
+# Days a resolved name is trusted before it is looked up again
+INDEX_MAX_AGE_DAYS = 30
+# Longest stay most campgrounds take, a longer window only gets a warning
+MAX_STAY_NIGHTS = 14
+DRIVER_BACKENDS = ("local", "shared", "remote")
+# Search entity type of each rec type
+ENTITY_TYPES = {"Camping": "campground", "Permits": "permit"}
+
+
+class FacilityIndex:
+    """ This class caches the facility names resolved through the site search in a json file. """
+
+    def __init__(self, index_file, client, url):
+        """
+        __init__ - constructor
+        :param index_file: path to the cache, created on the first save
+        :param client: the KeepAliveClient used for the searches
+        :param url: the site url
+        """
+        self._file = index_file
+        self._client = client
+        self._url = url
+        self._entries = dict()
+        self._changed = False
+        if path.exists(index_file):
+            try:
+                with open(index_file, "r") as cached:
+                    self._entries = json.load(cached)
+            except (OSError, ValueError):
+                self._entries = dict()
+
+    def _key(self, entity_type, name, parent):
+        # The site is part of the key, ids found on the fixture site do not hold on the real one
+        return self._url + " " + entity_type + ":" + name.strip().lower() + ":" + parent.strip().lower()
+
+    def resolve(self, entity_type, name, parent=""):
+        """
+        resolve - finds the facility whose name contains name, preferring one whose park contains parent
+        :param entity_type: campground or permit
+        :param name: the name from the locations file
+        :param parent: the park from the locations file, may be empty
+        :return: dict: {"id", "name", "parent"}, None if the search returned no such facility
+        """
+        key = self._key(entity_type, name, parent)
+        cached = self._entries.get(key)
+        if cached is not None and time() - cached["resolved"] < INDEX_MAX_AGE_DAYS * 86400:
+            return cached["facility"]
+
+        document = self._client.get_json(UrlBuilder.with_query(urljoin(self._url, SEARCH_PATH), [
+            (UrlBuilder.SEARCH_QUERY, name), (UrlBuilder.SEARCH_ENTITY_TYPE, entity_type), ("size", "20")]))
+        if not isinstance(document, dict) or not isinstance(document.get("results"), list):
+            raise PayloadFormatException("No results in the search response")
+
+        matches = [{"id": str(result.get("entity_id")), "name": result.get("name") or "",
+                    "parent": result.get("parent_name") or ""}
+                   for result in document["results"]
+                   if result.get("entity_type") == entity_type
+                   and name.strip().lower() in (result.get("name") or "").lower()]
+        in_parent = [match for match in matches if parent.strip().lower() in match["parent"].lower()]
+        facility = (in_parent or matches or [None])[0]
+        if facility is not None:
+            # Names that were not found are asked again next run, the facility may be listed by then
+            self._entries[key] = {"resolved": time(), "facility": facility}
+            self._changed = True
+        return facility
+
+    def save(self):
+        if not self._changed:
+            return
+        if path.dirname(self._file):
+            makedirs(path.dirname(self._file), exist_ok=True)
+        with open(self._file, "w") as cached:
+            json.dump(self._entries, cached, indent=1)
+
+
+class Preflight:
+    """ This class checks the preferences and locations and compiles the run plan. """
+
+    def __init__(self, preferences, today=None, traced=False):
+        """
+        __init__ - constructor
+        :param preferences: the parsed preferences
+        :param today: the date windows are checked against, defaults to today
+        :param traced: True when the run was started with --trace
+        """
+        self._preferences = preferences
+        self._today = today if today is not None else date.today()
+        self._traced = traced
+        self._rejected = list()
+        self._warnings = list()
+
+    def _reject(self, location, reason):
+        self._rejected.append((location, reason))
+
+    def _warn(self, location, reason):
+        self._warnings.append((location, reason))
+
+    def _check_preferences(self):
+        """
+        _check_preferences - the problems that would stop every location
+        :return: list: the reasons, empty if the preferences can run
+        """
+        preferences = self._preferences
+        problems = list()
+        if preferences.time_start is None and preferences.num_refreshes <= 0:
+            problems.append("num_refreshes has to be above 0 when there is no time_start")
+        if preferences.time_start is not None and preferences.time_end <= preferences.time_start:
+            problems.append("time_start ends before it starts")
+        if preferences.guests < 1:
+            problems.append("guests has to be at least 1")
+        if not preferences.url.startswith("http"):
+            problems.append("url has to be an http or https address")
+        if preferences.login and preferences.credentials is None:
+            problems.append("login is set but no credentials were read")
+        if preferences.driver_backend not in DRIVER_BACKENDS:
+            problems.append("driver_backend has to be one of " + ", ".join(DRIVER_BACKENDS))
+        if preferences.driver_backend == "remote" and len(preferences.driver_hubs) == 0:
+            problems.append("the remote driver_backend needs driver_hubs")
+        # Both talk to chromedriver and the browser's DevTools port on this host
+        if preferences.driver_backend != "local" and preferences.cdp_engine:
+            problems.append("cdp_engine needs the local driver_backend")
+        if preferences.driver_backend != "local" and self._traced:
+            problems.append("--trace needs the local driver_backend")
+        if preferences.tabs_per_browser < 1:
+            problems.append("tabs_per_browser has to be at least 1")
+        if preferences.rate_limit < 0:
+            problems.append("rate_limit can not be negative")
+        try:
+            load(preferences.locator_file)
+        except LocatorFileException as e:
+            problems.append(str(e))
+        return problems
+
+    def _check_stay(self, details, needs_end):
+        """
+        _check_stay - the reason a date window can not be booked
+        :param details: the details of the locations file
+        :param needs_end: True for campgrounds, which need a checkout date
+        :return: str: the reason, None if the window can be booked
+        """
+        if details is None:
+            return "the locations file has no Details section"
+        dates = details.get('dates')
+        if dates is None:
+            return "the dates are missing or malformed" if needs_end else None
+        if dates[0] < self._today:
+            return "the start date " + dates[0].isoformat() + " has passed"
+        if needs_end:
+            if dates[1] is None:
+                return "there is no end date"
+            if dates[1] <= dates[0]:
+                return "the end date " + dates[1].isoformat() + " is not after the start date"
+        return None
+
+    def _camping_details(self, details):
+        reason = self._check_stay(details, True)
+        if reason is None:
+            missing = [field for field in ('site_type', 'allowed_equipment') if field not in details]
+            if len(missing) > 0:
+                reason = "the details are missing " + ", ".join(missing)
+        if reason is None and (details['dates'][1] - details['dates'][0]).days > MAX_STAY_NIGHTS:
+            self._warn(None, "a stay of more than " + str(MAX_STAY_NIGHTS) + " nights is refused by most campgrounds")
+        return reason
+
+    def _permit_details(self, details):
+        reason = self._check_stay(details, False)
+        if reason is None:
+            # An empty dates line uses Next Available, a missing one stops the flow
+            missing = [field for field in ('dates', 'commercial_trip') if field not in details]
+            if len(missing) > 0:
+                reason = "the details are missing " + ", ".join(missing)
+        return reason
+
+    def _resolve(self, index, client, location, rec_type):
+        """
+        _resolve - the location page of a campground or permit, checking a permit's entry point as well
+        :param index: the FacilityIndex
+        :param client: the KeepAliveClient for the permit content
+        :param location: the location string
+        :param rec_type: Camping or Permits
+        :return: (link or None, reason the location can not run or None)
+        """
+        fields = location.split(":")
+        if rec_type == "Camping":
+            facility = index.resolve(ENTITY_TYPES[rec_type], fields[1], fields[0])
+            if facility is None:
+                return None, "no campground named " + fields[1] + " was found"
+            return urljoin(self._preferences.url, "camping/campgrounds/" + facility["id"]), None
+
+        facility = index.resolve(ENTITY_TYPES[rec_type], fields[0])
+        if facility is None:
+            return None, "no permit named " + fields[0] + " was found"
+        # Only an entry point the permit does not list rejects, a failed request leaves the location unresolved
+        try:
+            PermitQuotaPoller(client, self._preferences.url, facility["id"], fields[1]).division_id()
+        except UnknownEntryPointException as e:
+            return None, str(e)
+        return urljoin(self._preferences.url, "permits/" + facility["id"] + "/registration/detailed-availability"), \
+            None
+
+    def compile(self, merged_list):
+        """
+        compile - checks every location and builds the run plan
+        :param merged_list: list of [location, rec_type] from the locations files
+        :return: RunPlan: the locations that can run, and the rejected ones with their reasons
+        """
+        preferences = self._preferences
+        problems = self._check_preferences()
+        if len(problems) > 0:
+            return RunPlan(tuple(), tuple((None, problem) for problem in problems), tuple())
+
+        detail_reasons = {"Camping": self._camping_details(preferences.camping_details)
+                          if preferences.camping_locations is not None else None,
+                          "Permits": self._permit_details(preferences.permit_details)
+                          if preferences.permit_locations is not None else None,
+                          "Region": self._check_stay(preferences.region_details, True)
+                          if preferences.region_locations is not None else None}
+
+        index = None
+        client = KeepAliveClient()
+        if preferences.resolve_names:
+            index = FacilityIndex(preferences.facility_index, client, preferences.url)
+
+        planned = list()
+        for location, rec_type in merged_list:
+            if detail_reasons.get(rec_type) is not None:
+                self._reject(location, detail_reasons[rec_type])
+                continue
+
+            link = None
+            if index is not None and rec_type in ENTITY_TYPES:
+                try:
+                    link, reason = self._resolve(index, client, location, rec_type)
+                    if reason is not None:
+                        self._reject(location, reason)
+                        continue
+                except Exception as e:
+                    # The site could not be asked, the browser searches for the name as before
+                    self._warn(location, "name not resolved, " + str(e))
+            planned.append(PlannedLocation(location, rec_type, link))
+
+        if index is not None:
+            index.save()
+        client.close()
+        return RunPlan(tuple(planned), tuple(self._rejected), tuple(self._warnings))
+
+
+def describe(plan, events, format_location):
+    """
+    describe - publishes the rejected locations and warnings of a plan
+    :param plan: the RunPlan
+    :param events: the event bus
+    :param format_location: callable formatting a location string
+    :return: None
+    """
+    for location, reason in plan.rejected:
+        events.info(format_location(location) if location is not None else None, "Preflight rejected: " + reason)
+    for location, reason in plan.warnings:
+        events.info(format_location(location) if location is not None else None, "Preflight warning: " + reason)
+    resolved = len([planned for planned in plan.locations if planned.link is not None])
+    events.info(None, "Preflight planned " + str(len(plan.locations)) + " location(s), " + str(resolved)
+                + " resolved to their page, " + str(len(plan.rejected)) + " rejected")
@@ -0,0 +1,164 @@
+"""
+This module provides process tree lookups for the browser processes a driver starts.
+It reads /proc, so the numbers are only available on linux.
+"""
+
+from os import listdir, path, kill
+from sys import platform
+
+try:
+    from os import sysconf
+    CLOCK_TICKS = float(sysconf("SC_CLK_TCK"))
+except ImportError:
+    # No /proc on windows either, the value is never used there
+    CLOCK_TICKS = 100.0
+
+
+def child_pids(pid):
+    """
+    child_pids - finds the direct children of a process
+    :param pid: the parent process id
+    :return: list: the child process ids
+    """
+    children = list()
+    if not path.isdir("/proc"):
+        return children
+
+    for entry in listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(path.join("/proc", entry, "stat"), "r") as stat_file:
+                # The command name can contain spaces, the fields after it can not
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == pid:
+                children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    return children
+
+
+def process_start_time(pid):
+    """
+    process_start_time - start time of a process, used to tell a reused pid apart
+    :param pid: the process id
+    :return: int: clock ticks since boot, None if unavailable
+    """
+    try:
+        with open(path.join("/proc", str(pid), "stat"), "r") as stat_file:
+            return int(stat_file.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def pid_alive(pid):
+    """
+    pid_alive - checks if a process exists
+    :param pid: the process id
+    :return: bool: True if the process exists, always False on windows where
+    signal 0 would terminate the process instead of probing it
+    """
+    if platform == "win32":
+        return False
+    try:
+        kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists, but owned by someone else
+        return True
+    return True
+
+
+def process_tree_pids(pid):
+    """
+    process_tree_pids - finds a process and all of its descendants
+    :param pid: the root process id
+    :return: list: the process ids, root first
+    """
+    pids = [pid]
+    index = 0
+    while index < len(pids):
+        pids.extend(child_pids(pids[index]))
+        index += 1
+
+    return pids
+
+
+def process_rss(pid):
+    """
+    process_rss - resident memory of a single process
+    :param pid: the process id
+    :return: int: bytes, 0 if the process is gone or /proc is unavailable
+    """
+    try:
+        with open(path.join("/proc", str(pid), "statm"), "r") as statm_file:
+            return int(statm_file.read().split()[1]) * 4096
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def process_tree_rss(pid):
+    """
+    process_tree_rss - resident memory of a process and all of its descendants
+    :param pid: the root process id
+    :return: int: bytes
+    """
+    return sum(process_rss(tree_pid) for tree_pid in process_tree_pids(pid))
+
+
+def process_cpu_seconds(pid):
+    """
+    process_cpu_seconds - user and system cpu time used by a single process
+    :param pid: the process id
+    :return: float: seconds, 0 if the process is gone or /proc is unavailable
+    """
+    try:
+        with open(path.join("/proc", str(pid), "stat"), "r") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def process_tree_cpu_seconds(pid):
+    """
+    process_tree_cpu_seconds - cpu time used by a process and its running descendants
+    :param pid: the root process id
+    :return: float: seconds
+    """
+    return sum(process_cpu_seconds(tree_pid) for tree_pid in process_tree_pids(pid))
+
+
+def driver_pid(driver):
+    """
+    driver_pid - the chromedriver process id of a local driver
+    :param driver: the chrome driver
+    :return: int: the process id, None for drivers without a local service
+    """
+    try:
+        return driver.service.process.pid
+    except AttributeError:
+        return None
+
+
+def report_browser_usage(events, location_str, driver, rec_govs):
+    """
+    report_browser_usage - publishes the memory and poll rate per location of one browser
+    :param events: the event bus
+    :param location_str: formatted location(s) of the browser
+    :param driver: the chrome driver
+    :param rec_govs: the RecGov objects polled in this browser
+    :return: None
+    """
+    if len(rec_govs) == 0:
+        return
+
+    pid = driver_pid(driver)
+    rss = process_tree_rss(pid) if pid is not None else 0
+    rates = [rec_gov.poll_rate() for rec_gov in rec_govs]
+    events.info(location_str,
+                str(len(rec_govs)) + " location(s) in one browser, "
+                + "%.1f" % (rss / 1048576.0 / len(rec_govs)) + " MB per location, "
+                + "%.3f" % (sum(rates) / len(rates)) + " polls/s per location")
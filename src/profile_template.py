@@ -0,0 +1,223 @@
+"""
+This module provides the warm profile template. One Chrome profile is warmed up once with
+the site's scripts, fonts, service worker and cookies in it, and every browser starts from
+its own copy of that profile instead of an empty one. The copies are removed with their
+driver's registry entry.
+
+    python3 -m src.profile_template --prefs preferences/preferences.txt --runs 3
+
+compares the first page load time and bytes transferred of empty and warm profiles.
+"""
+
+import argparse
+import json
+import shutil
+import subprocess
+from os import getpid, listdir, makedirs, path, remove
+from sys import platform
+from time import time, sleep
+
+# Files that tie a profile to the browser using it, a copy must not carry them over
+LOCK_FILES = ("SingletonLock", "SingletonSocket", "SingletonCookie", "lockfile")
+
+# Load time and bytes transferred of the page, cached responses transfer 0 bytes
+FIRST_LOAD_SCRIPT = """
+var navigation = performance.getEntriesByType('navigation')[0];
+var resources = performance.getEntriesByType('resource');
+var bytes = navigation ? navigation.transferSize : 0;
+resources.forEach(function (resource) { bytes += resource.transferSize || 0; });
+return [navigation ? navigation.loadEventEnd - navigation.startTime : null, bytes, resources.length];
+"""
+
+# Consent and cookie banners, clicked once while warming so the copies start past them
+CONSENT_SCRIPT = """
+var clicked = 0;
+document.querySelectorAll('button').forEach(function (button) {
+    var text = (button.innerText || '').trim().toLowerCase();
+    if (['accept', 'accept all', 'i agree', 'got it', 'agree'].indexOf(text) !== -1) { button.click(); clicked++; }
+});
+return clicked;
+"""
+
+
+def first_load(driver):
+    """
+    first_load - the load time and transfer of the page the driver is on
+    :param driver: the chrome driver
+    :return: (load seconds or None, bytes transferred, resource count)
+    """
+    load_ms, transferred, resources = driver.execute_script(FIRST_LOAD_SCRIPT)
+    return (load_ms / 1000.0 if load_ms else None), transferred, resources
+
+
+class ProfileTemplate:
+    """ This class warms the template profile and hands out and removes its copies. """
+
+    def __init__(self, directory, max_age_hours=24):
+        """
+        __init__ - constructor
+        :param directory: where the template and the copies are kept
+        :param max_age_hours: hours before the template is warmed again
+        """
+        self._directory = directory
+        self._template = path.join(directory, "template")
+        self._clones = path.join(directory, "clones")
+        self._max_age = max_age_hours * 3600
+        self._count = 0
+
+    def _marker(self):
+        return path.join(self._template, "warmed.json")
+
+    def stale(self):
+        """
+        stale - checks if the template is missing or older than the max age
+        :return: bool: True if the template has to be warmed
+        """
+        if not path.exists(self._marker()):
+            return True
+        try:
+            with open(self._marker(), "r") as marker_file:
+                return time() - json.load(marker_file)["warmed"] > self._max_age
+        except (OSError, ValueError, KeyError):
+            return True
+
+    def warm(self, create_driver, release_driver, url, settle=5):
+        """
+        warm - loads the site once in a new profile and makes it the template
+        :param create_driver: callable(profile) returning a driver started on that profile directory
+        :param release_driver: callable(driver) quitting the driver, a clean quit writes the cache out
+        :param url: the site to warm the profile with
+        :param settle: seconds given to the service worker and late requests after the load
+        :return: bool: True if the template is ready
+        """
+        building = self._template + "_" + str(getpid())
+        shutil.rmtree(building, ignore_errors=True)
+        makedirs(building, exist_ok=True)
+
+        driver = create_driver(building)
+        if driver is None:
+            shutil.rmtree(building, ignore_errors=True)
+            return False
+        try:
+            driver.get(url)
+            sleep(settle)
+            driver.execute_script(CONSENT_SCRIPT)
+            sleep(1)
+        finally:
+            release_driver(driver)
+
+        with open(path.join(building, "warmed.json"), "w") as marker_file:
+            json.dump({"warmed": time(), "url": url}, marker_file)
+        shutil.rmtree(self._template, ignore_errors=True)
+        shutil.move(building, self._template)
+        return True
+
+    def clone(self, slot=0):
+        """
+        clone - copies the template for one browser, as a copy on write reflink where the file system has them
+        :param slot: index of the worker, used in the copy name
+        :return: str: the profile directory, None if there is no template yet
+        """
+        if not path.exists(self._marker()):
+            return None
+
+        self._count += 1
+        destination = path.join(self._clones, str(getpid()) + "_" + str(slot) + "_" + str(self._count))
+        makedirs(self._clones, exist_ok=True)
+        shutil.rmtree(destination, ignore_errors=True)
+        copied = False
+        if platform == "linux":
+            # Hard links would let a browser change the template, the cache index and cookie
+            # database are written in place, reflinks share blocks until one side writes
+            copied = subprocess.call(["cp", "-a", "--reflink=auto", self._template, destination],
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+        if not copied:
+            shutil.rmtree(destination, ignore_errors=True)
+            shutil.copytree(self._template, destination, symlinks=True, ignore=shutil.ignore_patterns(*LOCK_FILES))
+        for lock_file in LOCK_FILES:
+            lock_path = path.join(destination, lock_file)
+            if path.lexists(lock_path):
+                ProfileTemplate.remove_profile(lock_path)
+        return destination
+
+    @staticmethod
+    def remove_profile(profile):
+        """
+        remove_profile - deletes a profile copy
+        :param profile: the profile directory or file
+        :return: None
+        """
+        if path.isdir(profile) and not path.islink(profile):
+            shutil.rmtree(profile, ignore_errors=True)
+        else:
+            try:
+                remove(profile)
+            except OSError:
+                pass
+
+    def sweep(self, in_use):
+        """
+        sweep - removes the copies no registry entry refers to, left by runs that were killed
+        :param in_use: set of profile directories of browsers that are still recorded
+        :return: int: the number of copies removed
+        """
+        if not path.isdir(self._clones):
+            return 0
+        removed = 0
+        for entry in listdir(self._clones):
+            clone = path.join(self._clones, entry)
+            if clone not in in_use:
+                ProfileTemplate.remove_profile(clone)
+                removed += 1
+        return removed
+
+
+def compare(prefs, runs):
+    """
+    compare - loads the site with empty and warm profiles and prints the first page load of each
+    :param prefs: path to the preferences file, profile_template has to be set
+    :param runs: browsers started per mode
+    :return: None
+    """
+    import src.overseer as overwatch
+    import src.event_bus as eb
+
+    overseer = overwatch.Overseer(prefs)
+    events = eb.configure(overseer.preferences)
+    if overseer.profiles is None:
+        print("Set profile_template in " + prefs + " to compare")
+        return
+
+    overseer.backend.start(overseer.lifecycle)
+    try:
+        overseer.warm_profile()
+        for mode in ("empty", "warm"):
+            loads = list()
+            for run in range(runs):
+                # A warm copy is registered with its driver and removed with it, an empty run skips the template
+                driver = overseer.create_driver("profile " + mode, slot=run, clone=mode == "warm")
+                if driver is None:
+                    continue
+                try:
+                    driver.get(overseer.preferences.url)
+                    loads.append(first_load(driver))
+                finally:
+                    overseer.lifecycle.release(driver)
+            timed = [load[0] for load in loads if load[0] is not None]
+            print(mode + " profile: " + str(len(loads)) + " load(s), "
+                  + ("%.3f" % (sum(timed) / len(timed)) if timed else "n/a") + "s average, "
+                  + "%.1f" % (sum(load[1] for load in loads) / max(len(loads), 1) / 1024.0) + " KB transferred")
+    finally:
+        overseer.backend.stop(overseer.lifecycle)
+        events.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares first page loads with empty and warm profiles")
+    parser.add_argument("--prefs", default="preferences/preferences.txt")
+    parser.add_argument("--runs", type=int, default=3, help="browsers started per mode")
+    arguments = parser.parse_args()
+    compare(arguments.prefs, arguments.runs)
+
+if __name__ == '__main__':
+    main()
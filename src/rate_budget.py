@@ -0,0 +1,122 @@
+"""
+This module provides the global request budget. Every page load, reload and grid refresh
+of every worker process reserves its turn from one budget in shared memory, so the load on
+the site stays at rate_limit requests per second however many locations are polled. When
+the locations want more than the budget, each one gets a share in proportion to its weight.
+"""
+
+import multiprocessing as mp
+from time import monotonic
+
+import src.preferences_handler as ph
+
+# Longest a waiting location sleeps before asking again, it may be next in line by then
+RETRY_SECONDS = 0.05
+
+# The budget of this process, installed by the pool initializer
+_budget = None
+
+
+class RequestBudget:
+    """ This class is a token bucket in shared memory with weighted fair turns for the locations. """
+
+    def __init__(self, rate, locations, weights=None, burst=1):
+        """
+        __init__ - constructor, created in the overseer before the pool so the workers inherit the shared memory
+        :param rate: requests per second for the whole run
+        :param locations: list of formatted location strings, one share each
+        :param weights: list of (name, weight), a location containing name gets the weight, 1 otherwise
+        :param burst: requests that may go out back to back after the budget was idle
+        """
+        self._rate = float(rate)
+        self._burst = float(max(burst, 1))
+        self._slots = {location: index for index, location in enumerate(locations)}
+        self._locations = list(locations)
+        self._lock = mp.Lock()
+        # tokens, time of the last refill and the virtual time of the last turn handed out,
+        # monotonic is system wide so the processes agree on it
+        self._bucket = mp.RawArray('d', [self._burst, monotonic(), 0.0])
+        # Per location: virtual time used, when it started waiting (0 when not) and when it last asked
+        self._virtual = mp.RawArray('d', len(locations))
+        self._waiting = mp.RawArray('d', len(locations))
+        self._asked = mp.RawArray('d', len(locations))
+        self._granted = mp.RawArray('l', len(locations))
+        self._waited = mp.RawArray('d', len(locations))
+        self._weights = mp.RawArray('d', [ph.named_setting(location, weights, 1.0) for location in locations])
+
+    def _refill(self, now):
+        self._bucket[0] = min(self._burst, self._bucket[0] + (now - self._bucket[1]) * self._rate)
+        self._bucket[1] = now
+
+    def _ahead(self, slot, now):
+        """
+        _ahead - checks if another waiting location is due a turn before this one,
+        the location that used the least of its weighted share goes first
+        :return: bool: True if this location has to let another one go first
+        """
+        finish = self._virtual[slot] + 1.0 / self._weights[slot]
+        # A location that stopped asking, e.g. its worker died, no longer holds up the others
+        stale = 2.0 / self._rate + RETRY_SECONDS
+        for index in range(len(self._locations)):
+            if index != slot and self._waiting[index] > 0 and now - self._asked[index] < stale \
+                    and self._virtual[index] + 1.0 / self._weights[index] < finish:
+                return True
+        return False
+
+    def take(self, location):
+        """
+        take - takes a request turn for a location if it is its turn
+        :param location: the formatted location string
+        :return: float: 0 if the request may go out, otherwise seconds to sleep before asking again
+        """
+        slot = self._slots.get(location)
+        with self._lock:
+            now = monotonic()
+            self._refill(now)
+            if slot is not None:
+                if self._waiting[slot] == 0:
+                    # Time spent idle is not saved up as credit over the locations that kept polling
+                    self._virtual[slot] = max(self._virtual[slot], self._bucket[2])
+                    self._waiting[slot] = now
+                self._asked[slot] = now
+
+            if self._bucket[0] < 1:
+                return (1 - self._bucket[0]) / self._rate
+            if slot is None:
+                self._bucket[0] -= 1
+                return 0.0
+            if self._ahead(slot, now):
+                return min(1.0 / self._rate, RETRY_SECONDS)
+
+            self._bucket[0] -= 1
+            self._bucket[2] = self._virtual[slot]
+            self._virtual[slot] += 1.0 / self._weights[slot]
+            self._granted[slot] += 1
+            self._waited[slot] += now - self._waiting[slot]
+            self._waiting[slot] = 0
+        return 0.0
+
+    def report(self):
+        """
+        report - requests, share of the budget and average wait per location
+        :return: list: (location, requests, share, average wait seconds)
+        """
+        with self._lock:
+            total = sum(self._granted)
+            return [(location, self._granted[index], self._granted[index] / float(max(total, 1)),
+                     self._waited[index] / max(self._granted[index], 1))
+                    for index, location in enumerate(self._locations)]
+
+
+def install(budget):
+    """
+    install - sets the budget of this process, called by the pool initializer
+    :param budget: the RequestBudget, None for no limit
+    :return: None
+    """
+    global _budget
+    _budget = budget
+
+
+def get_budget():
+    return _budget
@@ -3,16 +3,32 @@ This module provides the RecGov class which is the parent of the camp
 and permit classes.
 """
 
-from traceback import print_exc
-from time import sleep
+from time import sleep, monotonic
 from re import sub
+from traceback import format_exc
 from datetime import date, datetime
 from datetime import timedelta
 from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import TimeoutException
+
+import src.event_bus as eb
+import src.rate_budget as rb
+import src.burst as bst
+import src.wait_strategy as ws
+import src.lookup as lk
+import src.locators as lc
+from src.element_cache import ElementCache
+from src.interactions import Interactions
+from src.cdp_engine import CdpEngine
+from src.url_builder import UrlBuilder
+from src.date_handler import DateHandler
+from src.flow_runner import FlowRunner, FlowStep
+from src.poll_schedule import create_scheduler
+from src.profile_template import first_load
+from src.flight_recorder import FlightRecorder, instrument
 
 
 class EndOfTriesException(Exception):
@@ -22,6 +38,11 @@ class EndOfTriesException(Exception):
 class RecGov:
     """ This class provides the shared functionality for campsite and permit reservations. """
 
+    # The end date calendar sometimes drops the typed value, retry this many times
+    MAX_DATE_TRIES = 10
+    # Exceptions that end the flow instead of being retried
+    TERMINAL_EXCEPTIONS = (EndOfTriesException,)
+
     def __init__(self, driver, preferences, location):
         """
         __init__ - constructor
@@ -40,6 +61,39 @@ class RecGov:
         self._num_refreshes = preferences.num_refreshes
         self._time_start = preferences.time_start
         self._time_end = preferences.time_end
+        self._deep_links = preferences.deep_links
+        self._location_link = None
+        self._events = eb.get_event_bus()
+        self._wait_ceiling = preferences.wait_ceiling
+        self._waits = ws.WaitStrategy(driver, preferences.wait_duration, self._wait_ceiling,
+                                      RecGov.format_location_string(location), self._events)
+        self._lookup = lk.Lookup(driver, preferences.wait_duration, locators=lc.load(preferences.locator_file))
+        # Controls reused every iteration, e.g. Refresh Table
+        self._elements = ElementCache(self._lookup)
+        self._fast_interactions = preferences.fast_interactions
+        self._interactions = Interactions(driver, self._events, RecGov.format_location_string(location),
+                                          self._fast_interactions)
+        self._iteration_total = 0.0
+        self._iteration_count = 0
+        self._poll_started = None
+        self._trace = None
+        self._retries = 0
+        self._step_retries = preferences.step_retries
+        self._step_timeout = preferences.step_timeout
+        self._watchdog_stall = preferences.watchdog_stall
+        self._watchdog = None
+        self._cdp_enabled = preferences.cdp_engine
+        self._cdp = None
+        self._schedule = create_scheduler(preferences, RecGov.format_location_string(location))
+        self._hit_handler = None
+        # BurstMember of a location polled by several phase offset drivers
+        self._burst = None
+        self._last_poll = None
+        self._flight = None
+        if preferences.flight_recorder > 0:
+            self._flight = FlightRecorder(RecGov.format_location_string(location), preferences.flight_recorder,
+                                          preferences.flight_recorder_kb, preferences.flight_dir)
+            instrument(driver)
 
     @staticmethod
     def find_parent_with_attribute_value(element, target, value):
@@ -57,8 +111,7 @@ class RecGov:
             return element
 
         except Exception as e:
-            print("RecGov.find_parent_with_attribute_value() failed")
-            print(print_exc())
+            eb.get_event_bus().error(None, "RecGov.find_parent_with_attribute_value() failed")
 
         return None
 
@@ -76,8 +129,7 @@ class RecGov:
             return element
 
         except Exception as e:
-            print("RecGov.find_parent_with_tag() failed")
-            print(print_exc())
+            eb.get_event_bus().error(None, "RecGov.find_parent_with_tag() failed")
 
         return None
 
@@ -98,20 +150,58 @@ class RecGov:
 
         return location_str
 
+    def load_page(self, url=None):
+        """
+        load_page - loads a page in this tab, every page load goes through here so the element cache is cleared
+        :param url: the url to load, None to reload the current page
+        :return: None
+        """
+        self._elements.clear()
+        self.throttle()
+        if url is None:
+            self._driver.refresh()
+        else:
+            self._driver.get(url)
+
+    def throttle(self):
+        """
+        throttle - waits for this location's turn in the request budget shared by the workers
+        :return: None
+        """
+        budget = rb.get_budget()
+        if budget is None:
+            return
+        # A burst member has a turn of its own, the members would otherwise share one location's share
+        location_str = bst.member_label(RecGov.format_location_string(self._location), self._burst)
+        delay = budget.take(location_str)
+        while delay > 0:
+            sleep(delay)
+            if self._watchdog is not None:
+                self._watchdog.beat()
+            delay = budget.take(location_str)
+
     def navigate_site(self):
         """
         navigate_site - opens the desired url in the driver
         :return: None
         """
         try:
-            self._driver.get(self._url)
+            self.load_page(self._url)
         except Exception as e:
-            print(RecGov.format_location_string(self._location)
-                  + ": RecGov.navigate_site() failed: "
-                  + self._url)
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location),
+                               "RecGov.navigate_site() failed: " + self._url)
             raise e
 
+        try:
+            load_seconds, transferred, resources = first_load(self._driver)
+            self._events.timing(RecGov.format_location_string(self._location),
+                                "first page load " + ("%.3f" % load_seconds if load_seconds else "n/a") + "s, "
+                                + "%.1f" % (transferred / 1024.0) + " KB transferred for " + str(resources)
+                                + " resource(s)")
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location),
+                               "RecGov.navigate_site() could not read the page load timing", exc_info=False)
+
     def log_into_account(self):
         """
         log_into_account - logs into the account with credentials provided if desired
@@ -123,27 +213,25 @@ class RecGov:
                 return
 
             # Grab the sign-in button
-            WebDriverWait(self._driver, self._long_delay).until(ec.element_to_be_clickable((By.ID,
-                "ga-global-nav-log-in-link"))).click()
+            WebDriverWait(self._driver, self._long_delay).until(self._lookup.clickable("log_in_link")).click()
 
             # Grab the username / password elements
-            username = self._driver.find_element_by_id("email")
-            password = self._driver.find_element_by_id("rec-acct-sign-in-password")
+            username = self._lookup.must(lc.NAMED, "email", self._long_delay)
+            password = self._lookup.must(lc.NAMED, "password")
 
             # Send credentials
             username.send_keys(self._credentials[0])
             password.send_keys(self._credentials[1])
 
             # Grab the submit button
-            WebDriverWait(self._driver, self._long_delay).until(ec.element_to_be_clickable((By.XPATH,
-                "//button[contains(@class, 'rec-acct-sign-in-btn') and (@type='submit')]"))).click()
+            WebDriverWait(self._driver, self._long_delay).until(self._lookup.clickable("sign_in_submit")).click()
 
             # Wait for login screen to clear
-            sleep(self._wait_duration)
+            self._waits.until("RecGov.log_into_account()",
+                              ws.element_gone(self._lookup.locators.locator("password")))
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": RecGov.log_into_account() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location), "RecGov.log_into_account() failed")
             raise e
 
     def navigate_main_page(self, heading_text):
@@ -153,7 +241,7 @@ class RecGov:
         """
         try:
             # Need to pick out the desired heading from all of the other headings
-            headings = self._driver.find_elements_by_xpath("//h3[(@data-component='Heading') and (@class='h3')]")
+            headings = self._lookup.must_all(lc.NAMED, "main_heading", self._long_delay)
             heading_element = None
             for heading in headings:
                 if heading.text.strip() == heading_text and heading.get_attribute("class").strip() == "h3":
@@ -165,27 +253,55 @@ class RecGov:
             heading_element.click()
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": RecGov.navigate_main_page() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location), "RecGov.navigate_main_page() failed")
             raise e
 
-    def navigate_location_link(self, location, primary_link_text, secondary_link_text=""):
+    def resume_location(self, query=None):
+        """
+        resume_location - goes straight to the location link found earlier, skipping the search
+        :param query: (name, value) pairs to deep link with, if deep links are enabled
+        :return: bool: True if the link was known and loaded
+        """
+        if self._location_link is None:
+            return False
+
+        current_link = self._location_link
+        if self._deep_links and query:
+            current_link = UrlBuilder.with_query(current_link, query)
+        self.load_page(current_link)
+        return True
+
+    def set_location_link(self, link):
+        """
+        set_location_link - sets the location link when it was found by another flow, e.g. a region scan
+        :param link: the location page link without a query string
+        :return: None
+        """
+        self._location_link = link
+
+    def navigate_location_link(self, location, primary_link_text, secondary_link_text="", query=None):
         """
         navigate_location_link - grabs the necessary link from the search page
+        :param location: the location title to look for
+        :param primary_link_text: text the link href must contain
+        :param secondary_link_text: text appended to the link
+        :param query: (name, value) pairs to deep link with, if deep links are enabled
         :return: None
         """
         try:
             # Search the page to find the link for this location
-            location_element = self._driver.find_element_by_xpath("//a[contains(@href, '"
-                                                                  + primary_link_text
-                                                                  + "') and contains(@title, '"
-                                                                  + location + "')]")
+            location_element = self._lookup.must(By.XPATH, "//a[contains(@href, '"
+                                                 + primary_link_text
+                                                 + "') and contains(@title, '"
+                                                 + location + "')]", self._long_delay)
             current_link = location_element.get_attribute("href") + secondary_link_text
-            self._driver.get(current_link)
+            self._location_link = current_link
+            if self._deep_links and query:
+                current_link = UrlBuilder.with_query(current_link, query)
+            self.load_page(current_link)
 
         except Exception as e:
-            print(RecGov.format_location_string(self._location) + ": RecGov.navigate_location_link() failed")
-            print(print_exc())
+            self._events.error(RecGov.format_location_string(self._location), "RecGov.navigate_location_link() failed")
             raise e
 
     def wait(self):
@@ -196,8 +312,9 @@ class RecGov:
 
         if self._time_start is not None:
             current_time = datetime.now().time()
-            print("Current time is " + str(current_time.strftime("%H:%M:%S")) +
-                  ", Waiting until " + str(self._time_start) + " to begin polling the page")
+            self._events.info(RecGov.format_location_string(self._location),
+                              "Current time is " + str(current_time.strftime("%H:%M:%S")) +
+                              ", Waiting until " + str(self._time_start) + " to begin polling the page")
             if self._time_start > current_time:
                 current_time = datetime.now().time()
                 curr_seconds = (current_time.hour * 60 + current_time.minute) * 60 + current_time.second
@@ -205,57 +322,466 @@ class RecGov:
                     (self._time_start.hour * 60 + self._time_start.minute) * 60 + self._time_start.second
 
                 sleep(start_seconds - curr_seconds - 3)
-            print("Began processing at " + str(self._time_start.strftime("%H:%M:%S")))
+            self._events.info(RecGov.format_location_string(self._location),
+                              "Began processing at " + str(self._time_start.strftime("%H:%M:%S")))
+
+    def record_iteration(self, iteration, iteration_start):
+        """
+        record_iteration - records how long a poll iteration took
+        :param iteration: the current refresh try
+        :param iteration_start: monotonic() at the start of the iteration
+        :return: None
+        """
+        elapsed = monotonic() - iteration_start
+        if self._poll_started is None:
+            self._poll_started = iteration_start
+        self._last_poll = iteration_start
+        if self._burst is not None and bst.get_groups() is not None:
+            bst.get_groups().record(self._burst, iteration_start, elapsed)
+        self._iteration_total += elapsed
+        self._iteration_count += 1
+        if self._schedule is not None:
+            self._schedule.record_poll()
+        if self._watchdog is not None:
+            self._watchdog.beat()
+        self._events.timing(RecGov.format_location_string(self._location),
+                            "#" + str(iteration) + " took " + "%.3f" % elapsed + "s, average "
+                            + "%.3f" % (self._iteration_total / self._iteration_count) + "s")
+
+    def iteration_summary(self):
+        """
+        iteration_summary - average poll iteration time for the stopping message
+        :return: str: the summary
+        """
+        if self._iteration_count == 0:
+            return ""
+        return ", average iteration " + "%.3f" % (self._iteration_total / self._iteration_count) + "s" \
+               + self._elements.summary() + self._interactions.summary() \
+               + (self._schedule.summary() if self._schedule is not None else "") + self._lookup.locators.summary()
+
+    def set_watchdog(self, watchdog):
+        """
+        set_watchdog - sets the watchdog that times the steps and poll iterations
+        :param watchdog: the Watchdog of the worker
+        :return: None
+        """
+        self._watchdog = watchdog
+
+    def replace_driver(self, driver):
+        """
+        replace_driver - continues the flow in a new browser after the watchdog ended the old one,
+        the poll count and the location link found so far are kept
+        :param driver: the new chrome driver
+        :return: None
+        """
+        self._driver = driver
+        self._waits = ws.WaitStrategy(driver, self._wait_duration, self._wait_ceiling,
+                                      RecGov.format_location_string(self._location), self._events)
+        self._lookup = lk.Lookup(driver, self._wait_duration, locators=self._lookup.locators)
+        self._elements = ElementCache(self._lookup)
+        self._interactions = Interactions(driver, self._events, RecGov.format_location_string(self._location),
+                                          self._fast_interactions)
+        self._trace = None
+        if self._cdp is not None:
+            self._cdp.close()
+            self._cdp = None
+        if self._flight is not None:
+            instrument(driver)
+
+    def cdp_engine(self):
+        """
+        cdp_engine - the DevTools engine for the poll loop, connected on first use
+        :return: CdpEngine: the engine, None when it is off or could not connect
+        """
+        if not self._cdp_enabled:
+            return None
+        if self._cdp is None:
+            try:
+                self._cdp = CdpEngine.attach(self._driver)
+                self._events.info(RecGov.format_location_string(self._location), "Polling over DevTools")
+            except Exception:
+                self._events.error(RecGov.format_location_string(self._location),
+                                   "RecGov.cdp_engine() unavailable, polling through Selenium")
+                self._cdp_enabled = False
+        return self._cdp
+
+    def set_cdp_enabled(self, enabled):
+        """
+        set_cdp_enabled - switches the poll loop between the DevTools engine and Selenium
+        :param enabled: True to poll over DevTools
+        :return: None
+        """
+        self._cdp_enabled = enabled
+        if not enabled and self._cdp is not None:
+            self._cdp.close()
+            self._cdp = None
+
+    def flow_steps(self, login=True, poll=True):
+        """
+        flow_steps - the steps of the flow, locate and configure are provided by the camp and permit classes
+        :param login: log in, False when another tab of this browser already has
+        :param poll: include the poll step, False to stop once the grid is ready
+        :return: list: the FlowSteps
+        """
+        steps = [FlowStep("navigate", self.navigate_site, self._step_timeout, self._step_retries)]
+        if login:
+            steps.append(FlowStep("login", self.log_into_account, self._step_timeout, self._step_retries,
+                                  "navigate"))
+        steps.append(FlowStep("locate", self.locate, self._step_timeout, self._step_retries, "navigate"))
+        steps.append(FlowStep("configure", self.configure, self._step_timeout, self._step_retries, "locate"))
+        if poll:
+            # The poll step arms the watchdog itself once the start time is reached,
+            # booking happens inside the iteration that finds the availability
+            steps.append(FlowStep("poll", self.poll, None, self._step_retries, "configure"))
+        return steps
+
+    def run_steps(self, steps):
+        """
+        run_steps - runs the steps, retrying in this browser and resuming from the last checkpoint
+        :param steps: list of FlowStep
+        :return: the return value of the last step
+        """
+        runner = FlowRunner(steps, RecGov.format_location_string(self._location), self._events,
+                            self._watchdog, self.TERMINAL_EXCEPTIONS)
+        return runner.run()
+
+    def prepare(self, login=True):
+        """
+        prepare - navigates to the availability grid and configures it for polling
+        :param login: log in, False when another tab of this browser already has
+        :return: None
+        """
+        self.run_steps(self.flow_steps(login, poll=False))
+
+    def recover(self):
+        """
+        recover - reopens and configures the grid from the location link after a failed poll iteration
+        :return: None
+        """
+        self.run_steps([step for step in self.flow_steps(login=False, poll=False)
+                        if step.name in ("locate", "configure")])
+
+    def set_trace(self, trace):
+        """
+        set_trace - turns on DevTools trace capture around the poll iterations
+        :param trace: the TraceCapture for this location
+        :return: None
+        """
+        self._trace = trace
+
+    def tracing(self):
+        """
+        tracing - checks if the location still has iterations to trace
+        :return: bool: True while a TraceCapture is set
+        """
+        return self._trace is not None
+
+    def begin_trace(self, iteration):
+        """
+        begin_trace - starts the flight recorder frame of the iteration, and a traced window
+        if tracing is on and the iteration is sampled
+        :param iteration: the current refresh try
+        :return: bool: True if end_trace has to write the window out
+        """
+        if self._flight is not None:
+            self._flight.begin(iteration)
+        if self._trace is None:
+            return False
+        try:
+            return self._trace.begin(iteration)
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location), "RecGov.begin_trace() failed")
+        return False
+
+    def end_trace(self, iteration, traced):
+        """
+        end_trace - snapshots the grid into the flight recorder and writes out a traced window
+        :param iteration: the current refresh try
+        :param traced: the result of begin_trace
+        :return: None
+        """
+        if self._flight is not None:
+            self._flight.end(self._driver)
+        if not traced:
+            return
+        try:
+            self._trace.end(iteration)
+            if self._trace.finished():
+                # Not asked again, so the iterations after the last traced one make no extra round trips
+                trace, self._trace = self._trace, None
+                trace.detach()
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location), "RecGov.end_trace() failed")
+
+    def decide(self, decision):
+        """
+        decide - notes a decision of the flow in the flight recorder
+        :param decision: what was decided and why
+        :return: None
+        """
+        if self._flight is not None:
+            self._flight.decision(decision)
+
+    def dump_flight(self, reason, details=None):
+        """
+        dump_flight - writes out the recorded iterations, after a failure or a booking
+        :param reason: why the iterations are written
+        :param details: the traceback, if any
+        :return: None
+        """
+        if self._flight is None:
+            return
+        try:
+            recording = self._flight.dump(reason, details)
+            if recording is not None:
+                self._events.info(RecGov.format_location_string(self._location), "Flight recording written to "
+                                  + recording)
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location), "RecGov.dump_flight() failed")
+
+    def set_hit_handler(self, handler):
+        """
+        set_hit_handler - sets what runs when the flow sees an opening, before it clicks to book it,
+        e.g. the fan out to other tenants
+        :param handler: callable without arguments, None for nothing
+        :return: None
+        """
+        self._hit_handler = handler
+
+    def hit(self):
+        if self._hit_handler is None:
+            return
+        try:
+            self._hit_handler()
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location), "RecGov.hit() failed")
+
+    def set_burst(self, member):
+        """
+        set_burst - makes the location one member of a burst group, its polls are phase offset from the others
+        :param member: the BurstMember
+        :return: None
+        """
+        self._burst = member
+
+    def burst_name(self):
+        return "burst member " + str(self._burst.index + 1) + "/" + str(self._burst.size)
+
+    def claim_booking(self):
+        """
+        claim_booking - claims the booking of the burst group before the book button is clicked
+        :return: bool: True if this location may book
+        """
+        if self._burst is None or bst.get_groups() is None:
+            return True
+        if bst.get_groups().claim(self._burst):
+            return True
+        self._events.info(RecGov.format_location_string(self._location),
+                          self.burst_name() + " leaves the opening to the member booking it")
+        return False
+
+    def release_booking(self, booked=False):
+        """
+        release_booking - hands the claim back, or marks the burst group booked so the others stand down
+        :param booked: True if this location reached checkout
+        :return: None
+        """
+        if self._burst is None or bst.get_groups() is None:
+            return
+        if booked:
+            bst.get_groups().booked(self._burst)
+        else:
+            bst.get_groups().release(self._burst)
+
+    def stood_down(self):
+        """
+        stood_down - checks if another member of the burst group booked
+        :return: int: the index of that member, None if none did
+        """
+        if self._burst is None or bst.get_groups() is None:
+            return None
+        return bst.get_groups().winner(self._burst)
+
+    def iterations(self):
+        """
+        iterations - the poll iterations run so far
+        :return: int: the count
+        """
+        return self._iteration_count
+
+    def poll_rate(self):
+        """
+        poll_rate - effective iterations per second since polling began
+        :return: float: the poll rate, 0 before the first iteration
+        """
+        if self._poll_started is None or self._iteration_count == 0:
+            return 0.0
+        return self._iteration_count / max(monotonic() - self._poll_started, 0.001)
+
+    def poll_delay(self):
+        """
+        poll_delay - seconds until the location is due for its next poll
+        :return: float: 0 when the schedule is off or the location is in a predicted window
+        """
+        delay = self._schedule.delay() if self._schedule is not None else 0.0
+        if self._burst is not None and bst.get_groups() is not None:
+            # The burst phase only ever adds to the schedule's wait
+            delay = max(delay, bst.get_groups().delay(self._burst, self._last_poll))
+        return delay
+
+    def pace(self):
+        """
+        pace - idles until the location is due, keeping the watchdog fed while it does
+        :return: None
+        """
+        delay = self.poll_delay()
+        while delay > 0 and self.keep_polling(self._retries):
+            sleep(min(delay, 1.0))
+            if self._watchdog is not None:
+                self._watchdog.beat()
+            delay = self.poll_delay()
+
+    def flush_schedule(self):
+        """
+        flush_schedule - writes out the observations of this location
+        :return: None
+        """
+        if self._schedule is not None:
+            self._schedule.flush()
+
+    def keep_polling(self, retries):
+        """
+        keep_polling - checks the end time or refresh count
+        :param retries: the number of iterations done so far
+        :return: bool: True if another iteration should run
+        """
+        if self.stood_down() is not None:
+            return False
+        if self._time_end:
+            return datetime.now().time() < self._time_end
+        return retries < self._num_refreshes
+
+    def stop_message(self, retries):
+        """
+        stop_message - the message used when polling ends without a booking
+        :param retries: the number of iterations done
+        :return: str: the message
+        """
+        except_str = RecGov.format_location_string(self._location) + ": driver stopping, tried " + \
+                     str(retries) + " times"
+        winner = self.stood_down()
+        if winner is not None:
+            except_str += ", " + self.burst_name() + " stood down, member " + str(winner + 1) + " booked"
+        elif self._time_end:
+            except_str += ", reached timeout " + str(self._time_end)
+        return except_str + self.iteration_summary()
+
+    def poll(self):
+        """
+        poll - polls the availability page until booked, timed out or out of refreshes,
+        poll_once is provided by the camp and permit classes
+        :return: bool: True if successfully in checkout
+        """
+        self.wait()
+        if self._watchdog is not None:
+            self._watchdog.arm("poll", self._watchdog_stall)
+
+        # if an end time is specified, execute until that time
+        # otherwise, execute for a set number of times
+        # the count is kept on the object so a resumed poll step carries on from it
+        try:
+            while self.keep_polling(self._retries):
+                self.pace()
+                if self.poll_once(self._retries + 1) == 1:
+                    return True
+                self._retries += 1
+        except Exception as e:
+            self.dump_flight(type(e).__name__ + " in the poll loop", format_exc())
+            raise
+        finally:
+            self.flush_schedule()
+
+        # Unable to successfully book
+        raise EndOfTriesException(self.stop_message(self._retries))
 
     def next_available(self):
         """
         next_available - selects the next available button on the calendar
         :return: None
         """
-        next_avail = self._driver.find_element_by_xpath("//*[contains(text(), 'Next Available')]")
+        next_avail = self._lookup.must(lc.NAMED, "next_available")
         # Click the Next Available button if it is present
         next_avail = RecGov.find_parent_with_attribute_value(next_avail, "type", "button")
         next_avail.click()
 
-    def select_date(self, desired_date, calendar_element=""):
+    def select_date(self, desired_date, calendar_element="", blur=None):
         """
         select_date - selects the desired date on the element provided
         :param desired_date: the desired date to select
         :param calendar_element: the id of the calendar element to select
+        :param blur: move the focus away to apply the date, defaults to True for start date calendars
         :return: None
         """
         # Update the calendar to use the desired dates
         date_str = "/".join([desired_date.strftime("%m"), desired_date.strftime("%d"),
                              desired_date.strftime("%Y")])
+        blur = "start-date" in calendar_element if blur is None else blur
+
+        date_input = self._lookup.must(By.ID, calendar_element)
+
+        def type_date():
+            # The calendar is finicky: select previous date and overwrite,
+            # shift focus elsewhere to force a page update
+            date_input.send_keys(Keys.CONTROL + "a")
+            date_input.send_keys(date_str)
 
-        date_input = self._driver.find_element_by_id(calendar_element)
-        # The calendar is finicky: select previous date and overwrite,
-        # shift focus elsewhere to force a page update
-        date_input.send_keys(Keys.CONTROL + "a")
-        date_input.send_keys(date_str)
+            if blur:
+                date_input.send_keys(Keys.TAB)
+            elif "end-date" in calendar_element:
+                tries = 0
+                while date_input.get_attribute("value").strip() == "":
+                    if tries >= RecGov.MAX_DATE_TRIES:
+                        raise ValueError("Unable to set " + calendar_element + " to " + date_str)
+                    date_input.send_keys(date_str)
+                    tries += 1
 
-        if "start-date" in calendar_element:
-            date_input.send_keys(Keys.TAB)
-        elif "end-date" in calendar_element:
-            while date_input.get_attribute("value").strip() == "":
-                date_input.send_keys(date_str)
+        self._interactions.set_value("date input", date_input, date_str, blur, fallback=type_date)
 
-    def book_now(self, book_now_xpath):
+    def date_applied(self, desired_date, calendar_element=""):
+        """
+        date_applied - checks if the calendar already shows the date, e.g. from a deep link
+        :param desired_date: the desired date
+        :param calendar_element: the id of the calendar element to check
+        :return: bool: True if the calendar input holds the date
+        """
+        date_input = self._lookup.first(By.ID, calendar_element)
+        if date_input is None or date_input.get_attribute("value") is None:
+            return False
+
+        return date_input.get_attribute("value").strip() == DateHandler.datetime_to_normal_text(desired_date)
+
+    def book_now(self, book_now_locator):
         """
         book_now - finds and clicks the book now / add to cart button
-        :param book_now_xpath: the xpath used to locate the button
+        :param book_now_locator: the name of the button's locator
         :return:
         """
-        # Grab the Book Now button
-        book_now_button = self._driver.find_elements_by_xpath(book_now_xpath)
-
-        if len(book_now_button) == 0:
+        # Another member of a burst group may already be booking this opening
+        if not self.claim_booking():
             return False
-        # Find the parent button of the Book Now text
-        book_now_button = RecGov.find_parent_with_tag(book_now_button[0], "button")
-        book_now_button.click()
+        # The availability check saw the opening, the other tenants of a watch race for it from here
+        # on equal terms instead of after this one holds it
+        self.hit()
 
-        return True
+        # Click the parent button of the Book Now text if it is present
+        book_now_button = self._elements.act(lc.NAMED, book_now_locator, lambda button: button.click(),
+                                             "button", must=False)
+        if book_now_button is None:
+            self.release_booking()
+
+        if book_now_button is not None and self._schedule is not None:
+            self._schedule.record_hit()
+        return book_now_button is not None
 
     def finish_book_now(self, output_details_to_user, location_str):
         """
@@ -268,17 +794,22 @@ class RecGov:
         # this will kick the bot back to the availability
         # screen to continue looking
         if not self._login:
-            close_book_now = self._driver.find_elements_by_xpath("//span[contains(text(), "
-                                                                 "'Close Log In')]")
-            if len(close_book_now) == 0:
+            try:
+                close_book_now = self._lookup.must(lc.NAMED, "close_log_in")
+            except TimeoutException:
+                self.release_booking()
                 return False
 
-            close_book_now = RecGov.find_parent_with_tag(close_book_now[0], "button")
+            close_book_now = RecGov.find_parent_with_tag(close_book_now, "button")
             close_book_now.click()
+            self.release_booking()
 
-            print(output_details_to_user)
+            self._events.found(location_str, output_details_to_user)
+            self.dump_flight("found, " + output_details_to_user)
             return False
         else:
-            print("---> " + location_str + ": You are now in control, please finish the booking process <---")
+            self.release_booking(booked=True)
+            self._events.booked(location_str, "---> You are now in control, please finish the booking process <---")
+            self.dump_flight("booked, " + output_details_to_user)
             # On the checkout screen, indicate for bot to end and allow user to take over
             return True
@@ -0,0 +1,194 @@
+"""
+This module provides the flow for region scans. One tab reads the search results of a region
+for the requested dates, and only the campgrounds whose result shows openings are opened in
+a full campground flow.
+"""
+
+from time import monotonic
+from urllib.parse import urljoin
+from selenium.webdriver.common.by import By
+
+from src.recgov import RecGov, EndOfTriesException
+from src.camp_recgov import CampRecGov
+from src.url_builder import UrlBuilder
+from src.date_handler import DateHandler
+from src.flow_runner import WorkerStalledException
+import src.wait_strategy as ws
+
+# Every campground in the results with whether its card shows availability, in one call
+SCAN_SCRIPT = """
+var results = [];
+var seen = {};
+document.querySelectorAll("a[href*='/camping/campgrounds/']").forEach(function (link) {
+    var href = link.href.split('?')[0].split('#')[0];
+    if (seen[href]) { return; }
+    seen[href] = true;
+    var card = link.closest('[data-component="SearchResultCard"], .search-result-card, li') || link.parentElement;
+    var text = (card.innerText || '').toLowerCase();
+    results.push({href: href, name: (link.getAttribute('title') || link.innerText || '').trim(),
+                  available: text.indexOf('available') !== -1
+                      && !/not available|unavailable|no availability|sold out/.test(text)});
+});
+return results;
+"""
+
+# A site open on both the start and end date, read from the grid labels
+SITE_SCRIPT = """
+var sites = {};
+document.querySelectorAll('.available .rec-availability-date').forEach(function (button) {
+    var label = (button.getAttribute('aria-label') || '').toLowerCase();
+    var site = /site\\s+([^\\s]+)/.exec(label);
+    if (site === null) { return; }
+    var found = sites[site[1]] = sites[site[1]] || {start: false, end: false};
+    found.start = found.start || label.indexOf(arguments[0]) !== -1;
+    found.end = found.end || label.indexOf(arguments[1]) !== -1;
+});
+for (var site in sites) {
+    if (sites[site].start && sites[site].end) { return site; }
+}
+return null;
+"""
+
+RESULTS_LOCATOR = (By.CSS_SELECTOR, "a[href*='/camping/campgrounds/']")
+
+
+class RegionRecGov(RecGov):
+    """ This class scans the search results of a region and books through the campground flow. """
+
+    # Seconds before a campground that was opened without booking is opened again
+    HANDOFF_COOLDOWN = 60
+
+    def __init__(self, driver, preferences, region_location):
+        """
+        __init__ - constructor
+        :param driver: the chrome driver for this object
+        :param preferences: the preferences to be used during execution
+        :param region_location: string location for this browser, Region:<search>
+        """
+        super(RegionRecGov, self).__init__(driver, preferences, region_location)
+        self._preferences = preferences
+        self._region_details = preferences.region_details
+        self._search = region_location.split(":", 1)[1]
+        # campground link -> monotonic() of its last hand off
+        self._handed_off = dict()
+        self.campgrounds_scanned = 0
+        self.campgrounds_opened = 0
+
+    def execute(self):
+        """
+        execute - starts the execution of the browser
+        :return: bool: True if successfully in checkout, False otherwise
+        """
+        try:
+            super(RegionRecGov, self).run_steps(super(RegionRecGov, self).flow_steps())
+            return True
+        except EndOfTriesException as e:
+            self._events.info(None, str(e))
+        except WorkerStalledException:
+            raise
+        except Exception:
+            self._events.error(RecGov.format_location_string(self._location), "execute() failed")
+
+        return False
+
+    def locate(self):
+        """
+        locate - opens the search results for the region with the dates in the url
+        :return: None
+        """
+        if self._region_details is None or self._region_details.get('dates') is None:
+            raise ValueError("Region scans need a start and end date in the region locations file")
+        link = urljoin(self._url, "search")
+        super(RegionRecGov, self).set_location_link(link)
+        super(RegionRecGov, self).load_page(UrlBuilder.with_query(
+            link, UrlBuilder.search_query(self._search, self._region_details)))
+
+    def configure(self):
+        """
+        configure - waits for the results to list the campgrounds
+        :return: None
+        """
+        self._lookup.must(RESULTS_LOCATOR[0], RESULTS_LOCATOR[1], self._long_delay)
+
+    def poll_once(self, iteration):
+        """
+        poll_once - reloads the results and opens the campgrounds that show openings
+        :param iteration: the current refresh try
+        :return: int: 1 if in checkout, 0 otherwise
+        """
+        iteration_start = monotonic()
+        traced = super(RegionRecGov, self).begin_trace(iteration)
+        super(RegionRecGov, self).load_page()
+        self._waits.until("RegionRecGov.poll_once()",
+                          ws.all_of(ws.element_present(RESULTS_LOCATOR), ws.network_settled()))
+        results = self._driver.execute_script(SCAN_SCRIPT)
+        super(RegionRecGov, self).end_trace(iteration, traced)
+
+        openings = [result for result in results if result["available"]]
+        self.campgrounds_scanned += len(results)
+        self._events.poll(RecGov.format_location_string(self._location),
+                          "#" + str(iteration) + " " + str(len(openings)) + " of " + str(len(results))
+                          + " campground(s) show openings")
+
+        result = 0
+        for opening in openings:
+            last = self._handed_off.get(opening["href"])
+            if last is not None and monotonic() - last < RegionRecGov.HANDOFF_COOLDOWN:
+                continue
+            self._handed_off[opening["href"]] = monotonic()
+            if self._hand_off(opening, iteration) == 1:
+                result = 1
+                break
+
+        super(RegionRecGov, self).record_iteration(iteration, iteration_start)
+        return result
+
+    def _hand_off(self, opening, iteration):
+        """
+        _hand_off - opens the campground in a new tab and books a site open on both dates
+        with the campground flow, the tab is closed again if it does not reach checkout
+        :param opening: the scan result of the campground
+        :param iteration: the current refresh try
+        :return: int: 1 if in checkout, 0 otherwise
+        """
+        location_str = RecGov.format_location_string(self._location)
+        scan_handle = self._driver.current_window_handle
+        handles = set(self._driver.window_handles)
+        self._driver.execute_script("window.open('about:blank', '_blank');")
+        self._driver.switch_to.window([handle for handle in self._driver.window_handles
+                                       if handle not in handles][0])
+        self.campgrounds_opened += 1
+
+        result = 0
+        try:
+            super(RegionRecGov, self).load_page(UrlBuilder.with_query(
+                opening["href"], UrlBuilder.campground_query(self._region_details)))
+            self._lookup.must(By.CLASS_NAME, "rec-availability-date", self._long_delay)
+            site = self._driver.execute_script(
+                SITE_SCRIPT, DateHandler.datetime_to_short_text(self._region_details['dates'][0]).lower(),
+                DateHandler.datetime_to_short_text(self._region_details['dates'][1]).lower())
+
+            if site is None:
+                self._events.info(location_str, opening["name"] + " shows openings but no site is open on "
+                                                                  "both dates")
+            else:
+                self._events.info(location_str, opening["name"] + " site " + site + " is open, booking it")
+                campground = CampRecGov(self._driver, self._preferences,
+                                        self._search + ":" + opening["name"] + ":" + site, self._region_details)
+                campground.set_location_link(opening["href"])
+                campground.set_hit_handler(self._hit_handler)
+                # Logged in already, locate and configure reopen the campground from its link
+                campground.recover()
+                result = campground.poll_once(iteration)
+
+        except Exception:
+            self._events.error(location_str, "RegionRecGov._hand_off() failed for " + opening["name"])
+
+        if result != 1:
+            self._driver.close()
+            self._driver.switch_to.window(scan_handle)
+        return result
+
+    def iteration_summary(self):
+        return super(RegionRecGov, self).iteration_summary() + ", " + str(self.campgrounds_scanned) \
+               + " campground result(s) scanned, " + str(self.campgrounds_opened) + " opened"
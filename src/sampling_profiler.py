@@ -0,0 +1,228 @@
+"""
+This module provides the on demand sampling profiler of the worker processes. Each worker
+installs a SIGUSR1 handler, the first signal starts sampling the Python stacks of the worker
+and the next one stops it and writes the samples as collapsed stacks, one file per process
+named after the locations it polls, which flamegraph.pl and speedscope read as they are.
+
+    python3 -m src.sampling_profiler <overseer pid>
+
+sends the signal to every worker of a running overseer.
+"""
+
+import argparse
+import signal
+import sys
+import threading
+from os import getpid, kill, makedirs, path, readlink
+from re import sub
+from time import monotonic, sleep, strftime, localtime
+
+import src.event_bus as eb
+from src.process_stats import child_pids
+
+# Seconds between samples, 200 a second keeps the overhead around a percent
+SAMPLE_INTERVAL = 0.005
+# Seconds between checks for the toggle while not sampling
+IDLE_INTERVAL = 0.1
+# Frames kept per stack, counted from the thread's entry point
+MAX_DEPTH = 128
+
+# The profiler of this worker process, None until install
+_profiler = None
+
+
+def frame_name(frame):
+    return path.basename(frame.f_code.co_filename) + ":" + frame.f_code.co_name
+
+
+class SamplingProfiler:
+    """ This class samples the stacks of every other thread of the process from a background thread. """
+
+    def __init__(self, directory="stacks", interval=SAMPLE_INTERVAL):
+        """
+        __init__ - constructor
+        :param directory: where the collapsed stack files are written
+        :param interval: seconds between samples
+        """
+        self._directory = directory
+        self._interval = interval
+        self._label = "worker"
+        self._stacks = dict()
+        self._samples = 0
+        self._started = None
+        # Set by the signal handler, which only flips it, the thread does the rest outside the handler
+        self._wanted = False
+        self._sampling = False
+        self._thread = None
+
+    def set_label(self, location_str):
+        """
+        set_label - names the files after the locations the worker polls
+        :param location_str: the formatted location string(s)
+        :return: None
+        """
+        self._label = location_str
+
+    def start(self):
+        """
+        start - starts the thread that waits for the toggle and samples while it is on
+        :return: None
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def toggle(self):
+        """
+        toggle - turns sampling on, or off with the stacks written, safe to call from a signal handler
+        :return: None
+        """
+        self._wanted = not self._wanted
+
+    def finish(self, timeout=5.0):
+        """
+        finish - turns sampling off and waits for the stacks to be written
+        :param timeout: most seconds to wait
+        :return: bool: True if it was sampling
+        """
+        wanted = self._wanted
+        self._wanted = False
+        waited = monotonic()
+        while self._sampling and monotonic() - waited < timeout:
+            sleep(IDLE_INTERVAL)
+        return wanted
+
+    def _sample(self):
+        names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            frames = list()
+            while frame is not None:
+                frames.append(frame_name(frame))
+                frame = frame.f_back
+            stack = ";".join([names.get(ident, "thread")] + frames[::-1][:MAX_DEPTH])
+            self._stacks[stack] = self._stacks.get(stack, 0) + 1
+        self._samples += 1
+
+    def _run(self):
+        while True:
+            # The bus is only asked for on a toggle, the worker configures it after the profiler is installed
+            if self._wanted and not self._sampling:
+                self._stacks = dict()
+                self._samples = 0
+                self._started = monotonic()
+                self._sampling = True
+                eb.get_event_bus().info(self._label, "profiler sampling every " + "%.0f" % (self._interval * 1000)
+                                        + "ms in pid " + str(getpid()))
+            elif not self._wanted and self._sampling:
+                try:
+                    stacks_file = self.write()
+                    eb.get_event_bus().info(self._label, "profiler stopped after "
+                                            + "%.1f" % (monotonic() - self._started) + "s, " + str(self._samples)
+                                            + " sample(s)" + (", collapsed stacks written to " + stacks_file
+                                                              if stacks_file else ""))
+                except Exception:
+                    eb.get_event_bus().error(self._label, "SamplingProfiler.write() failed")
+                self._sampling = False
+
+            if not self._sampling:
+                sleep(IDLE_INTERVAL)
+                continue
+            started = monotonic()
+            self._sample()
+            sleep(max(self._interval - (monotonic() - started), 0))
+
+    def write(self):
+        """
+        write - writes the samples as collapsed stacks, one line per stack with its count
+        :return: str: the file written, None if nothing was sampled
+        """
+        if len(self._stacks) == 0:
+            return None
+        makedirs(self._directory, exist_ok=True)
+        name = sub("[^A-Za-z0-9]+", "_", self._label).strip("_")[:60]
+        stacks_file = path.join(self._directory, name + "_" + str(getpid()) + "_"
+                                + strftime("%Y%m%d_%H%M%S", localtime()) + ".collapsed")
+        with open(stacks_file, "w") as collapsed:
+            for stack, count in sorted(self._stacks.items()):
+                collapsed.write(stack + " " + str(count) + "\n")
+        return stacks_file
+
+
+def handle_toggle(signum, frame):
+    if _profiler is not None:
+        _profiler.toggle()
+
+
+def install(directory="stacks"):
+    """
+    install - sets up the profiler of this worker process and its SIGUSR1 handler
+    :param directory: where the collapsed stack files are written
+    :return: None
+    """
+    global _profiler
+    _profiler = SamplingProfiler(directory)
+    _profiler.start()
+    # No SIGUSR1 on windows, the profiler can not be reached there
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, handle_toggle)
+
+
+def set_label(location_str):
+    """
+    set_label - names the profile of this worker after the locations it polls
+    :param location_str: the formatted location string(s)
+    :return: None
+    """
+    if _profiler is not None:
+        _profiler.set_label(location_str)
+
+
+def finish():
+    """
+    finish - writes the stacks of a profiler still running when the worker is done with its locations,
+    pool workers exit without running atexit, a worker given more locations samples on into a new file
+    :return: None
+    """
+    if _profiler is not None and _profiler.finish():
+        _profiler.toggle()
+
+
+def worker_pids(overseer_pid):
+    """
+    worker_pids - the pool workers of an overseer, its children running the same interpreter, which
+    leaves out a shared chromedriver the signal would end
+    :param overseer_pid: the overseer process id
+    :return: list: the worker process ids
+    """
+    try:
+        executable = readlink(path.join("/proc", str(overseer_pid), "exe"))
+    except OSError:
+        return list()
+    workers = list()
+    for pid in child_pids(overseer_pid):
+        try:
+            if readlink(path.join("/proc", str(pid), "exe")) == executable:
+                workers.append(pid)
+        except OSError:
+            continue
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Turns the sampling profiler of every worker of an overseer on or off")
+    parser.add_argument("pid", type=int, help="process id of the overseer")
+    arguments = parser.parse_args()
+
+    workers = worker_pids(arguments.pid)
+    if len(workers) == 0:
+        print("No workers found for " + str(arguments.pid))
+        return
+    for pid in workers:
+        kill(pid, signal.SIGUSR1)
+    print("Toggled the profiler of " + str(len(workers)) + " worker(s): " + ", ".join(str(pid) for pid in workers))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+This module provides the scale simulator. It runs the real Overseer against synthetic
+locations served by the local fixture site and measures how the bot holds up as the
+number of locations grows.
+"""
+
+import json
+import multiprocessing as mp
+from datetime import date, datetime, timedelta
+from os import makedirs, path
+from time import time, sleep
+
+import src.process_stats as ps
+from src.fixture_site import FixtureSite, FixtureState
+
+
+class SimulationSettings:
+    """ This class holds the options of a simulation run. """
+
+    def __init__(self, sizes, duration=120, setup_seconds=60, inject_every=10, overrides=None,
+                 label="default", directory="simulations"):
+        """
+        __init__ - constructor
+        :param sizes: the numbers of locations to simulate, one run each
+        :param duration: seconds of polling measured per run
+        :param setup_seconds: most seconds to wait for every location to reach its grid
+        :param inject_every: seconds between injected openings
+        :param overrides: dict of preferences.txt keys to values, e.g. tabs_per_browser
+        :param label: name of the configuration, used in the results file name
+        :param directory: where the generated inputs and the results are written
+        """
+        self.sizes = sizes
+        self.duration = duration
+        self.setup_seconds = setup_seconds
+        self.inject_every = inject_every
+        self.overrides = overrides if overrides is not None else dict()
+        self.label = label
+        self.directory = directory
+
+
+def run_overseer(prefs):
+    """
+    run_overseer - process target running the real bot on the generated preferences
+    :param prefs: path to the generated preferences file
+    :return: None
+    """
+    # Imported here so the fixture site can be used without selenium installed
+    import src.overseer as overwatch
+    overwatch.Overseer(prefs).start()
+
+
+class ScaleSimulator:
+    """ This class generates synthetic locations, runs the bot on them and records the results. """
+
+    def __init__(self, settings):
+        """
+        __init__ - constructor
+        :param settings: the SimulationSettings
+        """
+        self._settings = settings
+        self._run_name = settings.label + "_" + datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._run_directory = path.join(settings.directory, self._run_name)
+        # Far enough out that the dates are never in the past
+        self._start_date = date.today() + timedelta(days=30)
+        self._end_date = self._start_date + timedelta(days=2)
+
+    def _generate(self, size):
+        """
+        _generate - creates the fixture facilities and the locations files for a run,
+        half campsites and half permit entry points, each on its own facility
+        :param size: the number of locations
+        :return: (FixtureState, list of location keys, camping generated, permits generated)
+        """
+        state = FixtureState()
+        keys = list()
+        camping = list()
+        permits = list()
+
+        for index in range(size):
+            if index % 2 == 0:
+                name = "Sim Camp " + str(index).zfill(3)
+                state.add_campground(1000 + index, "Sim Park", name, ["001"])
+                camping.append("Sim Park - " + name + " - 1")
+                keys.append("camp:" + str(1000 + index) + ":001")
+            else:
+                name = "Sim Permit " + str(index).zfill(3)
+                entry_point = "EP" + str(index).zfill(3)
+                state.add_permit(2000 + index, name, [entry_point])
+                permits.append(name + " - " + entry_point)
+                keys.append("permit:" + str(2000 + index) + ":" + entry_point)
+
+        size_directory = path.join(self._run_directory, "n" + str(size))
+        makedirs(size_directory, exist_ok=True)
+        with open(path.join(size_directory, "camping_locations.txt"), "w") as camping_file:
+            camping_file.write("Park - Location - Campsites\n" + "\n".join(camping) + "\n\nDetails:\n"
+                               + "dates - " + self._start_date.strftime("%m/%d/%Y") + ","
+                               + self._end_date.strftime("%m/%d/%Y") + "\nsite_type -\nallowed_equipment -\n")
+        with open(path.join(size_directory, "permit_locations.txt"), "w") as permit_file:
+            permit_file.write("Location - Entry Point ID or Name:\n" + "\n".join(permits) + "\n\nDetails:\n"
+                              + "dates - " + self._start_date.strftime("%m/%d/%Y")
+                              + "\npermit_type - overnight\ncommercial_trip - No\n")
+
+        return state, keys, len(camping) > 0, len(permits) > 0
+
+    def _write_preferences(self, size, url, has_camping, has_permits):
+        """
+        _write_preferences - writes the preferences for a run, polling until the run ends
+        :param size: the number of locations
+        :param url: the fixture site url
+        :param has_camping: a camping locations file was generated
+        :param has_permits: a permit locations file was generated
+        :return: str: path to the preferences file
+        """
+        size_directory = path.join(self._run_directory, "n" + str(size))
+        now = datetime.now()
+        end = now + timedelta(seconds=self._settings.setup_seconds + self._settings.duration)
+        preferences = [("login", "False"), ("url", url), ("wait_duration", "1"), ("long_delay", "10"),
+                       ("guests", "2"), ("time_start", now.strftime("%H:%M:%S") + "-" + end.strftime("%H:%M:%S")),
+                       ("driver_registry", path.join(size_directory, "driver_registry.json")),
+                       ("facility_index", path.join(size_directory, "facility_index.json")),
+                       ("log_file", path.join(size_directory, "logs", "recgov.log"))]
+        if has_camping:
+            preferences.append(("camping_locations", path.join(size_directory, "camping_locations.txt")))
+        if has_permits:
+            preferences.append(("permit_locations", path.join(size_directory, "permit_locations.txt")))
+        preferences.extend(self._settings.overrides.items())
+
+        prefs = path.join(size_directory, "preferences.txt")
+        with open(prefs, "w") as prefs_file:
+            prefs_file.write("".join(key + ", " + str(value) + "\n" for key, value in preferences))
+        return prefs
+
+    def _inject(self, state, key):
+        """
+        _inject - opens the generated dates for a location
+        :param state: the FixtureState
+        :param key: the location key
+        :return: None
+        """
+        kind, facility_id, item = key.split(":", 2)
+        if kind == "camp":
+            state.open_campsite(facility_id, item, self._start_date, self._end_date)
+        else:
+            state.open_permit(facility_id, item, self._start_date, 4)
+
+    def setup(self, size):
+        """
+        setup - generates the locations, starts the fixture site and writes the preferences for it
+        :param size: the number of locations
+        :return: (started FixtureSite, list of location keys, path to the preferences file)
+        """
+        state, keys, has_camping, has_permits = self._generate(size)
+        site = FixtureSite(state).start()
+        return site, keys, self._write_preferences(size, site.url, has_camping, has_permits)
+
+    def run_size(self, size):
+        """
+        run_size - runs the bot on size synthetic locations and measures it
+        :param size: the number of locations
+        :return: dict: the measurements
+        """
+        site, keys, prefs = self.setup(size)
+        state = site.state
+
+        overseer = mp.Process(target=run_overseer, args=(prefs,), name="simulated-overseer")
+        overseer.start()
+        rss_samples = list()
+
+        # Setup, every location logs in, navigates and prepares its grid
+        setup_started = time()
+        while time() - setup_started < self._settings.setup_seconds and overseer.is_alive():
+            if all(key in state.stats()["polls"] for key in keys):
+                break
+            rss_samples.append(ps.process_tree_rss(overseer.pid))
+            sleep(1)
+        setup_seconds = time() - setup_started
+
+        # Measured window, openings are injected in turn across the locations
+        polls_before = state.stats()["polls"]
+        cpu_before = ps.process_tree_cpu_seconds(overseer.pid)
+        window_started = time()
+        next_injection = window_started
+        injected = 0
+        while time() - window_started < self._settings.duration and overseer.is_alive():
+            if time() >= next_injection:
+                self._inject(state, keys[injected % len(keys)])
+                injected += 1
+                next_injection += self._settings.inject_every
+            rss_samples.append(ps.process_tree_rss(overseer.pid))
+            sleep(1)
+        window_seconds = time() - window_started
+        cpu_seconds = ps.process_tree_cpu_seconds(overseer.pid) - cpu_before
+        stats = state.stats()
+
+        overseer.terminate()
+        overseer.join(30)
+        site.stop()
+
+        rates = [(stats["polls"].get(key, 0) - polls_before.get(key, 0)) / window_seconds for key in keys]
+        detections = [opening["detected"] - opening["opened"] for opening in stats["openings"]
+                      if opening["detected"] is not None]
+        result = {"locations": size, "setup_seconds": round(setup_seconds, 1),
+                  "window_seconds": round(window_seconds, 1),
+                  "polls_per_second_per_location": round(sum(rates) / len(rates), 3),
+                  "slowest_location_polls_per_second": round(min(rates), 3),
+                  "locations_never_polled": len([key for key in keys if key not in stats["polls"]]),
+                  "cpu_cores": round(cpu_seconds / window_seconds, 2),
+                  "rss_mb_mean": round(sum(rss_samples) / max(len(rss_samples), 1) / 1048576.0, 1),
+                  "rss_mb_peak": round(max(rss_samples + [0]) / 1048576.0, 1),
+                  "openings": len(stats["openings"]), "detected": len(detections),
+                  "detect_seconds_mean": round(sum(detections) / len(detections), 2) if detections else None,
+                  "detect_seconds_max": round(max(detections), 2) if detections else None}
+        print("Simulated " + str(size) + " location(s): " + json.dumps(result))
+        return result
+
+    def run(self):
+        """
+        run - runs every size in turn and saves the results for comparison with other configurations
+        :return: str: path to the results file
+        """
+        results = [self.run_size(size) for size in self._settings.sizes]
+        results_file = path.join(self._settings.directory, self._run_name + ".json")
+        with open(results_file, "w") as results_output:
+            json.dump({"label": self._settings.label, "overrides": self._settings.overrides,
+                       "duration": self._settings.duration, "inject_every": self._settings.inject_every,
+                       "results": results}, results_output, indent=2)
+        print("Results written to " + results_file)
+        return results_file
@@ -0,0 +1,149 @@
+"""
+This module provides the multi-tab worker, several locations polled from the tabs
+of a single browser instead of one browser per location.
+"""
+
+from time import sleep
+
+from src.recgov import RecGov
+import src.process_stats as ps
+
+
+class TabWorker:
+    """ This class polls one location per tab, switching between the tabs in turn. """
+
+    def __init__(self, driver, preferences, merged_locations, factory, events):
+        """
+        __init__ - constructor
+        :param driver: the chrome driver shared by every tab
+        :param preferences: the preferences to be used during execution
+        :param merged_locations: list of [location, rec_type] to open a tab for
+        :param factory: callable(driver, merged_location_type) returning the RecGov for a location
+        :param events: the event bus
+        """
+        self._driver = driver
+        self._preferences = preferences
+        self._merged_locations = merged_locations
+        self._factory = factory
+        self._events = events
+        # [window handle, RecGov, formatted location, retries]
+        self._tabs = list()
+        self._finished = list()
+        self._location_str = ", ".join(RecGov.format_location_string(merged_location_type[0])
+                                       for merged_location_type in merged_locations)
+
+    def _open_tab(self):
+        """
+        _open_tab - opens a blank tab and switches to it
+        :return: str: the window handle of the new tab
+        """
+        handles = set(self._driver.window_handles)
+        self._driver.execute_script("window.open('about:blank', '_blank');")
+        handle = [new_handle for new_handle in self._driver.window_handles if new_handle not in handles][0]
+        self._driver.switch_to.window(handle)
+        return handle
+
+    def _close_tab(self, tab):
+        """
+        _close_tab - isolates a broken tab by closing it, its siblings keep polling
+        :param tab: the tab entry to close
+        :return: None
+        """
+        if tab in self._tabs:
+            self._tabs.remove(tab)
+            self._finished.append(tab[1])
+        try:
+            if len(self._driver.window_handles) > 1:
+                self._driver.switch_to.window(tab[0])
+                self._driver.close()
+        except Exception:
+            self._events.error(tab[2], "TabWorker._close_tab() failed")
+
+    def open_tabs(self):
+        """
+        open_tabs - opens a tab per location and prepares its availability grid,
+        a location that fails to prepare is closed without affecting the others
+        :return: None
+        """
+        logged_in = False
+        for index, merged_location_type in enumerate(self._merged_locations):
+            location_str = RecGov.format_location_string(merged_location_type[0])
+            handle = self._driver.current_window_handle if index == 0 else self._open_tab()
+            rec_gov = self._factory(self._driver, merged_location_type)
+            if rec_gov is None:
+                self._close_tab([handle, None, location_str, 0])
+                continue
+
+            tab = [handle, rec_gov, location_str, 0]
+            try:
+                # Tabs share cookies, only the first one logs in
+                rec_gov.prepare(login=not logged_in)
+                logged_in = logged_in or self._preferences.login
+                self._tabs.append(tab)
+                self._events.info(location_str, "tab ready")
+            except Exception:
+                self._events.error(location_str, "TabWorker.open_tabs() failed to prepare tab")
+                self._tabs.append(tab)
+                self._close_tab(tab)
+
+    def run(self):
+        """
+        run - refreshes and evaluates each tab in turn until one books or all are done
+        :return: bool: True if a tab reached checkout, the browser is left open for the user
+        """
+        if len(self._tabs) == 0:
+            return False
+
+        self._tabs[0][1].wait()
+        while len(self._tabs) > 0:
+            # Seconds until the next tab idling outside its predicted windows is due
+            idle = None
+            for tab in list(self._tabs):
+                handle, rec_gov, location_str, retries = tab
+                if not rec_gov.keep_polling(retries):
+                    self._events.info(None, rec_gov.stop_message(retries))
+                    self._tabs.remove(tab)
+                    self._finished.append(rec_gov)
+                    continue
+
+                delay = rec_gov.poll_delay()
+                if delay > 0:
+                    idle = delay if idle is None else min(idle, delay)
+                    continue
+                idle = 0
+
+                try:
+                    self._driver.switch_to.window(handle)
+                    result = rec_gov.poll_once(retries + 1)
+                except Exception:
+                    # The failed iteration counts as a try, so a tab that keeps failing still runs out
+                    tab[3] = retries + 1
+                    self._events.error(location_str, "TabWorker.run() tab failed, recovering it")
+                    try:
+                        rec_gov.recover()
+                    except Exception:
+                        self._events.error(location_str, "TabWorker.run() tab could not recover, closing it")
+                        self._close_tab(tab)
+                    continue
+
+                tab[3] = retries + 1
+                if result == 1:
+                    # Leave the user on the checkout tab
+                    self.report()
+                    return True
+
+            if idle is not None and idle > 0:
+                sleep(min(idle, 1.0))
+
+        self.report()
+        return False
+
+    def report(self):
+        """
+        report - publishes the memory and poll rate per location of this browser
+        :return: None
+        """
+        rec_govs = [tab[1] for tab in self._tabs] + [rec_gov for rec_gov in self._finished if rec_gov is not None]
+        for rec_gov in rec_govs:
+            rec_gov.flush_schedule()
+        ps.report_browser_usage(self._events, self._location_str, self._driver, rec_govs)
@@ -0,0 +1,168 @@
+"""
+This module provides the multi-tenant mode. Several preference sets are loaded into one
+overseer, the planned locations of every tenant are merged into watches and each watch, one
+availability source, is polled once. A hit is fanned out to every other tenant watching the
+source, each booking in its own browser with its own credentials, guests and login.
+"""
+
+import copy
+import threading
+from collections import namedtuple
+from math import ceil
+from os import path
+from time import monotonic
+
+import src.preferences_handler as ph
+
+# One loaded preference set
+Tenant = namedtuple("Tenant", ["name", "preferences"])
+
+# One availability source for the workers, indexed like a PlannedLocation, tenants are the
+# indexes of the tenants watching it, the one polling it first
+Watch = namedtuple("Watch", ["location", "rec_type", "link", "tenants"])
+
+# Poll iterations a fanned out booking session tries, the watch just saw the source open
+FAN_OUT_TRIES = 5
+# Seconds before the same watch fans out again, a not logged in watch keeps finding the same hit
+FAN_OUT_COOLDOWN = 120
+
+
+def load_tenants(prefs_files):
+    """
+    load_tenants - parses every preference set, named after its file
+    :param prefs_files: list of preference file paths, the first one also holds the run settings
+    :return: list: the Tenants
+    """
+    tenants = list()
+    names = set()
+    for prefs in prefs_files:
+        name = path.splitext(path.basename(prefs))[0]
+        if name in names:
+            name += "_" + str(len(tenants) + 1)
+        names.add(name)
+        tenants.append(Tenant(name, ph.PreferencesHandler(prefs)))
+    return tenants
+
+
+def source_key(planned, preferences):
+    """
+    source_key - what makes two planned locations the same availability source, the location,
+    site and the details the grid is filtered by, guests and credentials only matter when booking
+    :param planned: the PlannedLocation
+    :param preferences: the preferences of the tenant
+    :return: tuple: the key
+    """
+    details = {"Camping": preferences.camping_details, "Permits": preferences.permit_details,
+               "Region": preferences.region_details}.get(planned.rec_type) or dict()
+    return (planned.rec_type, planned.location.strip().lower(), preferences.url,
+            tuple(sorted((key, repr(value)) for key, value in details.items())))
+
+
+def compile_watches(tenants, plans):
+    """
+    compile_watches - merges the run plans of the tenants into watches
+    :param tenants: the Tenants
+    :param plans: the RunPlan of each tenant, in the same order
+    :return: tuple: the Watches, in the order their sources were first planned
+    """
+    watches = dict()
+    for index, plan in enumerate(plans):
+        for planned in plan.locations:
+            key = source_key(planned, tenants[index].preferences)
+            if key not in watches:
+                watches[key] = [planned, list()]
+            elif watches[key][0].link is None and planned.link is not None:
+                watches[key][0] = planned
+            watches[key][1].append(index)
+
+    compiled = list()
+    for planned, watching in watches.values():
+        # The tenant with the fewest guests polls, a cell open for them is the first hit any tenant can book
+        watching = sorted(watching, key=lambda index: tenants[index].preferences.guests)
+        compiled.append(Watch(planned.location, planned.rec_type, planned.link, tuple(watching)))
+    return tuple(compiled)
+
+
+def booking_preferences(preferences):
+    """
+    booking_preferences - the preferences of a fanned out booking session, a few tries starting now
+    :param preferences: the preferences of the tenant
+    :return: the copied preferences
+    """
+    booking = copy.deepcopy(preferences)
+    booking.time_start = None
+    booking.time_end = None
+    booking.num_refreshes = FAN_OUT_TRIES
+    booking.poll_schedule = None
+    return booking
+
+
+def savings(plans, watches, results, tabs_per_browser):
+    """
+    savings - the browsers and poll requests the merged watches saved
+    :param plans: the RunPlan of each tenant
+    :param watches: the Watches that ran
+    :param results: the (watch location, rec type, iterations, tenants fanned out to) reported by the workers
+    :param tabs_per_browser: locations per browser
+    :return: (drivers without merging per tenant, drivers started per tenant, poll requests saved)
+    """
+    separate = [int(ceil(len(plan.locations) / float(tabs_per_browser))) for plan in plans]
+    # A browser only holds the watches of one polling tenant, see Overseer.start
+    polling = [0] * len(plans)
+    for watch in watches:
+        polling[watch.tenants[0]] += 1
+    merged = [int(ceil(count / float(tabs_per_browser))) for count in polling]
+    watching = dict(((watch.location, watch.rec_type), len(watch.tenants)) for watch in watches)
+    saved = 0
+    for location, rec_type, iterations, fanned_out in results:
+        # A fanned out booking session is a browser of the tenant it books for
+        for tenant in fanned_out:
+            merged[tenant] += 1
+        # Every other tenant would have reloaded the same grid as often
+        saved += iterations * (watching.get((location, rec_type), 1) - 1)
+    return separate, merged, saved
+
+
+class FanOut:
+    """ This class starts the booking sessions of the other tenants when a watch sees a hit. """
+
+    def __init__(self, book):
+        """
+        __init__ - constructor
+        :param book: callable(watch, tenant index) running one booking session, True if it reached checkout
+        """
+        self._book = book
+        self._threads = list()
+        self._last = dict()
+        self._lock = threading.Lock()
+        # (location, rec_type) -> the tenants a booking session was started for, once per session
+        self.sessions = dict()
+
+    def trigger(self, watch):
+        """
+        trigger - starts a booking session for every tenant after the first, the watch keeps polling meanwhile
+        :param watch: the Watch that saw the hit
+        :return: int: the sessions started
+        """
+        with self._lock:
+            key = (watch.location, watch.rec_type)
+            if key in self._last and monotonic() - self._last[key] < FAN_OUT_COOLDOWN:
+                return 0
+            self._last[key] = monotonic()
+            started = 0
+            for tenant in watch.tenants[1:]:
+                thread = threading.Thread(target=self._book, args=(watch, tenant), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+                self.sessions.setdefault(key, list()).append(tenant)
+                started += 1
+            return started
+
+    def join(self):
+        """
+        join - waits for the booking sessions, a pool worker that returns would end them
+        :return: None
+        """
+        for thread in self._threads:
+            thread.join()
+        self._threads = list()
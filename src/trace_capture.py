@@ -0,0 +1,159 @@
+"""
+This module provides the DevTools trace capture used by the --trace mode. Chromedriver's
+performance log carries the trace and network events, the Performance domain the metrics.
+"""
+
+import json
+from os import makedirs, path
+from re import sub
+
+from src.recgov import RecGov
+
+# Timeline, script and layout categories, enough for the trace viewer to show where the time went
+TRACE_CATEGORIES = "devtools.timeline,v8.execute,blink.user_timing,disabled-by-default-devtools.timeline"
+
+
+class TraceSettings:
+    """ This class holds the --trace options, which locations to trace and how often. """
+
+    def __init__(self, locations=None, directory="traces", every=10, max_iterations=20):
+        """
+        __init__ - constructor
+        :param locations: location substrings to trace, an empty list traces every location
+        :param directory: where the trace files and summaries are written
+        :param every: trace one iteration out of every this many
+        :param max_iterations: stop tracing a location after this many traced iterations
+        """
+        self.locations = locations if locations is not None else list()
+        self.directory = directory
+        self.every = max(every, 1)
+        self.max_iterations = max_iterations
+
+    def matches(self, location):
+        """
+        matches - checks if the location was selected for tracing
+        :param location: the location string
+        :return: bool: True if the location is traced
+        """
+        if len(self.locations) == 0:
+            return True
+        location_str = RecGov.format_location_string(location).lower()
+        return any(selected.lower() in location_str for selected in self.locations)
+
+    @staticmethod
+    def add_capabilities(options, capabilities):
+        """
+        add_capabilities - turns on chromedriver's performance log with network and trace events
+        :param options: the ChromeOptions of the driver
+        :param capabilities: the desired capabilities dict of the driver
+        :return: None
+        """
+        options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False,
+                                                             "traceCategories": TRACE_CATEGORIES})
+        capabilities["goog:loggingPrefs"] = {"performance": "ALL"}
+
+
+class TraceCapture:
+    """ This class records a trace and a summary around sampled poll iterations. """
+
+    def __init__(self, driver, location, settings, events):
+        """
+        __init__ - constructor
+        :param driver: the chrome driver, started with TraceSettings.add_capabilities
+        :param location: the location string being traced
+        :param settings: the TraceSettings
+        :param events: the event bus
+        """
+        self._driver = driver
+        self._location_str = RecGov.format_location_string(location)
+        self._settings = settings
+        self._events = events
+        self._traced = 0
+        self._metrics = None
+        self._file_prefix = path.join(settings.directory, sub("[^A-Za-z0-9]+", "_", self._location_str).strip("_"))
+        makedirs(settings.directory, exist_ok=True)
+
+    def _performance_metrics(self):
+        """
+        _performance_metrics - reads the DevTools Performance domain counters
+        :return: dict: metric name to value
+        """
+        metrics = self._driver.execute_cdp_cmd("Performance.getMetrics", {})
+        return {metric["name"]: metric["value"] for metric in metrics["metrics"]}
+
+    def finished(self):
+        """
+        finished - checks if the location traced its max_iterations
+        :return: bool: True if nothing more is traced
+        """
+        return self._traced >= self._settings.max_iterations
+
+    def detach(self):
+        """
+        detach - stops the network events and metrics feeding the performance log once tracing is done,
+        chromedriver can not turn the log off, nothing reads it from here on
+        :return: None
+        """
+        self._driver.execute_cdp_cmd("Network.disable", {})
+        self._driver.execute_cdp_cmd("Performance.disable", {})
+        self._driver.get_log("performance")
+        self._events.info(self._location_str, "Traced " + str(self._traced) + " iteration(s), tracing stopped")
+
+    def begin(self, iteration):
+        """
+        begin - starts a traced window if this iteration is sampled
+        :param iteration: the current refresh try
+        :return: bool: True if the iteration is traced and end must be called
+        """
+        if self.finished():
+            return False
+        if iteration % self._settings.every != 0:
+            # Keep the log from growing between sampled iterations
+            self._driver.get_log("performance")
+            return False
+
+        self._driver.execute_cdp_cmd("Performance.enable", {})
+        self._driver.get_log("performance")
+        self._metrics = self._performance_metrics()
+        return True
+
+    def end(self, iteration):
+        """
+        end - writes the trace file and the summary of the traced window
+        :param iteration: the current refresh try
+        :return: dict: the summary
+        """
+        metrics = self._performance_metrics()
+        trace_events = list()
+        requests = 0
+        received_bytes = 0
+
+        for entry in self._driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            if message["method"] == "Tracing.dataCollected":
+                trace_events.extend(message["params"]["value"])
+            elif message["method"] == "Network.requestWillBeSent":
+                requests += 1
+            elif message["method"] == "Network.loadingFinished":
+                received_bytes += int(message["params"].get("encodedDataLength", 0))
+
+        trace_file = self._file_prefix + "_" + str(iteration) + ".json"
+        with open(trace_file, "w") as trace_output:
+            json.dump({"traceEvents": trace_events}, trace_output)
+
+        summary = {"location": self._location_str, "iteration": iteration,
+                   "js_heap_used": metrics.get("JSHeapUsedSize", 0),
+                   "layout_count": metrics.get("LayoutCount", 0) - self._metrics.get("LayoutCount", 0),
+                   "script_seconds": metrics.get("ScriptDuration", 0) - self._metrics.get("ScriptDuration", 0),
+                   "layout_seconds": metrics.get("LayoutDuration", 0) - self._metrics.get("LayoutDuration", 0),
+                   "requests": requests, "bytes": received_bytes, "trace_file": trace_file}
+        with open(self._file_prefix + "_summary.jsonl", "a") as summary_output:
+            summary_output.write(json.dumps(summary) + "\n")
+
+        self._traced += 1
+        self._events.timing(self._location_str,
+                            "#" + str(iteration) + " trace: heap " + "%.1f" % (summary["js_heap_used"] / 1048576.0)
+                            + " MB, " + str(summary["layout_count"]) + " layouts, script "
+                            + "%.3f" % summary["script_seconds"] + "s, " + str(requests) + " requests, "
+                            + str(received_bytes) + " bytes")
+        return summary
@@ -0,0 +1,98 @@
+"""
+This module provides the deep link builder that encodes the reservation details
+into the availability page url, so one page load lands on a configured view.
+"""
+
+from urllib.parse import urlencode, urlsplit, urlunsplit
+
+
+class UrlBuilder:
+    """ This class builds the query strings for the campground and permit availability pages. """
+
+    # Query parameter names the site reads its availability state from.
+    # Anything the site ignores is picked up by the UI fallback in the flows.
+    CAMPGROUND_START_DATE = "startDate"
+    CAMPGROUND_END_DATE = "endDate"
+    CAMPGROUND_SITE_TYPES = "siteTypes"
+    CAMPGROUND_EQUIPMENT = "equipment"
+    PERMIT_DATE = "date"
+    PERMIT_TYPE = "type"
+    PERMIT_GROUP_SIZE = "groupSize"
+    SEARCH_QUERY = "q"
+    SEARCH_START_DATE = "start_date"
+    SEARCH_END_DATE = "end_date"
+    SEARCH_ENTITY_TYPE = "entity_type"
+
+    @staticmethod
+    def date_to_param(date_to_format):
+        """
+        date_to_param - formats a date the way the site encodes it in urls
+        :param date_to_format: the date to format
+        :return: str: YYYY-MM-DD
+        """
+        return date_to_format.strftime("%Y-%m-%d")
+
+    @staticmethod
+    def with_query(link, params):
+        """
+        with_query - replaces the query string of the link
+        :param link: the page link
+        :param params: list of (name, value) pairs, empty values are skipped
+        :return: str: the link with the query string
+        """
+        params = [(name, value) for name, value in params if value]
+        scheme, netloc, link_path, _, fragment = urlsplit(link)
+        return urlunsplit((scheme, netloc, link_path, urlencode(params), fragment))
+
+    @staticmethod
+    def campground_query(camping_details):
+        """
+        campground_query - builds the campground availability parameters
+        :param camping_details: the camping details from the locations file
+        :return: list: (name, value) pairs
+        """
+        params = list()
+        if camping_details['dates'] is not None:
+            params.append((UrlBuilder.CAMPGROUND_START_DATE,
+                           UrlBuilder.date_to_param(camping_details['dates'][0])))
+            params.append((UrlBuilder.CAMPGROUND_END_DATE,
+                           UrlBuilder.date_to_param(camping_details['dates'][1])))
+        if len(camping_details.get('site_type', [])) > 0:
+            params.append((UrlBuilder.CAMPGROUND_SITE_TYPES, ",".join(camping_details['site_type']).lower()))
+        if len(camping_details.get('allowed_equipment', [])) > 0:
+            params.append((UrlBuilder.CAMPGROUND_EQUIPMENT,
+                           ",".join(camping_details['allowed_equipment']).lower()))
+
+        return params
+
+    @staticmethod
+    def search_query(search, camping_details):
+        """
+        search_query - builds the search results parameters, the dates make the results show availability
+        :param search: the search text, e.g. Yosemite
+        :param camping_details: the details from the region locations file
+        :return: list: (name, value) pairs
+        """
+        params = [(UrlBuilder.SEARCH_QUERY, search), (UrlBuilder.SEARCH_ENTITY_TYPE, "campground")]
+        if camping_details['dates'] is not None:
+            params.append((UrlBuilder.SEARCH_START_DATE, UrlBuilder.date_to_param(camping_details['dates'][0])))
+            params.append((UrlBuilder.SEARCH_END_DATE, UrlBuilder.date_to_param(camping_details['dates'][1])))
+
+        return params
+
+    @staticmethod
+    def permit_query(permit_details, guests):
+        """
+        permit_query - builds the permit detailed availability parameters
+        :param permit_details: the permit details from the locations file
+        :param guests: the group size
+        :return: list: (name, value) pairs
+        """
+        params = list()
+        if permit_details['dates'] is not None:
+            params.append((UrlBuilder.PERMIT_DATE, UrlBuilder.date_to_param(permit_details['dates'][0])))
+        if len(permit_details.get('permit_type', [])) > 0:
+            params.append((UrlBuilder.PERMIT_TYPE, ",".join(permit_details['permit_type']).lower()))
+        params.append((UrlBuilder.PERMIT_GROUP_SIZE, str(guests)))
+
+        return params
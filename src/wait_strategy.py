@@ -0,0 +1,127 @@
+"""
+This module provides condition based waits that replace the fixed sleeps in the flows.
+Each wait ends as soon as the page is ready and gives up at a ceiling.
+"""
+
+from time import time
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as ec
+from selenium.common.exceptions import TimeoutException
+
+
+def element_present(locator):
+    """
+    element_present - ready once the element is in the DOM
+    :param locator: (By, value) tuple of the element
+    :return: condition callable
+    """
+    return ec.presence_of_element_located(locator)
+
+
+def element_clickable(locator):
+    """
+    element_clickable - ready once the element is visible and enabled
+    :param locator: (By, value) tuple of the element
+    :return: condition callable
+    """
+    return ec.element_to_be_clickable(locator)
+
+
+def element_gone(locator):
+    """
+    element_gone - ready once the element is removed or hidden
+    :param locator: (By, value) tuple of the element
+    :return: condition callable
+    """
+    return ec.invisibility_of_element_located(locator)
+
+
+def element_stale(element):
+    """
+    element_stale - ready once an element grabbed before an action is detached, i.e. re-rendered
+    :param element: the WebElement grabbed before the action, None is always ready
+    :return: condition callable
+    """
+    if element is None:
+        return lambda driver: True
+    return ec.staleness_of(element)
+
+
+def network_settled(quiet_period=0.3):
+    """
+    network_settled - ready once the document is loaded and no new resource
+    requests have started for quiet_period seconds
+    :param quiet_period: seconds without a new request
+    :return: condition callable
+    """
+    state = {"count": -1, "since": time()}
+
+    def condition(driver):
+        count = driver.execute_script("return document.readyState === 'complete' ? "
+                                      "performance.getEntriesByType('resource').length : -1")
+        if count < 0 or count != state["count"]:
+            state["count"] = count
+            state["since"] = time()
+            return False
+        return time() - state["since"] >= quiet_period
+
+    return condition
+
+
+def all_of(*conditions):
+    """
+    all_of - ready once every condition is ready
+    :param conditions: the conditions to combine
+    :return: condition callable
+    """
+    def condition(driver):
+        for sub_condition in conditions:
+            if not sub_condition(driver):
+                return False
+        return True
+
+    return condition
+
+
+class WaitStrategy:
+    """ This class runs readiness conditions and records the time saved against the fixed sleep. """
+
+    def __init__(self, driver, fixed_duration, ceiling, location_str, events, poll_frequency=0.1):
+        """
+        __init__ - constructor
+        :param driver: the chrome driver to wait on
+        :param fixed_duration: the sleep the conditions replace, used to report the time saved
+        :param ceiling: the most a wait will take before moving on as the old sleep did
+        :param location_str: formatted location for the timing events
+        :param events: the event bus the timings are published to
+        :param poll_frequency: seconds between condition checks
+        """
+        self._driver = driver
+        self._fixed_duration = fixed_duration
+        self._ceiling = ceiling
+        self._location_str = location_str
+        self._events = events
+        self._poll_frequency = poll_frequency
+        self.total_saved = 0.0
+
+    def until(self, name, condition):
+        """
+        until - waits for the condition, falling through at the ceiling
+        :param name: the name of the replaced sleep for the timing event
+        :param condition: the readiness condition
+        :return: bool: True if the condition was met, False if the ceiling was hit
+        """
+        start = time()
+        met = True
+        try:
+            WebDriverWait(self._driver, self._ceiling, self._poll_frequency).until(condition)
+        except TimeoutException:
+            met = False
+
+        elapsed = time() - start
+        saved = self._fixed_duration - elapsed
+        self.total_saved += saved
+        self._events.timing(self._location_str,
+                            name + ": " + ("ready" if met else "ceiling") + " after " + "%.2f" % elapsed
+                            + "s, saved " + "%.2f" % saved + "s, total saved " + "%.2f" % self.total_saved + "s")
+        return met
@@ -0,0 +1,67 @@
+"""
+Checks the permit payload parsers against the recorded payloads in fixtures/permit_api.
+
+    python3 -m unittest discover tests
+"""
+
+import json
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from os import listdir, path
+
+import src.permit_api as pa
+
+FIXTURES = path.join(path.dirname(path.dirname(path.abspath(__file__))), "fixtures", "permit_api")
+
+PARSERS = {"content_": pa.parse_divisions, "month_": pa.parse_month_availability,
+           "inyo_": pa.parse_inyo_availability}
+
+
+def _payloads():
+    """
+    _payloads - the recorded payloads with their parser
+    :return: list of (file name, parser)
+    """
+    payloads = list()
+    for name in sorted(listdir(FIXTURES)):
+        if not name.endswith(".json") or name.endswith(".expected.json"):
+            continue
+        for prefix, parser in PARSERS.items():
+            if name.startswith(prefix):
+                payloads.append((name, parser))
+    return payloads
+
+
+def _load(name):
+    with open(path.join(FIXTURES, name), "r") as json_file:
+        return json.load(json_file)
+
+
+class PermitPayloadTest(unittest.TestCase):
+
+    def test_every_kind_has_a_payload(self):
+        kinds = set(name.split("_")[0] + "_" for name, parser in _payloads())
+        self.assertEqual(set(PARSERS), kinds)
+
+    def test_payloads_decode_to_expected_records(self):
+        for name, parser in _payloads():
+            with self.subTest(payload=name):
+                expected = _load(name[:-len(".json")] + ".expected.json")
+                if isinstance(expected, list):
+                    expected = sorted(expected, key=lambda record: (record["entry_point"], record["date"]))
+                self.assertEqual(expected, pa.comparable(parser(_load(name))))
+
+    def test_payload_without_payload_object(self):
+        for name, parser in PARSERS.items():
+            with self.subTest(parser=name):
+                with self.assertRaises(pa.PayloadFormatException):
+                    parser({"error": "not found"})
+
+    def test_check_passes_on_fixtures(self):
+        with redirect_stdout(StringIO()):
+            self.assertTrue(pa.check(FIXTURES))
+
+
+if __name__ == '__main__':
+    unittest.main()